@@ -25,6 +25,8 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        eval_workers=8,
+        background_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -43,6 +45,8 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            eval_workers,
+            background_eval,
         )
 
         self.name = "A2C"
@@ -96,12 +100,6 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
         terminateds,
         truncateds,
     ):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         value = jax.vmap(self.critic, in_axes=(None, None, 0))(
@@ -114,7 +112,7 @@ class A2C(Actor_Critic_Policy_Gradient_Family):
             key,
             jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, nxtobses),
         )
-        targets = jax.vmap(discount_with_terminated, in_axes=(0, 0, 0, 0, None))(
+        targets = jax.vmap(discount_with_terminated, in_axes=(1, 1, 1, 1, None), out_axes=1)(
             rewards, terminateds, truncateds, next_value, self.gamma
         )
         obses = [jnp.vstack(o) for o in obses]
@@ -1,5 +1,6 @@
 import os
 from collections import deque
+from copy import copy, deepcopy
 
 import gymnasium as gym
 import jax
@@ -10,6 +11,8 @@ from tqdm.auto import trange
 
 from jax_baselines.common.cpprb_buffers import EpochBuffer
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import BackgroundEvaluator, Evaluator
+from jax_baselines.common.jax_envs import JaxVectorizedEnv
 from jax_baselines.common.logger import TensorboardLogger
 from jax_baselines.common.utils import (
     convert_jax,
@@ -21,6 +24,11 @@ from jax_baselines.common.utils import (
 
 
 class Actor_Critic_Policy_Gradient_Family(object):
+    # policy state copied into the snapshots evaluated by background_eval
+    eval_state = ("params",)
+    # names of the metrics returned by _train_step after params and opt_state
+    train_metrics = ("loss/critic_loss", "loss/actor_loss", "loss/entropy_loss", "loss/mean_target")
+
     def __init__(
         self,
         env_builder,
@@ -39,12 +47,16 @@ class Actor_Critic_Policy_Gradient_Family(object):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        eval_workers=8,
+        background_eval=False,
     ):
         self.name = "Actor_Critic_Policy_Gradient_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.background_evaluator = BackgroundEvaluator() if background_eval else None
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
@@ -63,6 +75,7 @@ class Actor_Critic_Policy_Gradient_Family(object):
         self.optimizer = select_optimizer(optimizer, self.learning_rate)
 
         self.get_env_setup()
+        self._learn_jax_env = jax.jit(self._learn_jax_env, static_argnums=(4,))
 
     def save_params(self, path):
         save(path, self.params)
@@ -81,6 +94,14 @@ class Actor_Critic_Policy_Gradient_Family(object):
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
         self.eval_env = self.env_builder(1)
+        # the other eval envs are built on the first evaluation
+        self.evaluator = Evaluator(
+            [self.eval_env],
+            self.eval_eps,
+            lambda: self.env_builder(1),
+            self.eval_workers,
+            self.seed,
+        )
 
         print("----------------------env------------------------")
         if isinstance(self.env, VectorizedEnv):
@@ -97,6 +118,10 @@ class Actor_Critic_Policy_Gradient_Family(object):
                 self.conv_action = lambda a: np.clip(a, -3.0, 3.0) / 3.0
             self.worker_size = self.env.worker_num
             self.env_type = "VectorizedEnv"
+            if getattr(self.env, "async_workers", 0) > 0:
+                raise ValueError("on-policy rollouts need every worker to be stepped together")
+            if isinstance(self.env, JaxVectorizedEnv):
+                self.env_type = "JaxEnv"
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
             print("Single environmet")
@@ -157,6 +182,14 @@ class Actor_Critic_Policy_Gradient_Family(object):
         mu, std = self._get_actions(self.params, obs)
         return np.random.normal(mu, std)
 
+    def _sample_actions(self, params, obses, key):
+        """Sample the actions of a batch inside a jitted function."""
+        if self.action_type == "discrete":
+            prob = self._get_actions(params, obses)
+            return jax.random.categorical(key, jnp.log(prob), axis=1)[:, None]
+        mu, std = self._get_actions(params, obses)
+        return mu + std * jax.random.normal(key, mu.shape)
+
     def get_logprob_discrete(self, prob, action, key, out_prob=False):
         prob = jnp.clip(jax.nn.softmax(prob), 1e-5, 1.0)
         action = action.astype(jnp.int32)
@@ -218,8 +251,12 @@ class Actor_Critic_Policy_Gradient_Family(object):
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
                 self.learn_VectorizedEnv(pbar, callback, log_interval)
+            if self.env_type == "JaxEnv":
+                self.learn_JaxEnv(pbar, callback, log_interval)
 
-            self.eval(total_timesteps)
+            if self.background_evaluator is not None:
+                self.background_evaluator.join()
+            self.run_eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
 
@@ -261,13 +298,24 @@ class Actor_Critic_Policy_Gradient_Family(object):
 
             (
                 next_obses,
+                final_obses,
+                done_idx,
                 rewards,
                 terminateds,
                 truncateds,
                 infos,
             ) = self.env.get_result()
 
-            self.buffer.add([obs], actions, rewards, [next_obses], terminateds, truncateds)
+            self.buffer.add(
+                [obs],
+                actions,
+                rewards,
+                [next_obses],
+                terminateds,
+                truncateds,
+                final_obs=[final_obses],
+                done_idx=done_idx,
+            )
 
             if (steps + self.worker_size) % (
                 self.batch_size * self.worker_size
@@ -281,62 +329,126 @@ class Actor_Critic_Policy_Gradient_Family(object):
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
-    def eval(self, steps):
-        original_rewards = []
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
+    def learn_JaxEnv(self, pbar, callback=None, log_interval=1000):
+        """Jitted learn loop of the JAX envs, the rollouts and updates between two evaluations
+        run as one compiled scan and python only logs and evaluates between the scans.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        total_updates = len(pbar.iterable) // self.batch_size
+        chunk = max(self.eval_freq // (self.batch_size * self.worker_size), 1)
+        env_state, obs = self.env.reset_fn(next(self.key_seq))
+        env_carry = (env_state, obs, jnp.zeros(self.worker_size))
+        steps = 0
+
+        for start in range(0, total_updates, chunk):
+            num_updates = min(chunk, total_updates - start)
+            (
+                self.params,
+                self.opt_state,
+                env_carry,
+                metrics,
+                (ep_rewards, ep_counts),
+            ) = self._learn_jax_env(
+                self.params, self.opt_state, env_carry, next(self.key_seq), num_updates
+            )
+            steps += num_updates * self.batch_size * self.worker_size
+            metrics = jax.device_get(metrics)
+            self.lossque.extend(metrics[0])
+            if self.logger_run:
+                for name, metric in zip(self.train_metrics, metrics):
+                    self.logger_run.log_metric(name, np.mean(metric), steps)
+                if np.sum(ep_counts) > 0:
+                    self.logger_run.log_metric(
+                        "env/train_episode_reward", np.sum(ep_rewards) / np.sum(ep_counts), steps
+                    )
 
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        have_original_reward = "original_reward" in info.keys()
-        have_lives = "lives" in info.keys()
-        if have_original_reward:
-            original_reward = info["original_reward"]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs)[0]
-                observation, reward, terminated, truncated, info = self.eval_env.step(
-                    self.conv_action(actions)
-                )
-                obs = [np.expand_dims(observation, axis=0)]
-                if have_original_reward:
-                    original_reward += info["original_reward"]
-                total_reward[ep] += reward
-                eplen += 1
-
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-            if have_original_reward:
-                if have_lives:
-                    if info["lives"] == 0:
-                        original_rewards.append(original_reward)
-                        original_reward = 0
-                else:
-                    original_rewards.append(original_reward)
-                    original_reward = 0
-
-            obs, info = self.eval_env.reset()
-            obs = [np.expand_dims(obs, axis=0)]
-            terminated = False
-            truncated = False
-            eplen = 0
+            pbar.update(num_updates * self.batch_size)
+            eval_result = self.eval(steps)
+            pbar.set_description(self.discription(eval_result))
+        pbar.close()
+
+    def _learn_jax_env(self, params, opt_state, env_carry, key, num_updates):
+        def rollout(carry, key):
+            params, env_state, obs, ep_rewards = carry
+            act_key, env_key = jax.random.split(key)
+            actions = self._sample_actions(params, [obs], act_key)
+            if self.action_type == "discrete":
+                env_actions = actions[:, 0]
+            else:
+                env_actions = jnp.clip(actions, -3.0, 3.0) / 3.0
+            env_state, reset_obs, next_obs, rewards, terminateds, truncateds = self.env.step_fn(
+                env_state, env_actions, env_key
+            )
+            dones = jnp.logical_or(terminateds, truncateds)
+            ep_rewards = ep_rewards + rewards
+            episodes = (jnp.sum(jnp.where(dones, ep_rewards, 0.0)), jnp.sum(dones))
+            ep_rewards = jnp.where(dones, 0.0, ep_rewards)
+            # same time major layout as the EpochBuffer
+            transition = {
+                "obses": [obs],
+                "actions": actions.astype(jnp.float32),
+                "rewards": rewards[:, None].astype(jnp.float32),
+                "nxtobses": [next_obs],
+                "terminateds": terminateds[:, None].astype(jnp.float32),
+                "truncateds": truncateds[:, None].astype(jnp.float32),
+            }
+            return (params, env_state, reset_obs, ep_rewards), (transition, episodes)
+
+        def update(carry, key):
+            params, opt_state, (env_state, obs, ep_rewards) = carry
+            rollout_key, train_key = jax.random.split(key)
+            (_, env_state, obs, ep_rewards), (data, episodes) = jax.lax.scan(
+                rollout,
+                (params, env_state, obs, ep_rewards),
+                jax.random.split(rollout_key, self.batch_size),
+            )
+            params, opt_state, *metrics = self._train_step(params, opt_state, train_key, **data)
+            episodes = jax.tree_util.tree_map(jnp.sum, episodes)
+            return (params, opt_state, (env_state, obs, ep_rewards)), (tuple(metrics), episodes)
+
+        (params, opt_state, env_carry), (metrics, episodes) = jax.lax.scan(
+            update, (params, opt_state, env_carry), jax.random.split(key, num_updates)
+        )
+        return params, opt_state, env_carry, metrics, episodes
+
+    def eval(self, steps):
+        """Evaluate the policy, with background_eval on a snapshot of it on the eval thread.
+
+        :return: (dict) the eval result, with background_eval the one of the last finished
+            evaluation, None before the first one
+        """
+        if self.background_evaluator is None:
+            return self.run_eval(steps)
+        return self.background_evaluator.submit(self.eval_snapshot().run_eval, steps)
+
+    def eval_snapshot(self):
+        """Shallow copy of the agent with its own copy of the eval_state attributes, so it can be
+        evaluated while this one keeps training.
+        """
+        snapshot = copy(self)
+        for attr in self.eval_state:
+            if hasattr(self, attr):
+                setattr(snapshot, attr, deepcopy(getattr(self, attr)))
+        snapshot.key_seq = key_gen(np.random.randint(0, 2**31 - 1))
+        return snapshot
+
+    def run_eval(self, steps):
+        result = self.evaluator.run(lambda obs: [self.conv_action(a) for a in self.actions(obs)])
+        original_rewards = result["original_rewards"]
+        have_original_reward = original_rewards is not None
 
         if have_original_reward:
             mean_original_score = np.mean(original_rewards)
-        mean_reward = np.mean(total_reward)
-        mean_ep_len = np.mean(total_ep_len)
+        mean_reward = np.mean(result["episode_reward"])
+        mean_ep_len = np.mean(result["episode_len"])
 
         if self.logger_run:
             if have_original_reward:
                 self.logger_run.log_metric("env/original_reward", mean_original_score, steps)
             self.logger_run.log_metric("env/episode_reward", mean_reward, steps)
             self.logger_run.log_metric("env/episode len", mean_ep_len, steps)
-            self.logger_run.log_metric("env/time over", np.mean(total_truncated), steps)
+            self.logger_run.log_metric("env/time over", np.mean(result["truncated"]), steps)
 
         if have_original_reward:
             eval_result = {
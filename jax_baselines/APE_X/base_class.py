@@ -1,6 +1,7 @@
 import multiprocessing as mp
 import time
 from collections import deque
+from functools import partial
 
 import gymnasium as gym
 import jax
@@ -15,7 +16,11 @@ from jax_baselines.common.base_classes import (
     save,
     select_optimizer,
 )
-from jax_baselines.common.cpprb_buffers import MultiPrioritizedReplayBuffer
+from jax_baselines.common.cpprb_buffers import (
+    MultiPrioritizedReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
+)
+from jax_baselines.common.evaluator import BackgroundEvaluator, Evaluator
 from jax_baselines.common.utils import key_gen
 
 
@@ -51,6 +56,10 @@ class Ape_X_Family(object):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        replay_shards=1,
+        eval_env_builder=None,
+        eval_eps=20,
+        eval_workers=8,
     ):
         self.workers = workers
         self.model_builder_maker = model_builder_maker
@@ -94,6 +103,10 @@ class Ape_X_Family(object):
         self.actor_builder = None
 
         self.compress_memory = compress_memory
+        self.replay_shards = replay_shards
+        self.eval_env_builder = eval_env_builder
+        self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
 
         self.get_env_setup()
         self.get_memory_setup()
@@ -123,17 +136,31 @@ class Ape_X_Family(object):
 
     def get_memory_setup(self):
         # self.m = mp.get_context().Manager()
-        self.replay_buffer = MultiPrioritizedReplayBuffer(
-            self.buffer_size,
-            self.observation_space,
-            self.prioritized_replay_alpha,
-            1,
-            self.n_step,
-            self.gamma,
-            self.m,
-            self.compress_memory,
-            self.prioritized_replay_eps,
-        )
+        if self.replay_shards > 1:
+            self.replay_buffer = ShardedPrioritizedReplayBuffer(
+                self.buffer_size,
+                self.observation_space,
+                self.prioritized_replay_alpha,
+                1,
+                self.n_step,
+                self.gamma,
+                self.m,
+                self.compress_memory,
+                self.prioritized_replay_eps,
+                num_shards=self.replay_shards,
+            )
+        else:
+            self.replay_buffer = MultiPrioritizedReplayBuffer(
+                self.buffer_size,
+                self.observation_space,
+                self.prioritized_replay_alpha,
+                1,
+                self.n_step,
+                self.gamma,
+                self.m,
+                self.compress_memory,
+                self.prioritized_replay_eps,
+            )
 
     def setup_model(self):
         pass
@@ -144,6 +171,35 @@ class Ape_X_Family(object):
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def get_eval_setup(self):
+        """Build the evaluator of the learner, run on a background thread so the training steps
+        do not wait for it. The greedy actions come from the actor of actor_builder.
+        """
+        builder = self.actor_builder()
+        self.eval_actor = jax.jit(partial(builder[1], self.model, self.preproc))
+        self.eval_key_seq = builder[-1]
+        # the eval envs are built on the first evaluation
+        self.evaluator = Evaluator(
+            [], self.eval_eps, lambda: self.eval_env_builder(1), self.eval_workers, self.seed
+        )
+        self.background_evaluator = BackgroundEvaluator()
+
+    def run_eval(self, params, steps):
+        result = self.evaluator.run(
+            lambda obs: np.asarray(self.eval_actor(params, obs, next(self.eval_key_seq))).reshape(
+                -1
+            )
+        )
+        log_dict = {
+            "eval/episode_reward": np.mean(result["episode_reward"]),
+            "eval/episode_len": np.mean(result["episode_len"]),
+            "eval/time_over": np.mean(result["truncated"]),
+        }
+        if result["original_rewards"] is not None:
+            log_dict["eval/original_reward"] = np.mean(result["original_rewards"])
+        self.logger_server.log_eval.remote(steps, log_dict)
+        return log_dict
+
     def discription(self):
         return "buffer len : {} loss : {:.3f} |".format(
             len(self.replay_buffer), np.mean(self.lossque)
@@ -171,6 +227,7 @@ class Ape_X_Family(object):
         self.update_eps = 1.0
 
         pbar = trange(total_trainstep, miniters=log_interval)
+        self.eval_freq = max(total_trainstep // 100, 1)
 
         self.logger_server = Logger_server.remote(self.log_dir, run_name)
 
@@ -213,7 +270,7 @@ class Ape_X_Family(object):
             jobs.append(
                 self.workers[idx].run.remote(
                     1000,
-                    self.replay_buffer.buffer_info(),
+                    self.replay_buffer.buffer_info(idx),
                     self.model_builder,
                     self.actor_builder,
                     param_server,
@@ -231,10 +288,13 @@ class Ape_X_Family(object):
             if stop.is_set():
                 print("Stop Training")
                 _, still_running = ray.wait(jobs, timeout=300)
+                self.replay_buffer.close()
                 self.m.shutdown()
                 return
 
         print("Start Training")
+        if self.eval_env_builder is not None:
+            self.get_eval_setup()
         self.lossque = deque(maxlen=10)
         for steps in pbar:
             if stop.is_set():
@@ -242,17 +302,25 @@ class Ape_X_Family(object):
                 break
             loss = self.train_step(steps, self.gradient_steps)
             self.lossque.append(loss)
+            if self.eval_env_builder is not None and steps % self.eval_freq == 0:
+                self.background_evaluator.submit(partial(self.run_eval, self.params), steps)
             if steps % log_interval == 0:
                 pbar.set_description(self.discription())
+                if self.replay_shards > 1:
+                    self.logger_server.log_trainer.remote(steps, self.replay_buffer.shard_stats())
             if steps % self.target_network_update_freq == 0:
                 cpu_param = jax.device_put(self.params, jax.devices("cpu")[0])
                 param_server.update_params.remote(cpu_param)
                 for u in update:
                     u.set()
+        if self.eval_env_builder is not None:
+            self.background_evaluator.join()
+            self.run_eval(self.params, steps)
         self.logger_server.last_update.remote()
         stop.set()
         _, still_running = ray.wait(jobs, timeout=300)
         time.sleep(1)
+        self.replay_buffer.close()
         self.m.shutdown()
 
 
@@ -311,6 +379,13 @@ class Logger_server(object):
             for key, value in log_dict.items():
                 summary.add_scalar(key, value, self.step)
 
+    def log_eval(self, step, log_dict):
+        # the evaluations finish after the trainer moved on, so they are logged at the step of
+        # their snapshot without moving the step of the worker logs
+        with self.writer as (summary, _):
+            for key, value in log_dict.items():
+                summary.add_scalar(key, value, step)
+
     def log_worker(self, log_dict, episode):
         if self.old_step != self.step:
             with self.writer as (summary, _):
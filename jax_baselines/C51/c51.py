@@ -46,6 +46,15 @@ class C51(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_replay=False,
+        memmap_dir=None,
+        frame_replay=False,
+        prefetch=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -80,6 +89,15 @@ class C51(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_replay,
+            memmap_dir,
+            frame_replay,
+            prefetch,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "C51"
@@ -141,35 +159,13 @@ class C51(Q_Network_Family):
 
     def train_step(self, steps, gradient_steps):
         # Sample a batch from the replay buffer
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
-            (
-                self.params,
-                self.target_params,
-                self.opt_state,
-                loss,
-                t_mean,
-                new_priorities,
-            ) = self._train_step(
-                self.params,
-                self.target_params,
-                self.opt_state,
-                self.train_steps_count,
-                next(self.key_seq) if self.param_noise else None,
-                **data
-            )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+        if self.device_replay:
+            loss, t_mean = self.device_train_step(gradient_steps)
+        else:
+            loss, t_mean = self.fused_train_step(gradient_steps)
 
         if self.logger_run and steps % self.log_interval == 0:
-            self.logger_run.log_metric("loss/qloss", loss, steps)
-            self.logger_run.log_metric("loss/targets", t_mean, steps)
+            self.log_metrics({"loss/qloss": loss, "loss/targets": t_mean}, steps)
 
         return loss
 
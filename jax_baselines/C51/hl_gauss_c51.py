@@ -145,36 +145,10 @@ class HL_GAUSS_C51(Q_Network_Family):
         )
 
     def train_step(self, steps, gradient_steps):
-        # Sample a batch from the replay buffer
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
-            (
-                self.params,
-                self.target_params,
-                self.opt_state,
-                loss,
-                t_mean,
-                new_priorities,
-            ) = self._train_step(
-                self.params,
-                self.target_params,
-                self.opt_state,
-                self.train_steps_count,
-                next(self.key_seq) if self.param_noise else None,
-                **data
-            )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+        loss, t_mean = self.fused_train_step(gradient_steps)
 
         if self.logger_run and steps % self.log_interval == 0:
-            self.logger_run.log_metric("loss/qloss", loss, steps)
-            self.logger_run.log_metric("loss/targets", t_mean, steps)
+            self.log_metrics({"loss/qloss": loss, "loss/targets": t_mean}, steps)
 
         return loss
 
@@ -1,5 +1,6 @@
 import os
 from collections import deque
+from copy import copy, deepcopy
 
 import gymnasium as gym
 import numpy as np
@@ -11,18 +12,21 @@ from jax_baselines.common.cpprb_buffers import (
     PrioritizedReplayBuffer,
     ReplayBuffer,
 )
+from jax_baselines.common.deferred_priorities import DeferredPrioritiesMixin
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import BackgroundEvaluator, Evaluator
 from jax_baselines.common.logger import TensorboardLogger
-from jax_baselines.common.utils import (
-    RunningMeanStd,
-    key_gen,
-    restore,
-    save,
-    select_optimizer,
-)
+from jax_baselines.common.memmap_buffers import MemmapReplayBuffer, PrioritizedMemmapReplayBuffer
+from jax_baselines.common.pipeline import LockedReplayBuffer, PipelineLearner
+from jax_baselines.common.prefetch_buffers import PrefetchReplayBuffer
+from jax_baselines.common.replay_snapshot import check_snapshot_support
+from jax_baselines.common.utils import RunningMeanStd, key_gen, restore, save, select_optimizer
+
 
+class Deteministic_Policy_Gradient_Family(DeferredPrioritiesMixin):
+    # policy state copied into the snapshots evaluated by background_eval
+    eval_state = ("policy_params", "noise", "obs_rms")
 
-class Deteministic_Policy_Gradient_Family(object):
     def __init__(
         self,
         env_builder: callable,
@@ -50,12 +54,26 @@ class Deteministic_Policy_Gradient_Family(object):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        memmap_dir=None,
+        prefetch=False,
+        deferred_priorities=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         self.name = "Deteministic_Policy_Gradient_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.background_evaluator = BackgroundEvaluator() if background_eval else None
+        self.replay_ratio = replay_ratio
+        self.replay_credit = 0.0
+        self.pipeline = pipeline
+        self.max_policy_lag = max_policy_lag
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
@@ -84,9 +102,24 @@ class Deteministic_Policy_Gradient_Family(object):
         self.target_params = None
         self.save_path = None
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-2 / self.batch_size)
+        self.memmap_dir = memmap_dir
+        self.prefetch = prefetch
+        self.deferred_priorities = deferred_priorities
+        self.pending_priorities = []
+        self.replay_snapshot_path = None
+        self.replay_snapshot_compress = False
+        self.replay_writer = None
 
         self.get_env_setup()
         self.get_memory_setup()
+        if self.pipeline and self.env_type != "VectorizedEnv":
+            raise ValueError("the pipelined mode needs a vectorized env")
+        if self.prefetch:
+            self.replay_buffer = PrefetchReplayBuffer(
+                self.replay_buffer, self.prioritized_replay, self.batch_size
+            )
+        elif self.pipeline:
+            self.replay_buffer = LockedReplayBuffer(self.replay_buffer)
 
         if self.simba:
             self.obs_rms = RunningMeanStd(shapes=self.observation_space, dtype=np.float64)
@@ -97,9 +130,52 @@ class Deteministic_Policy_Gradient_Family(object):
     def load_params(self, path):
         self.params = self.target_params = restore(path)
 
+    def save_replay(self, path, compress=False):
+        """Write a snapshot of the replay buffer to path on a background thread.
+
+        :return: (threading.Thread) the writer thread
+        """
+        return self.replay_buffer.save_replay(path, compress)
+
+    def load_replay(self, path):
+        """Restore the replay buffer from a snapshot, the restored transitions count toward
+        learning_starts so learn() trains from the first steps.
+        """
+        self.replay_buffer.load_replay(path)
+        self.learning_starts = max(self.learning_starts - len(self.replay_buffer), 0)
+
+    def set_replay_snapshot(self, path, compress=False):
+        """Resume from the replay snapshot at path if there is one, and rewrite it at every
+        evaluation of learn(), so a preempted run restarts with a warm buffer. Raises a
+        ValueError if the replay buffer can not be snapshotted.
+        """
+        check_snapshot_support(self.replay_buffer)
+        if os.path.isdir(path):
+            self.load_replay(path)
+        self.replay_snapshot_path = path
+        self.replay_snapshot_compress = compress
+
+    def snapshot_replay(self):
+        if self.replay_snapshot_path is None:
+            return
+        # a single writer at a time, the previous snapshot is finished before the next copy
+        if self.replay_writer is not None:
+            self.replay_writer.join()
+        self.replay_writer = self.save_replay(
+            self.replay_snapshot_path, self.replay_snapshot_compress
+        )
+
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
         self.eval_env = self.env_builder(1)
+        # the other eval envs are built on the first evaluation
+        self.evaluator = Evaluator(
+            [self.eval_env],
+            self.eval_eps,
+            lambda: self.env_builder(1),
+            self.eval_workers,
+            self.seed,
+        )
 
         print("----------------------env------------------------")
         if isinstance(self.env, VectorizedEnv):
@@ -109,6 +185,7 @@ class Deteministic_Policy_Gradient_Family(object):
             self.action_size = [env_info["action_space"].shape[0]]
             self.worker_size = self.env.worker_num
             self.env_type = "VectorizedEnv"
+            self.async_env = getattr(self.env, "async_workers", 0) > 0
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
             print("Single environmet")
@@ -118,6 +195,7 @@ class Deteministic_Policy_Gradient_Family(object):
             self.action_size = [action_space.shape[0]]
             self.worker_size = 1
             self.env_type = "SingleEnv"
+            self.async_env = False
 
         print("observation size : ", self.observation_space)
         print("action size : ", self.action_size)
@@ -125,6 +203,31 @@ class Deteministic_Policy_Gradient_Family(object):
         print("-------------------------------------------------")
 
     def get_memory_setup(self):
+        if self.memmap_dir is not None:
+            if self.prioritized_replay:
+                self.replay_buffer = PrioritizedMemmapReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    self.prioritized_replay_alpha,
+                    self.action_size,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.prioritized_replay_eps,
+                    self.memmap_dir,
+                )
+            else:
+                self.replay_buffer = MemmapReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    self.action_size,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.memmap_dir,
+                )
+            return
+
         if self.prioritized_replay:
             if self.n_step_method:
                 self.replay_buffer = PrioritizedNstepReplayBuffer(
@@ -172,6 +275,34 @@ class Deteministic_Policy_Gradient_Family(object):
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def updates_per_step(self, steps, num_steps):
+        """Number of gradient steps to run for the env steps [steps, steps + num_steps).
+
+        Without replay_ratio every env step past learning_starts runs gradient_steps updates on
+        the train_freq steps, with it the updates follow the collected env steps at
+        replay_ratio updates per env step, whatever the worker count.
+        """
+        if steps <= self.learning_starts:
+            return 0
+        if self.replay_ratio is None:
+            return num_steps * self.gradient_steps if steps % self.train_freq == 0 else 0
+        self.replay_credit += num_steps * self.replay_ratio
+        updates = int(self.replay_credit)
+        self.replay_credit -= updates
+        return updates
+
+    def train_log_step(self, steps, num_steps):
+        """The env step of [steps, steps + num_steps) that is a multiple of log_interval, so
+        the updates of a vectorized step are logged as often as the ones of single steps.
+        """
+        offset = -steps % self.log_interval
+        return steps + offset if offset < num_steps else steps
+
+    def log_prefetch(self, steps):
+        if self.logger_run:
+            for key, value in self.replay_buffer.stats().items():
+                self.logger_run.log_metric(key, value, steps)
+
     def actions(self, obs, steps):
         pass
 
@@ -210,11 +341,18 @@ class Deteministic_Policy_Gradient_Family(object):
             if self.env_type == "SingleEnv":
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
-                self.learn_VectorizedEnv(pbar, callback, log_interval)
+                if self.pipeline:
+                    self.learn_Pipelined(pbar, callback, log_interval)
+                else:
+                    self.learn_VectorizedEnv(pbar, callback, log_interval)
 
-            self.eval(total_timesteps)
+            if self.background_evaluator is not None:
+                self.background_evaluator.join()
+            self.run_eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
+            if self.replay_writer is not None:
+                self.replay_writer.join()
 
     def learn_SingleEnv(self, pbar, callback=None, log_interval=1000):
         obs, info = self.env.reset()
@@ -233,16 +371,21 @@ class Deteministic_Policy_Gradient_Family(object):
                 obs, info = self.env.reset()
                 obs = [np.expand_dims(obs, axis=0)]
 
-            if steps > self.learning_starts and steps % self.train_freq == 0:
-                loss = self.train_step(steps, self.gradient_steps)
+            updates = self.updates_per_step(steps, 1)
+            if updates > 0:
+                loss = self.train_step(steps, updates)
                 self.lossque.append(loss)
 
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
+                self.snapshot_replay()
 
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
+            if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                self.log_prefetch(steps)
+
     def learn_VectorizedEnv(self, pbar, callback=None, log_interval=1000):
         self.lossque = deque(maxlen=10)
         eval_result = None
@@ -252,61 +395,181 @@ class Deteministic_Policy_Gradient_Family(object):
             actions = self.actions([obs], steps)
             self.env.step(actions)
 
-            if steps > self.learning_starts and steps % self.train_freq == 0:
-                for idx in range(self.worker_size):
-                    loss = self.train_step(steps + idx, self.gradient_steps)
-                    self.lossque.append(loss)
+            # the updates of all the workers run as one fused call
+            updates = self.updates_per_step(steps, len(obs))
+            if updates > 0:
+                loss = self.train_step(self.train_log_step(steps, len(obs)), updates)
+                self.lossque.append(loss)
 
             (
                 next_obses,
+                final_obses,
+                done_idx,
                 rewards,
                 terminateds,
                 truncateds,
                 infos,
             ) = self.env.get_result()
 
-            self.replay_buffer.add([obs], actions, rewards, [next_obses], terminateds, truncateds)
+            if self.async_env:
+                # the returned transitions can come from envs stepped in earlier iterations
+                self.replay_buffer.add(
+                    [self.env.result_obs],
+                    self.env.result_actions,
+                    rewards,
+                    [next_obses],
+                    terminateds,
+                    truncateds,
+                    self.env.env_ids,
+                    final_obs=[final_obses],
+                    done_idx=done_idx,
+                )
+            else:
+                self.replay_buffer.add(
+                    [obs],
+                    actions,
+                    rewards,
+                    [next_obses],
+                    terminateds,
+                    truncateds,
+                    final_obs=[final_obses],
+                    done_idx=done_idx,
+                )
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
+                self.snapshot_replay()
 
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
-    def eval(self, steps):
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
+            if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                self.log_prefetch(steps)
+
+    def pipeline_learner(self):
+        """Start the learner thread of the pipelined mode. It trains at replay_ratio, or without
+        it at gradient_steps per train_freq env steps, replay_ratio * worker_size updates per
+        call, and publishes the eval_state attributes after every call.
+        """
+        replay_ratio = self.replay_ratio
+        if replay_ratio is None:
+            replay_ratio = self.gradient_steps / self.train_freq
+
+        def train(last_steps, steps, updates):
+            loss = self.train_step(self.train_log_step(last_steps, steps - last_steps), updates)
+            self.lossque.append(loss)
+
+        return PipelineLearner(
+            train,
+            lambda: {attr: getattr(self, attr) for attr in self.eval_state if hasattr(self, attr)},
+            replay_ratio,
+            self.learning_starts,
+            max(int(replay_ratio * self.worker_size), 1),
+            self.max_policy_lag,
+        )
+
+    def learn_Pipelined(self, pbar, callback=None, log_interval=1000):
+        """Pipelined learn loop, the main thread acts and fills the replay buffer while the
+        learner thread trains on it.
+
+        The actor is a shallow copy of the agent with its own key sequence, at every step it
+        takes the newest params published by the learner, at most max_policy_lag updates behind
+        the replay ratio.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        actor = copy(self)
+        actor.key_seq = key_gen(np.random.randint(0, 2**31 - 1))
+        learner = self.pipeline_learner()
+
+        try:
+            for steps in pbar:
+                policy_lag, params = learner.collected(steps)
+                for attr, value in params.items():
+                    setattr(actor, attr, value)
+                obs = self.env.current_obs()
+                actions = actor.actions([obs], steps)
+                self.env.step(actions)
+
+                (
+                    next_obses,
+                    final_obses,
+                    done_idx,
+                    rewards,
+                    terminateds,
+                    truncateds,
+                    infos,
+                ) = self.env.get_result()
+
+                if self.async_env:
+                    # the returned transitions can come from envs stepped in earlier iterations
+                    self.replay_buffer.add(
+                        [self.env.result_obs],
+                        self.env.result_actions,
+                        rewards,
+                        [next_obses],
+                        terminateds,
+                        truncateds,
+                        self.env.env_ids,
+                        final_obs=[final_obses],
+                        done_idx=done_idx,
+                    )
+                else:
+                    self.replay_buffer.add(
+                        [obs],
+                        actions,
+                        rewards,
+                        [next_obses],
+                        terminateds,
+                        truncateds,
+                        final_obs=[final_obses],
+                        done_idx=done_idx,
+                    )
+
+                if steps % self.eval_freq == 0:
+                    eval_result = actor.eval(steps)
+                    self.snapshot_replay()
+
+                if steps % log_interval == 0:
+                    if eval_result is not None and len(self.lossque) > 0:
+                        pbar.set_description(self.discription(eval_result))
+                    if self.logger_run:
+                        self.logger_run.log_metric("pipeline/policy_lag", policy_lag, steps)
+
+                if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                    self.log_prefetch(steps)
+        finally:
+            learner.close()
 
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs, steps)
-                observation, reward, terminated, truncated, info = self.eval_env.step(actions[0])
-                obs = [np.expand_dims(observation, axis=0)]
-                total_reward[ep] += reward
-                eplen += 1
-
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-
-            obs, info = self.eval_env.reset()
-            obs = [np.expand_dims(obs, axis=0)]
-            terminated = False
-            truncated = False
-            eplen = 0
-
-        mean_reward = np.mean(total_reward)
-        mean_ep_len = np.mean(total_ep_len)
+    def eval(self, steps):
+        """Evaluate the policy, with background_eval on a snapshot of it on the eval thread.
+
+        :return: (dict) the eval result, with background_eval the one of the last finished
+            evaluation, None before the first one
+        """
+        if self.background_evaluator is None:
+            return self.run_eval(steps)
+        return self.background_evaluator.submit(self.eval_snapshot().run_eval, steps)
+
+    def eval_snapshot(self):
+        """Shallow copy of the agent with its own copy of the eval_state attributes, so it can be
+        evaluated while this one keeps training.
+        """
+        snapshot = copy(self)
+        for attr in self.eval_state:
+            if hasattr(self, attr):
+                setattr(snapshot, attr, deepcopy(getattr(self, attr)))
+        snapshot.key_seq = key_gen(np.random.randint(0, 2**31 - 1))
+        return snapshot
+
+    def run_eval(self, steps):
+        result = self.evaluator.run(lambda obs: self.actions(obs, steps))
+        mean_reward = np.mean(result["episode_reward"])
+        mean_ep_len = np.mean(result["episode_len"])
 
         if self.logger_run:
             self.logger_run.log_metric("env/episode_reward", mean_reward, steps)
             self.logger_run.log_metric("env/episode len", mean_ep_len, steps)
-            self.logger_run.log_metric("env/time over", np.mean(total_truncated), steps)
+            self.logger_run.log_metric("env/time over", np.mean(result["truncated"]), steps)
         return {"mean_reward": mean_reward, "mean_ep_len": mean_ep_len}
 
     def test(self, episode=10, run_name=None):
@@ -42,6 +42,14 @@ class DDPG(Deteministic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        memmap_dir=None,
+        prefetch=False,
+        deferred_priorities=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -69,6 +77,14 @@ class DDPG(Deteministic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            memmap_dir,
+            prefetch,
+            deferred_priorities,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "DDPG"
@@ -127,12 +143,12 @@ class DDPG(Deteministic_Policy_Gradient_Family):
             self.epsilon = self.exploration.value(steps)
             actions = np.clip(
                 np.asarray(self._get_actions(self.policy_params, obs, None))
-                + self.noise() * self.epsilon,
+                + self.noise(self.env.env_ids if self.async_env else None) * self.epsilon,
                 -1,
                 1,
             )
         else:
-            actions = np.random.uniform(-1.0, 1.0, size=(self.worker_size, self.action_size[0]))
+            actions = np.random.uniform(-1.0, 1.0, size=(len(obs[0]), self.action_size[0]))
         return actions
 
     def test_action(self, obs):
@@ -146,6 +162,7 @@ class DDPG(Deteministic_Policy_Gradient_Family):
     def train_step(self, steps, gradient_steps):
         # Sample a batch from the replay buffer
         for _ in range(gradient_steps):
+            self.train_steps_count += 1
             if self.prioritized_replay:
                 data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
             else:
@@ -177,7 +194,8 @@ class DDPG(Deteministic_Policy_Gradient_Family):
             )
 
             if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+                self.update_priorities(data["indexes"], new_priorities)
+        self.flush_priorities()
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
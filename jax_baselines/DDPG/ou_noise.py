@@ -12,13 +12,16 @@ class OUNoise(object):
             0, self._sigma, size=(self.worker_size, self.action_size)
         )
 
-    def __call__(self) -> np.ndarray:
+    def __call__(self, worker=None) -> np.ndarray:
+        if worker is None:
+            worker = np.arange(self.worker_size)
+        noise_prev = self.noise_prev[worker]
         noise = (
-            self.noise_prev
-            - self._theta * self.noise_prev
-            + np.random.normal(0, self._sigma, size=(self.worker_size, self.action_size))
+            noise_prev
+            - self._theta * noise_prev
+            + np.random.normal(0, self._sigma, size=(len(worker), self.action_size))
         )
-        self.noise_prev = noise
+        self.noise_prev[worker] = noise
         return noise
 
     def reset(self, worker) -> None:
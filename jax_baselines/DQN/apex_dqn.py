@@ -42,6 +42,10 @@ class APE_X_DQN(Ape_X_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        replay_shards=1,
+        eval_env_builder=None,
+        eval_eps=20,
+        eval_workers=8,
     ):
         super().__init__(
             workers,
@@ -73,6 +77,10 @@ class APE_X_DQN(Ape_X_Family):
             seed,
             optimizer,
             compress_memory,
+            replay_shards,
+            eval_env_builder,
+            eval_eps,
+            eval_workers,
         )
 
         if _init_setup_model:
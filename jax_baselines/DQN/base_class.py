@@ -1,7 +1,10 @@
 import os
 from collections import deque
+from copy import copy, deepcopy
 
 import gymnasium as gym
+import jax
+import jax.numpy as jnp
 import numpy as np
 from tqdm.auto import trange
 
@@ -12,12 +15,23 @@ from jax_baselines.common.cpprb_buffers import (
     ReplayBuffer,
 )
 from jax_baselines.common.env_builer import VectorizedEnv
+from jax_baselines.common.evaluator import BackgroundEvaluator, Evaluator
+from jax_baselines.common.frame_buffers import FrameReplayBuffer, PrioritizedFrameReplayBuffer
+from jax_baselines.common.jax_buffers import DeviceReplayBuffer, PrioritizedDeviceReplayBuffer
+from jax_baselines.common.jax_envs import JaxVectorizedEnv
 from jax_baselines.common.logger import TensorboardLogger
+from jax_baselines.common.memmap_buffers import MemmapReplayBuffer, PrioritizedMemmapReplayBuffer
+from jax_baselines.common.pipeline import LockedReplayBuffer, PipelineLearner
+from jax_baselines.common.prefetch_buffers import PrefetchReplayBuffer
+from jax_baselines.common.replay_snapshot import check_snapshot_support
 from jax_baselines.common.schedules import ConstantSchedule, LinearSchedule
 from jax_baselines.common.utils import key_gen, restore, save, select_optimizer
 
 
 class Q_Network_Family(object):
+    # policy state copied into the snapshots evaluated by background_eval
+    eval_state = ("params",)
+
     def __init__(
         self,
         env_builder: callable,
@@ -52,16 +66,34 @@ class Q_Network_Family(object):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_replay=False,
+        memmap_dir=None,
+        frame_replay=False,
+        prefetch=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         self.name = "Q_Network_Family"
         self.env_builder = env_builder
         self.model_builder_maker = model_builder_maker
         self.num_workers = num_workers
         self.eval_eps = eval_eps
+        self.eval_workers = eval_workers
+        self.background_evaluator = BackgroundEvaluator() if background_eval else None
+        self.replay_ratio = replay_ratio
+        self.replay_credit = 0.0
+        self.pipeline = pipeline
+        self.max_policy_lag = max_policy_lag
         self.log_interval = log_interval
         self.policy_kwargs = policy_kwargs
         self.seed = 42 if seed is None else seed
         self.key_seq = key_gen(self.seed)
+        # keys of the jitted actions and train steps, carried from one call to the next
+        self.act_key = next(self.key_seq)
+        self.train_key = next(self.key_seq)
 
         self.param_noise = param_noise
         self.learning_starts = learning_starts
@@ -99,9 +131,26 @@ class Q_Network_Family(object):
         self.optimizer = select_optimizer(optimizer, self.learning_rate, 1e-2 / self.batch_size)
 
         self.compress_memory = compress_memory
+        self.device_replay = device_replay
+        self.memmap_dir = memmap_dir
+        self.frame_replay = frame_replay
+        self.prefetch = prefetch
+        self.replay_snapshot_path = None
+        self.replay_snapshot_compress = False
+        self.replay_writer = None
 
         self.get_env_setup()
         self.get_memory_setup()
+        if self.pipeline and (self.env_type != "VectorizedEnv" or self.device_replay):
+            raise ValueError("the pipelined mode needs a vectorized env and a host replay buffer")
+        if self.prefetch and not self.device_replay:
+            self.replay_buffer = PrefetchReplayBuffer(
+                self.replay_buffer, self.prioritized_replay, self.batch_size
+            )
+        elif self.pipeline:
+            self.replay_buffer = LockedReplayBuffer(self.replay_buffer)
+        self._fused_train_step = jax.jit(self._fused_train_step, static_argnums=(3,))
+        self._act = jax.jit(self._act)
 
     def save_params(self, path):
         save(path, self.params)
@@ -109,9 +158,52 @@ class Q_Network_Family(object):
     def load_params(self, path):
         self.params = self.target_params = restore(path)
 
+    def save_replay(self, path, compress=False):
+        """Write a snapshot of the replay buffer to path on a background thread.
+
+        :return: (threading.Thread) the writer thread
+        """
+        return self.replay_buffer.save_replay(path, compress)
+
+    def load_replay(self, path):
+        """Restore the replay buffer from a snapshot, the restored transitions count toward
+        learning_starts so learn() trains from the first steps.
+        """
+        self.replay_buffer.load_replay(path)
+        self.learning_starts = max(self.learning_starts - len(self.replay_buffer), 0)
+
+    def set_replay_snapshot(self, path, compress=False):
+        """Resume from the replay snapshot at path if there is one, and rewrite it at every
+        evaluation of learn(), so a preempted run restarts with a warm buffer. Raises a
+        ValueError if the replay buffer can not be snapshotted.
+        """
+        check_snapshot_support(self.replay_buffer)
+        if os.path.isdir(path):
+            self.load_replay(path)
+        self.replay_snapshot_path = path
+        self.replay_snapshot_compress = compress
+
+    def snapshot_replay(self):
+        if self.replay_snapshot_path is None:
+            return
+        # a single writer at a time, the previous snapshot is finished before the next copy
+        if self.replay_writer is not None:
+            self.replay_writer.join()
+        self.replay_writer = self.save_replay(
+            self.replay_snapshot_path, self.replay_snapshot_compress
+        )
+
     def get_env_setup(self):
         self.env = self.env_builder(self.num_workers)
         self.eval_env = self.env_builder(1)
+        # the other eval envs are built on the first evaluation
+        self.evaluator = Evaluator(
+            [self.eval_env],
+            self.eval_eps,
+            lambda: self.env_builder(1),
+            self.eval_workers,
+            self.seed,
+        )
 
         print("----------------------env------------------------")
         if isinstance(self.env, VectorizedEnv):
@@ -121,6 +213,13 @@ class Q_Network_Family(object):
             self.action_size = [env_info["action_space"].n]
             self.worker_size = self.env.worker_num
             self.env_type = "VectorizedEnv"
+            self.async_env = getattr(self.env, "async_workers", 0) > 0
+            if isinstance(self.env, JaxVectorizedEnv):
+                # transitions are written to the device buffer inside the jitted learn loop
+                if self.n_step_method:
+                    raise ValueError("n-step returns are not supported with the JAX envs")
+                self.env_type = "JaxEnv"
+                self.device_replay = True
 
         elif isinstance(self.env, gym.Env) or isinstance(self.env, gym.Wrapper):
             print("Single environmet")
@@ -130,6 +229,7 @@ class Q_Network_Family(object):
             self.action_size = [action_space.n]
             self.worker_size = 1
             self.env_type = "SingleEnv"
+            self.async_env = False
 
         print("observation size : ", self.observation_space)
         print("action size : ", self.action_size)
@@ -137,6 +237,81 @@ class Q_Network_Family(object):
         print("-------------------------------------------------")
 
     def get_memory_setup(self):
+        if self.device_replay:
+            if self.prioritized_replay:
+                self.replay_buffer = PrioritizedDeviceReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    self.prioritized_replay_alpha,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.prioritized_replay_eps,
+                )
+            else:
+                self.replay_buffer = DeviceReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                )
+            self._device_train_step = jax.jit(
+                self._device_train_step, static_argnums=(5,), donate_argnums=(1,)
+            )
+            self._jax_env_steps = jax.jit(self._jax_env_steps, donate_argnums=(1,))
+            return
+
+        if self.memmap_dir is not None:
+            if self.prioritized_replay:
+                self.replay_buffer = PrioritizedMemmapReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    self.prioritized_replay_alpha,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.prioritized_replay_eps,
+                    self.memmap_dir,
+                )
+            else:
+                self.replay_buffer = MemmapReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.memmap_dir,
+                )
+            return
+
+        if self.frame_replay:
+            if self.prioritized_replay:
+                self.replay_buffer = PrioritizedFrameReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    self.prioritized_replay_alpha,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                    self.prioritized_replay_eps,
+                )
+            else:
+                self.replay_buffer = FrameReplayBuffer(
+                    self.buffer_size,
+                    self.observation_space,
+                    1,
+                    self.worker_size,
+                    self.n_step,
+                    self.gamma,
+                )
+            return
+
         if self.prioritized_replay:
             if self.n_step_method:
                 self.replay_buffer = PrioritizedNstepReplayBuffer(
@@ -176,22 +351,250 @@ class Q_Network_Family(object):
     def setup_model(self):
         pass
 
+    def get_train_state(self):
+        return self.params, self.target_params, self.opt_state
+
+    def set_train_state(self, train_state):
+        self.params, self.target_params, self.opt_state = train_state
+
     def _train_step(self, steps):
         pass
 
+    def device_train_step(self, gradient_steps):
+        """Run gradient_steps updates sampled from the device replay buffer in one dispatch.
+
+        :return: (tuple) the metrics returned by _train_step for the last update
+        """
+        self.replay_buffer.flush()
+        train_state, self.replay_buffer.buffer_state, metrics = self._device_train_step(
+            self.get_train_state(),
+            self.replay_buffer.buffer_state,
+            len(self.replay_buffer),
+            self.train_steps_count,
+            next(self.key_seq),
+            gradient_steps,
+        )
+        self.set_train_state(train_state)
+        self.train_steps_count += gradient_steps
+        return metrics
+
+    def fused_train_step(self, gradient_steps):
+        """Run gradient_steps updates on one sample of gradient_steps batches in one dispatch.
+
+        The batches are drawn together from the host replay buffer, so with prioritized replay
+        they are all drawn with the priorities of before the updates, and the priorities of all
+        the updates are written together after them. The buffers return the rows of a sample in
+        index or priority order, so the rows are shuffled before they are split into batches.
+
+        :return: (tuple) the metrics returned by _train_step for the last update
+        """
+        if self.prioritized_replay:
+            data = self.replay_buffer.sample(
+                gradient_steps * self.batch_size, self.prioritized_replay_beta0
+            )
+        else:
+            data = self.replay_buffer.sample(gradient_steps * self.batch_size)
+        if gradient_steps > 1:
+            # every batch spans the whole buffer instead of a 1 / gradient_steps slice of it
+            order = np.random.permutation(gradient_steps * self.batch_size)
+            data = jax.tree_util.tree_map(lambda x: x[order], data)
+        indexes = data.pop("indexes", None)
+        train_state, metrics, new_priorities, self.train_key = self._fused_train_step(
+            self.get_train_state(),
+            self.train_steps_count,
+            self.train_key,
+            gradient_steps,
+            data,
+        )
+        self.set_train_state(train_state)
+        self.train_steps_count += gradient_steps
+        if self.prioritized_replay:
+            self.replay_buffer.update_priorities(indexes, new_priorities)
+        return metrics
+
+    def _fused_train_step(self, train_state, steps, key, gradient_steps, data):
+        state_len = len(train_state)
+        # [gradient_steps * batch_size, ...] -> [gradient_steps, batch_size, ...]
+        data = jax.tree_util.tree_map(
+            lambda x: jnp.reshape(x, (gradient_steps, -1, *jnp.shape(x)[1:])), data
+        )
+
+        def f(carry, x):
+            train_state, key = carry
+            step, batch = x
+            key, train_key = jax.random.split(key)
+            outputs = self._train_step(*train_state, step, train_key, **batch)
+            return (tuple(outputs[:state_len]), key), (tuple(outputs[state_len:-1]), outputs[-1])
+
+        (train_state, key), (metrics, new_priorities) = jax.lax.scan(
+            f, (tuple(train_state), key), (steps + 1 + jnp.arange(gradient_steps), data)
+        )
+        if self.prioritized_replay:
+            new_priorities = jnp.reshape(new_priorities, (-1, *new_priorities.shape[2:]))
+        return train_state, jax.tree_util.tree_map(lambda m: m[-1], metrics), new_priorities, key
+
+    def _device_train_step(self, train_state, buffer_state, buffer_len, steps, key, gradient_steps):
+        state_len = len(train_state)
+
+        def f(carry, step):
+            train_state, buffer_state, key = carry
+            key, sample_key, train_key = jax.random.split(key, 3)
+            data = self.replay_buffer.sample_fn(
+                buffer_state,
+                buffer_len,
+                sample_key,
+                self.batch_size,
+                self.prioritized_replay_beta0,
+            )
+            outputs = self._train_step(*train_state, step, train_key, **data)
+            train_state = tuple(outputs[:state_len])
+            if self.prioritized_replay:
+                buffer_state = self.replay_buffer.update_fn(
+                    buffer_state, data["indexes"], outputs[-1]
+                )
+            return (train_state, buffer_state, key), tuple(outputs[state_len:-1])
+
+        (train_state, buffer_state, _), metrics = jax.lax.scan(
+            f,
+            (tuple(train_state), buffer_state, key),
+            steps + 1 + jnp.arange(gradient_steps),
+        )
+        return train_state, buffer_state, jax.tree_util.tree_map(lambda m: m[-1], metrics)
+
+    def _jax_env_steps(self, train_state, buffer_state, loop_state, key, epsilons, train):
+        """Step the JAX envs, write the transitions to the device buffer and train, for every
+        step of epsilons in one scan.
+
+        :param loop_state: (tuple) buffer pointer, buffer length, train steps count, env state,
+            obs and the returns of the running episodes
+        :param epsilons: (jnp.ndarray) exploration epsilon of each step
+        :param train: (jnp.ndarray) whether to train at each step
+        :return: (tuple) train_state, buffer_state, loop_state and the per step metrics
+        """
+        gradient_steps = self.worker_size * self.gradient_steps
+
+        def train_fn(train_state, buffer_state, buffer_len, train_count, key):
+            return self._device_train_step(
+                train_state, buffer_state, buffer_len, train_count, key, gradient_steps
+            )
+
+        def f(carry, x):
+            train_state, buffer_state, loop_state = carry
+            ptr, stored, train_count, env_state, obs, ep_rewards = loop_state
+            epsilon, do_train, key = x
+            act_key, explore_key, random_key, env_key, train_key = jax.random.split(key, 5)
+            actions = jnp.where(
+                jax.random.uniform(explore_key, (self.worker_size, 1)) < epsilon,
+                jax.random.randint(random_key, (self.worker_size, 1), 0, self.action_size[0]),
+                self._get_actions(*self.act_params(train_state), [obs], act_key),
+            )
+            env_state, reset_obs, next_obs, rewards, terminateds, truncateds = self.env.step_fn(
+                env_state, actions[:, 0], env_key
+            )
+            transition = [obs, actions, rewards, next_obs, terminateds]
+            stage = dict(
+                (k, jnp.reshape(t, (self.worker_size, *v["shape"])).astype(v["dtype"]))
+                for (k, v), t in zip(self.replay_buffer.env_dict.items(), transition)
+            )
+            idxs = (ptr + jnp.arange(self.worker_size)) % self.replay_buffer.max_size
+            buffer_state = self.replay_buffer._write(buffer_state, stage, idxs)
+            ptr = (ptr + self.worker_size) % self.replay_buffer.max_size
+            stored = jnp.minimum(stored + self.worker_size, self.replay_buffer.max_size)
+
+            train_args = (train_state, buffer_state, stored, train_count, train_key)
+            zeros = jax.tree_util.tree_map(
+                lambda m: jnp.zeros(m.shape, m.dtype), jax.eval_shape(train_fn, *train_args)[2]
+            )
+            train_state, buffer_state, metrics = jax.lax.cond(
+                do_train,
+                train_fn,
+                lambda train_state, buffer_state, *_: (train_state, buffer_state, zeros),
+                *train_args,
+            )
+            train_count = train_count + jnp.where(do_train, gradient_steps, 0)
+
+            dones = jnp.logical_or(terminateds, truncateds)
+            ep_rewards = ep_rewards + rewards
+            episodes = (jnp.sum(jnp.where(dones, ep_rewards, 0.0)), jnp.sum(dones))
+            ep_rewards = jnp.where(dones, 0.0, ep_rewards)
+            loop_state = (ptr, stored, train_count, env_state, reset_obs, ep_rewards)
+            return (train_state, buffer_state, loop_state), (metrics, do_train, episodes)
+
+        keys = jax.random.split(key, epsilons.shape[0])
+        (train_state, buffer_state, loop_state), outputs = jax.lax.scan(
+            f, (train_state, buffer_state, loop_state), (epsilons, train, keys)
+        )
+        return train_state, buffer_state, loop_state, outputs
+
     def _get_actions(self, params, obses) -> np.ndarray:
         pass
 
+    def updates_per_step(self, steps, num_steps):
+        """Number of gradient steps to run for the env steps [steps, steps + num_steps).
+
+        Without replay_ratio every env step past learning_starts runs gradient_steps updates on
+        the train_freq steps, with it the updates follow the collected env steps at
+        replay_ratio updates per env step, whatever the worker count.
+        """
+        if steps <= self.learning_starts:
+            return 0
+        if self.replay_ratio is None:
+            return num_steps * self.gradient_steps if steps % self.train_freq == 0 else 0
+        self.replay_credit += num_steps * self.replay_ratio
+        updates = int(self.replay_credit)
+        self.replay_credit -= updates
+        return updates
+
+    def train_log_step(self, steps, num_steps):
+        """The env step of [steps, steps + num_steps) that is a multiple of log_interval, so
+        the updates of a vectorized step are logged as often as the ones of single steps.
+        """
+        offset = -steps % self.log_interval
+        return steps + offset if offset < num_steps else steps
+
+    def log_prefetch(self, steps):
+        if self.logger_run:
+            for key, value in self.replay_buffer.stats().items():
+                self.logger_run.log_metric(key, value, steps)
+
+    def act_params(self, train_state=None):
+        """Params given to _get_actions before the observations.
+
+        :param train_state: (tuple) train state to take them from, the one of get_train_state by
+            default
+        :return: (tuple) the params
+        """
+        train_state = self.get_train_state() if train_state is None else train_state
+        return (train_state[0],)
+
+    def _act(self, act_params, obses, key, epsilon):
+        """Epsilon greedy actions in one dispatch. The exploration of every observation and the
+        noise of param_noise are drawn from the carried key, so nothing is sampled on the host.
+
+        :return: (tuple) the actions [N, 1] and the key of the next call
+        """
+        key, act_key, explore_key = jax.random.split(key, 3)
+        # one draw gives both whether to explore and the random action
+        u = jax.random.uniform(explore_key, (obses[0].shape[0], 2))
+        random_actions = jnp.minimum(u[:, 1:] * self.action_size[0], self.action_size[0] - 1)
+        actions = jnp.where(
+            u[:, :1] < epsilon,
+            random_actions.astype(jnp.int32),
+            self._get_actions(*act_params, obses, act_key),
+        )
+        return actions, key
+
     def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.params, obs, next(self.key_seq) if self.param_noise else None
-                )
-            )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+        actions, self.act_key = self._act(self.act_params(), obs, self.act_key, epsilon)
+        return np.asarray(actions)
+
+    def log_metrics(self, metrics, steps):
+        """Log the device metrics of a train step with a single device to host copy.
+
+        :param metrics: (dict) metric names and device scalars
+        """
+        for key, value in jax.device_get(metrics).items():
+            self.logger_run.log_metric(key, value, steps)
 
     def discription(self, eval_result=None):
         discription = ""
@@ -199,7 +602,8 @@ class Q_Network_Family(object):
             for k, v in eval_result.items():
                 discription += f"{k} : {v:8.2f}, "
 
-        discription += f"loss : {np.mean(self.lossque):.3f}"
+        # the losses stay on the device until here, and are copied at once
+        discription += f"loss : {np.mean(jax.device_get(list(self.lossque))):.3f}"
 
         if self.param_noise:
             return discription
@@ -257,11 +661,20 @@ class Q_Network_Family(object):
             if self.env_type == "SingleEnv":
                 self.learn_SingleEnv(pbar, callback, log_interval)
             if self.env_type == "VectorizedEnv":
-                self.learn_VectorizedEnv(pbar, callback, log_interval)
+                if self.pipeline:
+                    self.learn_Pipelined(pbar, callback, log_interval)
+                else:
+                    self.learn_VectorizedEnv(pbar, callback, log_interval)
+            if self.env_type == "JaxEnv":
+                self.learn_JaxEnv(pbar, callback, log_interval)
 
-            self.eval(total_timesteps)
+            if self.background_evaluator is not None:
+                self.background_evaluator.join()
+            self.run_eval(total_timesteps)
 
             self.save_params(self.logger_run.get_local_path("params"))
+            if self.replay_writer is not None:
+                self.replay_writer.join()
 
     def learn_SingleEnv(self, pbar, callback=None, log_interval=1000):
         obs, info = self.env.reset()
@@ -282,15 +695,21 @@ class Q_Network_Family(object):
 
             if steps > self.learning_starts and steps % self.train_freq == 0:
                 self.update_eps = self.exploration.value(steps)
-                loss = self.train_step(steps, self.gradient_steps)
+            updates = self.updates_per_step(steps, 1)
+            if updates > 0:
+                loss = self.train_step(steps, updates)
                 self.lossque.append(loss)
 
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
+                self.snapshot_replay()
 
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
+            if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                self.log_prefetch(steps)
+
     def learn_VectorizedEnv(self, pbar, callback=None, log_interval=1000):
         self.lossque = deque(maxlen=10)
         eval_result = None
@@ -301,81 +720,252 @@ class Q_Network_Family(object):
             actions = self.actions([obs], self.update_eps)
             self.env.step(actions)
 
-            if steps > self.learning_starts and steps % self.train_freq == 0:
-                for idx in range(self.worker_size):
-                    loss = self.train_step(steps + idx, self.gradient_steps)
-                    self.lossque.append(loss)
+            # the updates of all the workers run as one fused call
+            updates = self.updates_per_step(steps, len(obs))
+            if updates > 0:
+                loss = self.train_step(self.train_log_step(steps, len(obs)), updates)
+                self.lossque.append(loss)
 
             (
                 next_obses,
+                final_obses,
+                done_idx,
                 rewards,
                 terminateds,
                 truncateds,
                 infos,
             ) = self.env.get_result()
 
-            self.replay_buffer.add([obs], actions, rewards, [next_obses], terminateds, truncateds)
+            if self.async_env:
+                # the returned transitions can come from envs stepped in earlier iterations
+                self.replay_buffer.add(
+                    [self.env.result_obs],
+                    self.env.result_actions,
+                    rewards,
+                    [next_obses],
+                    terminateds,
+                    truncateds,
+                    self.env.env_ids,
+                    final_obs=[final_obses],
+                    done_idx=done_idx,
+                )
+            else:
+                self.replay_buffer.add(
+                    [obs],
+                    actions,
+                    rewards,
+                    [next_obses],
+                    terminateds,
+                    truncateds,
+                    final_obs=[final_obses],
+                    done_idx=done_idx,
+                )
 
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
+                self.snapshot_replay()
 
             if steps % log_interval == 0 and eval_result is not None and len(self.lossque) > 0:
                 pbar.set_description(self.discription(eval_result))
 
-    def eval(self, steps):
-        original_rewards = []
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
+            if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                self.log_prefetch(steps)
+
+    def pipeline_learner(self):
+        """Start the learner thread of the pipelined mode. It trains at replay_ratio, or without
+        it at gradient_steps per train_freq env steps, replay_ratio * worker_size updates per
+        call, and publishes the eval_state attributes after every call.
+        """
+        replay_ratio = self.replay_ratio
+        if replay_ratio is None:
+            replay_ratio = self.gradient_steps / self.train_freq
+
+        def train(last_steps, steps, updates):
+            loss = self.train_step(self.train_log_step(last_steps, steps - last_steps), updates)
+            self.lossque.append(loss)
+
+        return PipelineLearner(
+            train,
+            lambda: {attr: getattr(self, attr) for attr in self.eval_state if hasattr(self, attr)},
+            replay_ratio,
+            self.learning_starts,
+            max(int(replay_ratio * self.worker_size), 1),
+            self.max_policy_lag,
+        )
 
-        obs, info = self.eval_env.reset()
-        obs = [np.expand_dims(obs, axis=0)]
-        have_original_reward = "original_reward" in info.keys()
-        have_lives = "lives" in info.keys()
-        if have_original_reward:
-            original_reward = info["original_reward"]
-        terminated = False
-        truncated = False
-        eplen = 0
-
-        for ep in range(self.eval_eps):
-            while not terminated and not truncated:
-                actions = self.actions(obs, 0.001)
-                observation, reward, terminated, truncated, info = self.eval_env.step(actions[0])
-                obs = [np.expand_dims(observation, axis=0)]
-                if have_original_reward:
-                    original_reward += info["original_reward"]
-                total_reward[ep] += reward
-                eplen += 1
-
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-            if have_original_reward:
-                if have_lives:
-                    if info["lives"] == 0:
-                        original_rewards.append(original_reward)
-                        original_reward = 0
+    def learn_Pipelined(self, pbar, callback=None, log_interval=1000):
+        """Pipelined learn loop, the main thread acts and fills the replay buffer while the
+        learner thread trains on it.
+
+        The actor is a shallow copy of the agent with its own key sequence, at every step it
+        takes the newest params published by the learner, at most max_policy_lag updates behind
+        the replay ratio.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        actor = copy(self)
+        actor.key_seq = key_gen(np.random.randint(0, 2**31 - 1))
+        actor.act_key = next(actor.key_seq)
+        learner = self.pipeline_learner()
+
+        try:
+            for steps in pbar:
+                policy_lag, params = learner.collected(steps)
+                for attr, value in params.items():
+                    setattr(actor, attr, value)
+                self.update_eps = self.exploration.value(steps)
+                obs = self.env.current_obs()
+                actions = actor.actions([obs], self.update_eps)
+                self.env.step(actions)
+
+                (
+                    next_obses,
+                    final_obses,
+                    done_idx,
+                    rewards,
+                    terminateds,
+                    truncateds,
+                    infos,
+                ) = self.env.get_result()
+
+                if self.async_env:
+                    # the returned transitions can come from envs stepped in earlier iterations
+                    self.replay_buffer.add(
+                        [self.env.result_obs],
+                        self.env.result_actions,
+                        rewards,
+                        [next_obses],
+                        terminateds,
+                        truncateds,
+                        self.env.env_ids,
+                        final_obs=[final_obses],
+                        done_idx=done_idx,
+                    )
                 else:
-                    original_rewards.append(original_reward)
-                    original_reward = 0
+                    self.replay_buffer.add(
+                        [obs],
+                        actions,
+                        rewards,
+                        [next_obses],
+                        terminateds,
+                        truncateds,
+                        final_obs=[final_obses],
+                        done_idx=done_idx,
+                    )
+
+                if steps % self.eval_freq == 0:
+                    eval_result = actor.eval(steps)
+                    self.snapshot_replay()
+
+                if steps % log_interval == 0:
+                    if eval_result is not None and len(self.lossque) > 0:
+                        pbar.set_description(self.discription(eval_result))
+                    if self.logger_run:
+                        self.logger_run.log_metric("pipeline/policy_lag", policy_lag, steps)
+
+                if self.prefetch and steps % log_interval == 0 and len(self.lossque) > 0:
+                    self.log_prefetch(steps)
+        finally:
+            learner.close()
+
+    def learn_JaxEnv(self, pbar, callback=None, log_interval=1000):
+        """Jitted learn loop of the JAX envs, the steps between two evaluations run as one
+        compiled scan and python only logs and evaluates between the scans.
+        """
+        self.lossque = deque(maxlen=10)
+        eval_result = None
+        self.replay_buffer.flush()
+        steps = np.asarray(pbar.iterable)
+        chunk = max(self.eval_freq // self.worker_size, 1)
+        env_state, obs = self.env.reset_fn(next(self.key_seq))
+        loop_state = (
+            jnp.asarray(self.replay_buffer._idx),
+            jnp.asarray(len(self.replay_buffer)),
+            jnp.asarray(self.train_steps_count),
+            env_state,
+            obs,
+            jnp.zeros(self.worker_size),
+        )
 
-            obs, info = self.eval_env.reset()
-            obs = [np.expand_dims(obs, axis=0)]
-            terminated = False
-            truncated = False
-            eplen = 0
+        for start in range(0, len(steps), chunk):
+            chunk_steps = steps[start : start + chunk]
+            epsilons = np.array([self.exploration.value(s) for s in chunk_steps], np.float32)
+            train = (chunk_steps > self.learning_starts) & (chunk_steps % self.train_freq == 0)
+            train_state, self.replay_buffer.buffer_state, loop_state, outputs = self._jax_env_steps(
+                self.get_train_state(),
+                self.replay_buffer.buffer_state,
+                loop_state,
+                next(self.key_seq),
+                epsilons,
+                train,
+            )
+            self.set_train_state(train_state)
+            self.replay_buffer._idx = int(loop_state[0])
+            self.replay_buffer._stored = int(loop_state[1])
+            self.train_steps_count = int(loop_state[2])
+            self.update_eps = float(epsilons[-1])
+            metrics, trained, (ep_rewards, ep_counts) = jax.device_get(outputs)
+            last_step = int(chunk_steps[-1])
+
+            if np.any(trained):
+                self.lossque.extend(metrics[0][trained])
+                if self.logger_run:
+                    self.logger_run.log_metric(
+                        "loss/qloss", np.mean(metrics[0][trained]), last_step
+                    )
+                    self.logger_run.log_metric(
+                        "loss/targets", np.mean(metrics[1][trained]), last_step
+                    )
+            if self.logger_run and np.sum(ep_counts) > 0:
+                self.logger_run.log_metric(
+                    "env/train_episode_reward", np.sum(ep_rewards) / np.sum(ep_counts), last_step
+                )
+
+            pbar.update(len(chunk_steps))
+            eval_result = self.eval(last_step)
+            self.snapshot_replay()
+            if len(self.lossque) > 0:
+                pbar.set_description(self.discription(eval_result))
+        pbar.close()
+
+    def eval(self, steps):
+        """Evaluate the policy, with background_eval on a snapshot of it on the eval thread.
+
+        :return: (dict) the eval result, with background_eval the one of the last finished
+            evaluation, None before the first one
+        """
+        if self.background_evaluator is None:
+            return self.run_eval(steps)
+        return self.background_evaluator.submit(self.eval_snapshot().run_eval, steps)
+
+    def eval_snapshot(self):
+        """Shallow copy of the agent with its own copy of the eval_state attributes, so it can be
+        evaluated while this one keeps training.
+        """
+        snapshot = copy(self)
+        for attr in self.eval_state:
+            if hasattr(self, attr):
+                setattr(snapshot, attr, deepcopy(getattr(self, attr)))
+        snapshot.key_seq = key_gen(np.random.randint(0, 2**31 - 1))
+        snapshot.act_key = next(snapshot.key_seq)
+        return snapshot
+
+    def run_eval(self, steps):
+        result = self.evaluator.run(lambda obs: self.actions(obs, 0.001))
+        original_rewards = result["original_rewards"]
+        have_original_reward = original_rewards is not None
 
         if have_original_reward:
             mean_original_score = np.mean(original_rewards)
-        mean_reward = np.mean(total_reward)
-        mean_ep_len = np.mean(total_ep_len)
+        mean_reward = np.mean(result["episode_reward"])
+        mean_ep_len = np.mean(result["episode_len"])
 
         if self.logger_run:
             if have_original_reward:
                 self.logger_run.log_metric("env/original_reward", mean_original_score, steps)
             self.logger_run.log_metric("env/episode_reward", mean_reward, steps)
             self.logger_run.log_metric("env/episode len", mean_ep_len, steps)
-            self.logger_run.log_metric("env/time over", np.mean(total_truncated), steps)
+            self.logger_run.log_metric("env/time over", np.mean(result["truncated"]), steps)
 
         if have_original_reward:
             eval_result = {
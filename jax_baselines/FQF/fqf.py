@@ -16,6 +16,9 @@ from jax_baselines.DQN.base_class import Q_Network_Family
 
 
 class FQF(Q_Network_Family):
+    # the fraction proposal network picks the quantiles the actions are taken on
+    eval_state = ("params", "fqf_params")
+
     def __init__(
         self,
         env_builder: callable,
@@ -52,6 +55,15 @@ class FQF(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_replay=False,
+        memmap_dir=None,
+        frame_replay=False,
+        prefetch=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -86,6 +98,15 @@ class FQF(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_replay,
+            memmap_dir,
+            frame_replay,
+            prefetch,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "FQF"
@@ -125,19 +146,9 @@ class FQF(Q_Network_Family):
         self._target = jax.jit(self._target)
         self._train_step = jax.jit(self._train_step)
 
-    def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.params,
-                    self.fqf_params,
-                    obs,
-                    next(self.key_seq) if self.param_noise else None,
-                )
-            )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+    def act_params(self, train_state=None):
+        train_state = self.get_train_state() if train_state is None else train_state
+        return (train_state[0], train_state[1])
 
     def _get_actions(self, params, fqf_params, obses, key=None) -> jnp.ndarray:
         feature = self.preproc(params, key, convert_jax(obses))
@@ -158,45 +169,40 @@ class FQF(Q_Network_Family):
         q = (tau[:, :, 1:] - tau[:, :, :-1]) * quanile_hat
         return jnp.sum(q, axis=2)
 
-    def train_step(self, steps, gradient_steps):
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
+    def get_train_state(self):
+        return (
+            self.params,
+            self.fqf_params,
+            self.target_params,
+            self.opt_state,
+            self.fqf_opt_state,
+        )
 
-            (
-                self.params,
-                self.fqf_params,
-                self.target_params,
-                self.opt_state,
-                self.fqf_opt_state,
-                loss,
-                fqf_loss,
-                t_mean,
-                t_std,
-                tau,
-                new_priorities,
-            ) = self._train_step(
-                self.params,
-                self.fqf_params,
-                self.target_params,
-                self.opt_state,
-                self.fqf_opt_state,
-                self.train_steps_count,
-                next(self.key_seq),
-                **data
-            )
+    def set_train_state(self, train_state):
+        (
+            self.params,
+            self.fqf_params,
+            self.target_params,
+            self.opt_state,
+            self.fqf_opt_state,
+        ) = train_state
 
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+    def train_step(self, steps, gradient_steps):
+        if self.device_replay:
+            loss, fqf_loss, t_mean, t_std, tau = self.device_train_step(gradient_steps)
+        else:
+            loss, fqf_loss, t_mean, t_std, tau = self.fused_train_step(gradient_steps)
 
         if self.logger_run and steps % self.log_interval == 0:
-            self.logger_run.log_metric("loss/qloss", loss, steps)
-            self.logger_run.log_metric("loss/fqf_loss", fqf_loss, steps)
-            self.logger_run.log_metric("loss/targets", t_mean, steps)
-            self.logger_run.log_metric("loss/target_stds", t_std, steps)
+            self.log_metrics(
+                {
+                    "loss/qloss": loss,
+                    "loss/fqf_loss": fqf_loss,
+                    "loss/targets": t_mean,
+                    "loss/target_stds": t_std,
+                },
+                steps,
+            )
             self.logger_run.log_histogram("loss/tau", tau, steps)
 
         return loss
@@ -6,6 +6,8 @@ import numpy as np
 import ray
 from ray.util.queue import Queue
 
+from jax_baselines.common.frame_transport import PackedFrames, pack_frames, unpack_frames
+
 batch = namedtuple(
     "batch_tuple",
     ["obses", "actions", "mu_log_prob", "rewards", "nxtobses", "terminateds", "truncateds"],
@@ -13,9 +15,17 @@ batch = namedtuple(
 
 
 class EpochBuffer:
-    def __init__(self, size: int, env_dict: dict):
+    def __init__(self, size: int, env_dict: dict, frame_transport=0):
+        """Trajectory of a worker, sent to the learner by get_buffer.
+
+        :param size: (int) length of the trajectory
+        :param env_dict: (dict) cpprb env_dict of the transitions
+        :param frame_transport: (int) number of frames stacked in the image observations, which
+            are packed into their newest frames by get_buffer, whole observations are sent if 0
+        """
         self.max_size = size
         self.env_dict = env_dict
+        self.frame_transport = frame_transport
         self.obsdict = dict((o, s) for o, s in env_dict.items() if o.startswith("obs"))
         self.nextobsdict = dict((o, s) for o, s in env_dict.items() if o.startswith("next_obs"))
         self.buffer = cpprb.ReplayBuffer(size, env_dict=env_dict)
@@ -40,12 +50,21 @@ class EpochBuffer:
 
     def get_buffer(self):
         trans = self.buffer.get_all_transitions()
+        obses = [trans[o] for o in self.obsdict.keys()]
+        nxtobses = [trans[o] for o in self.nextobsdict.keys()]
+        if self.frame_transport:
+            for idx, o in enumerate(self.obsdict.keys()):
+                if len(self.obsdict[o]["shape"]) >= 3:
+                    obses[idx] = pack_frames(
+                        obses[idx], nxtobses[idx], trans["terminated"], self.frame_transport
+                    )
+                    nxtobses[idx] = None
         transitions = batch(
-            [trans[o] for o in self.obsdict.keys()],
+            obses,
             trans["action"],
             trans["log_prob"],
             trans["reward"],
-            [trans[o] for o in self.nextobsdict.keys()],
+            nxtobses,
             trans["terminated"],
             trans["truncted"],
         )
@@ -144,4 +163,22 @@ class ImpalaBuffer:
     def sample(self):
         out = ray.get(self.get)
         self.get = self.getter.sample.remote()
-        return out
+        return unpack_batch(out)
+
+
+def unpack_batch(transitions):
+    """Rebuild the frame stacks of the trajectories packed by the workers.
+
+    :param transitions: (batch) the sampled trajectories
+    :return: (batch) the trajectories with whole observations
+    """
+    obses, nxtobses = [], []
+    for traj_obses, traj_nxtobses in zip(transitions.obses, transitions.nxtobses):
+        traj_obses, traj_nxtobses = list(traj_obses), list(traj_nxtobses)
+        for idx, packed in enumerate(traj_obses):
+            if isinstance(packed, PackedFrames):
+                frame_stack = packed.first.shape[-1] // packed.frames.shape[-1]
+                traj_obses[idx], traj_nxtobses[idx] = unpack_frames(packed, frame_stack)
+        obses.append(traj_obses)
+        nxtobses.append(traj_nxtobses)
+    return transitions._replace(obses=tuple(obses), nxtobses=tuple(nxtobses))
@@ -14,7 +14,7 @@ from jax_baselines.IMPALA.cpprb_buffers import EpochBuffer
 class Impala_Worker(object):
     encoded = base64.b64encode(mp.current_process().authkey)
 
-    def __init__(self, env_name_) -> None:
+    def __init__(self, env_name_, frame_transport=0) -> None:
         mp.current_process().authkey = base64.b64decode(self.encoded)
         from jax_baselines.common.atari_wrappers import get_env_type, make_wrap_atari
 
@@ -23,6 +23,8 @@ class Impala_Worker(object):
             self.env = make_wrap_atari(env_name_, clip_rewards=True)
         else:
             self.env = gym.make(env_name_)
+        # the frame stacks of the trajectories are sent as their newest frames
+        self.frame_transport = frame_transport
 
     def get_info(self):
         return {
@@ -45,7 +47,7 @@ class Impala_Worker(object):
     ):
         try:
             queue, env_dict, actor_num = buffer_info
-            local_buffer = EpochBuffer(local_size, env_dict)
+            local_buffer = EpochBuffer(local_size, env_dict, self.frame_transport)
             preproc, actor_model, _ = model_builder()
             actor, get_action_prob, convert_action = actor_builder()
 
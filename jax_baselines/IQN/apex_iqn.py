@@ -44,6 +44,10 @@ class APE_X_IQN(Ape_X_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        replay_shards=1,
+        eval_env_builder=None,
+        eval_eps=20,
+        eval_workers=8,
     ):
         super().__init__(
             workers,
@@ -74,6 +78,10 @@ class APE_X_IQN(Ape_X_Family):
             seed,
             optimizer,
             compress_memory,
+            replay_shards,
+            eval_env_builder,
+            eval_eps,
+            eval_workers,
         )
 
         self.n_support = n_support
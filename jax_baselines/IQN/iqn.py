@@ -48,6 +48,15 @@ class IQN(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        device_replay=False,
+        memmap_dir=None,
+        frame_replay=False,
+        prefetch=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -82,6 +91,15 @@ class IQN(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            device_replay,
+            memmap_dir,
+            frame_replay,
+            prefetch,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "IQN"
@@ -117,15 +135,8 @@ class IQN(Q_Network_Family):
     def get_q(self, params, obses, tau, key=None) -> jnp.ndarray:
         return self.model(params, key, self.preproc(params, key, obses), tau)
 
-    def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(self._get_actions(self.params, obs, next(self.key_seq)))
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
-
     def _get_actions(self, params, obses, key=None) -> jnp.ndarray:
-        tau = jax.random.uniform(key, (self.worker_size, self.n_support)) * self.CVaR
+        tau = jax.random.uniform(key, (obses[0].shape[0], self.n_support)) * self.CVaR
         return jnp.expand_dims(
             jnp.argmax(
                 jnp.mean(self.get_q(params, convert_jax(obses), tau, key), axis=2),
@@ -135,37 +146,15 @@ class IQN(Q_Network_Family):
         )
 
     def train_step(self, steps, gradient_steps):
-        for _ in range(gradient_steps):
-            self.train_steps_count += 1
-            if self.prioritized_replay:
-                data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
-            else:
-                data = self.replay_buffer.sample(self.batch_size)
-
-            (
-                self.params,
-                self.target_params,
-                self.opt_state,
-                loss,
-                t_mean,
-                t_std,
-                new_priorities,
-            ) = self._train_step(
-                self.params,
-                self.target_params,
-                self.opt_state,
-                self.train_steps_count,
-                next(self.key_seq),
-                **data
-            )
-
-            if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+        if self.device_replay:
+            loss, t_mean, t_std = self.device_train_step(gradient_steps)
+        else:
+            loss, t_mean, t_std = self.fused_train_step(gradient_steps)
 
         if self.logger_run and steps % self.log_interval == 0:
-            self.logger_run.log_metric("loss/qloss", loss, steps)
-            self.logger_run.log_metric("loss/targets", t_mean, steps)
-            self.logger_run.log_metric("loss/target_stds", t_std, steps)
+            self.log_metrics(
+                {"loss/qloss": loss, "loss/targets": t_mean, "loss/target_stds": t_std}, steps
+            )
 
         return loss
 
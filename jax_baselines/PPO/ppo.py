@@ -31,6 +31,8 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        eval_workers=8,
+        background_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -49,6 +51,8 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            eval_workers,
+            background_eval,
         )
 
         self.name = "PPO"
@@ -104,12 +108,6 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
         return critic_loss
 
     def _preprocess(self, params, key, obses, actions, rewards, nxtobses, terminateds, truncateds):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
@@ -124,7 +122,7 @@ class PPO(Actor_Critic_Policy_Gradient_Family):
             actions,
             key,
         )
-        adv = jax.vmap(get_gaes, in_axes=(0, 0, 0, 0, 0, None, None))(
+        adv = jax.vmap(get_gaes, in_axes=(1, 1, 1, 1, 1, None, None), out_axes=1)(
             rewards, terminateds, truncateds, value, next_value, self.gamma, self.lamda
         )
         obses = [jnp.vstack(o) for o in obses]
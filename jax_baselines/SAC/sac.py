@@ -38,6 +38,14 @@ class SAC(Deteministic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        memmap_dir=None,
+        prefetch=False,
+        deferred_priorities=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -65,6 +73,14 @@ class SAC(Deteministic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            memmap_dir,
+            prefetch,
+            deferred_priorities,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "SAC"
@@ -140,12 +156,13 @@ class SAC(Deteministic_Policy_Gradient_Family):
         if self.learning_starts < steps:
             actions = np.asarray(self._get_actions(self.policy_params, obs, next(self.key_seq)))
         else:
-            actions = np.random.uniform(-1.0, 1.0, size=(self.worker_size, self.action_size[0]))
+            actions = np.random.uniform(-1.0, 1.0, size=(len(obs[0]), self.action_size[0]))
         return actions
 
     def train_step(self, steps, gradient_steps):
         # Sample a batch from the replay buffer
         for _ in range(gradient_steps):
+            self.train_steps_count += 1
             if self.prioritized_replay:
                 data = self.replay_buffer.sample(self.batch_size, self.prioritized_replay_beta0)
             else:
@@ -172,13 +189,14 @@ class SAC(Deteministic_Policy_Gradient_Family):
                 self.opt_policy_state,
                 self.opt_critic_state,
                 next(self.key_seq),
-                steps,
+                self.train_steps_count,
                 self.log_ent_coef,
                 **data
             )
 
             if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+                self.update_priorities(data["indexes"], new_priorities)
+        self.flush_priorities()
 
         if self.logger_run and steps % self.log_interval == 0:
             self.logger_run.log_metric("loss/qloss", loss, steps)
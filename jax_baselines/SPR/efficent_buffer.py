@@ -1,21 +1,29 @@
-import random
-
 import numpy as np
 
+from jax_baselines.common.replay_snapshot import load_snapshot, save_snapshot
+
 
 class Buffer(object):
-    def __init__(self, size: int, obs_dict: dict, env_dict: dict):
+    def __init__(self, size: int, obs_dict: dict, env_dict: dict, frame_stack=None):
         self.max_size = size
         self._idx = -1
         self.ep_idx = 0
         self.obs_dict = obs_dict
         self.env_dict = env_dict
+        # with frame_stack, only the newest frame of the stacked image observations is stored
+        self.frame_stack = frame_stack
+        self.frame_keys = []
+        if frame_stack is not None:
+            self.frame_keys = [k for k, v in obs_dict.items() if len(v["shape"]) >= 3]
         self.buffer = self.creat_buffer(size, obs_dict, env_dict)
 
     def creat_buffer(self, size: int, obs_dict: dict, env_dict: dict):
         buffer = {}
         for name, data in obs_dict.items():
-            buffer[name] = np.zeros((size, *data["shape"]), dtype=data["dtype"])
+            shape = list(data["shape"])
+            if name in self.frame_keys:
+                shape[-1] = shape[-1] // self.frame_stack
+            buffer[name] = np.zeros((size, *shape), dtype=data["dtype"])
         for name, data in env_dict.items():
             buffer[name] = np.zeros((size, *data["shape"]), dtype=data["dtype"])
         buffer["terminated"] = np.ones((size, 1), dtype=np.bool_)
@@ -32,14 +40,38 @@ class Buffer(object):
         self.update_idx()
         if self.buffer["ep_idx"][self.roll_idx_m1] != self.ep_idx:
             for idx, k in enumerate(self.obs_dict.keys()):
-                self.buffer[k][self.roll_idx] = obs[idx]
+                self.buffer[k][self.roll_idx] = self.newest(k, obs[idx])
         for idx, k in enumerate(self.obs_dict.keys()):
-            self.buffer[k][self.next_roll_idx] = next_obs[idx]
+            self.buffer[k][self.next_roll_idx] = self.newest(k, next_obs[idx])
         for k, data in kwargs.items():
             self.buffer[k][self.roll_idx] = data
         self.buffer["ep_idx"][self.roll_idx] = self.ep_idx
         return self.roll_idx
 
+    def newest(self, k, obs):
+        if k in self.frame_keys:
+            return obs[..., -self.buffer[k].shape[-1] :]
+        return obs
+
+    def stack(self, k, idxs):
+        """Rebuild the frame stacks of the rows idxs, repeating the first frame of an episode."""
+        ep_idx = self.buffer["ep_idx"][..., 0]
+        history = [idxs]
+        for _ in range(self.frame_stack - 1):
+            idx = history[-1]
+            prev = (idx - 1) % self.max_size
+            # the rows holding the last obs of a truncated episode (ep_idx -1) and the newest
+            # next_obs (ep_idx not written yet) belong to the episode before them, the history
+            # of the oldest row is already overwritten
+            first = (
+                (ep_idx[idx] != -1) & (ep_idx[idx] != ep_idx[prev]) & (idx != self.next_roll_idx)
+            )
+            first = first | (prev == self.next_roll_idx)
+            history.append(np.where(first, idx, prev))
+        frames = self.buffer[k][np.stack(history[::-1], axis=-1)]
+        frames = np.moveaxis(frames, idxs.ndim, -2)
+        return np.reshape(frames, (*frames.shape[:-2], -1))
+
     def on_episode_end(self, truncated):
         if truncated:
             self.update_idx()
@@ -56,7 +88,10 @@ class Buffer(object):
         traj_idxs = (idxs + np.reshape(np.arange(traj_len), (1, traj_len))) % self.max_size
         obs = []
         for k in self.obs_dict:
-            obs.append(self.buffer[k][obs_traj_idxs])
+            if k in self.frame_keys:
+                obs.append(self.stack(k, obs_traj_idxs))
+            else:
+                obs.append(self.buffer[k][obs_traj_idxs])
         data = {}
         for k in self.env_dict:
             data[k] = self.buffer[k][traj_idxs]
@@ -82,38 +117,43 @@ class SumTree:
     write = 0
 
     def __init__(self, capacity):
+        """Flat array sum tree with batched sampling and priority updates.
+
+        The tree is stored as a binary heap padded to a power of two (root at 1, leaves at
+        [leaf_offset, leaf_offset + capacity)), so every leaf has the same depth and all prefix
+        sums of a batch can descend together, one level at a time.
+
+        :param capacity: (int) number of leaves
+        """
         self.capacity = capacity
-        self.tree = np.zeros(2 * capacity - 1, dtype=np.float64)
+        self.depth = int(np.ceil(np.log2(max(capacity, 2))))
+        self.leaf_offset = 2**self.depth
+        self.tree = np.zeros(2 * self.leaf_offset, dtype=np.float64)
         self.data = np.zeros(capacity, dtype=np.int32)
         self.n_entries = 0
         self.max_priority = 1.0
         self.min_priority = np.inf
 
-    # update to the root node
-    def _propagate(self, idx, change):
-        parent = (idx - 1) // 2
-
-        self.tree[parent] += change
-
-        if parent != 0:
-            self._propagate(parent, change)
-
-    # find sample on leaf node
-    def _retrieve(self, idx, s):
-        left = 2 * idx + 1
-        right = left + 1
-
-        if left >= len(self.tree):
-            return idx
-
-        if s <= self.tree[left]:
-            return self._retrieve(left, s)
-        else:
-            return self._retrieve(right, s - self.tree[left])
+    # recompute the parents of the given nodes up to the root
+    def _propagate(self, idxs):
+        for _ in range(self.depth):
+            idxs = np.unique(idxs // 2)
+            self.tree[idxs] = self.tree[2 * idxs] + self.tree[2 * idxs + 1]
+
+    # find leaves for a batch of prefix sums, one tree level at a time
+    def _retrieve(self, s):
+        idxs = np.ones(len(s), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * idxs
+            left_sum = self.tree[left]
+            go_right = s > left_sum
+            s = np.where(go_right, s - left_sum, s)
+            idxs = np.where(go_right, left + 1, left)
+        return idxs
 
     def total(self):
         # all sum of priorities
-        return self.tree[0]
+        return self.tree[1]
 
     def max(self):
         # return the max priority
@@ -125,10 +165,10 @@ class SumTree:
 
     # store priority and sample
     def add(self, p, data):
-        idx = self.write + self.capacity - 1
+        idx = self.write + self.leaf_offset
 
         self.data[self.write] = data
-        self.update(idx, p)
+        self.update(np.array([idx]), np.array([p]))
 
         self.write += 1
         if self.write >= self.capacity:
@@ -137,21 +177,28 @@ class SumTree:
         if self.n_entries < self.capacity:
             self.n_entries += 1
 
-    # update priority
-    def update(self, idx, p, minmax_decay=1e-4):
-        self.max_priority = max(p, self.max_priority * (1.0 - minmax_decay))
-        self.min_priority = min(p, self.min_priority * (1.0 + minmax_decay))
-        change = p - self.tree[idx]
+    # update priorities, the last write wins for duplicated indexes
+    def update(self, idxs, ps, minmax_decay=1e-4):
+        idxs = np.asarray(idxs, dtype=np.int64)
+        ps = np.asarray(ps, dtype=np.float64)
+        idxs, last = np.unique(idxs[::-1], return_index=True)
+        ps = ps[::-1][last]
 
-        self.tree[idx] = p
-        self._propagate(idx, change)
+        decay = len(ps)
+        self.max_priority = max(np.max(ps), self.max_priority * (1.0 - minmax_decay) ** decay)
+        self.min_priority = min(np.min(ps), self.min_priority * (1.0 + minmax_decay) ** decay)
 
-    # get priority and sample
+        self.tree[idxs] = ps
+        self._propagate(idxs)
+
+    # get priorities and samples for a batch of prefix sums
     def get(self, s):
-        idx = self._retrieve(0, s)
-        dataIdx = idx - self.capacity + 1
+        idxs = self._retrieve(np.asarray(s, dtype=np.float64))
+        # floating point error can push a prefix sum past the last filled leaf
+        dataIdxs = np.minimum(idxs - self.leaf_offset, max(self.n_entries - 1, 0))
+        idxs = dataIdxs + self.leaf_offset
 
-        return (idx, self.tree[idx], self.data[dataIdx])
+        return (idxs, self.tree[idxs], self.data[dataIdxs])
 
 
 class TransitionReplayBuffer(object):
@@ -161,6 +208,7 @@ class TransitionReplayBuffer(object):
         observation_space: list = [],
         action_space=1,
         prediction_depth=5,
+        frame_stack=None,
     ):
         self.max_size = size
         self.prediction_depth = prediction_depth
@@ -185,6 +233,7 @@ class TransitionReplayBuffer(object):
                 "actions": {"shape": action_space, "dtype": np.float32},
                 "rewards": {"shape": (), "dtype": np.float32},
             },
+            frame_stack=frame_stack,
         )
 
     def __len__(self) -> int:
@@ -220,6 +269,43 @@ class TransitionReplayBuffer(object):
         obs, data, terminated, filled, _ = self.buffer.sample(idxs, traj_len=self.prediction_depth)
         return {"obses": obs, **data, "terminateds": terminated, "filled": filled}
 
+    def snapshot(self):
+        """Copy the buffer arrays, write pointer and episode index.
+
+        :return: (tuple) the buffer arrays and the buffer state
+        """
+        arrays = dict((k, v.copy()) for k, v in self.buffer.buffer.items())
+        return arrays, {"idx": self.buffer._idx, "ep_idx": self.buffer.ep_idx}
+
+    def restore(self, arrays, state):
+        for k, v in arrays.items():
+            if self.buffer.buffer[k].shape != v.shape:
+                raise ValueError(
+                    f"snapshot {k} has shape {v.shape}, the buffer {self.buffer.buffer[k].shape}"
+                )
+            self.buffer.buffer[k][:] = v
+        self.buffer._idx = int(state["idx"])
+        self.buffer.ep_idx = int(state["ep_idx"])
+        # the restarted run starts a new episode, end the one cut by the snapshot as truncated
+        if self.buffer._idx >= 0 and self.buffer.buffer["ep_idx"][self.buffer.roll_idx] == (
+            self.buffer.ep_idx
+        ):
+            self.buffer.on_episode_end(True)
+
+    def save_replay(self, path, compress=False, background=True):
+        """Write a snapshot of the buffer to the directory path.
+
+        :param path: (str) snapshot directory
+        :param compress: (bool) compress the array chunks
+        :param background: (bool) write on a background thread, the arrays are copied first
+        :return: (threading.Thread) the writer thread, None if written in the foreground
+        """
+        arrays, state = self.snapshot()
+        return save_snapshot(path, arrays, state, compress, background=background)
+
+    def load_replay(self, path):
+        self.restore(*load_snapshot(path))
+
 
 class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
     def __init__(
@@ -230,8 +316,9 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
         prediction_depth=5,
         alpha: float = 0.6,
         eps: float = 1e-4,
+        frame_stack=None,
     ):
-        super().__init__(size, observation_space, action_space, prediction_depth)
+        super().__init__(size, observation_space, action_space, prediction_depth, frame_stack)
         self.tree = SumTree(size)
         self.alpha = alpha
         self.eps = eps
@@ -249,17 +336,9 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
             self.buffer.on_episode_end(terminated)
 
     def sample(self, batch_size: int, beta=0.4):
-        idxs = np.zeros((batch_size), dtype=np.int32)
-        priorities = np.zeros((batch_size), dtype=np.float32)
-        buffer_idxs = np.zeros((batch_size), dtype=np.int32)
         segment = self.tree.total() / batch_size
-        for i in range(batch_size):
-            a, b = segment * i, segment * (i + 1)
-            s = random.uniform(a, b)
-            idx, p, buffer_idx = self.tree.get(s)
-            idxs[i] = idx
-            priorities[i] = p
-            buffer_idxs[i] = buffer_idx
+        s = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        idxs, priorities, buffer_idxs = self.tree.get(s)
         obs, data, terminated, filled, _ = self.buffer.sample(
             buffer_idxs, traj_len=self.prediction_depth
         )
@@ -276,9 +355,29 @@ class PrioritizedTransitionReplayBuffer(TransitionReplayBuffer):
         }
 
     def update_priorities(self, indexes, priorities):
-        priorities = np.power(priorities + self.eps, self.alpha)
-        for idx, p in zip(indexes, priorities):
-            self.tree.update(idx, p)
+        priorities = np.power(np.asarray(priorities) + self.eps, self.alpha)
+        self.tree.update(indexes, priorities)
+
+    def snapshot(self):
+        arrays, state = super().snapshot()
+        arrays["tree"] = self.tree.tree.copy()
+        arrays["tree_data"] = self.tree.data.copy()
+        state.update(
+            tree_write=self.tree.write,
+            tree_n_entries=self.tree.n_entries,
+            tree_max_priority=self.tree.max_priority,
+            tree_min_priority=self.tree.min_priority,
+        )
+        return arrays, state
+
+    def restore(self, arrays, state):
+        self.tree.tree[:] = arrays.pop("tree")
+        self.tree.data[:] = arrays.pop("tree_data")
+        self.tree.write = int(state["tree_write"])
+        self.tree.n_entries = int(state["tree_n_entries"])
+        self.tree.max_priority = float(state["tree_max_priority"])
+        self.tree.min_priority = float(state["tree_min_priority"])
+        super().restore(arrays, state)
 
 
 if __name__ == "__main__":
@@ -313,4 +412,4 @@ if __name__ == "__main__":
         truncated=True,
     )
 
-    buffer.update_priorities(sample["indexes"], np.random.rand(5))
+    buffer.update_priorities(sample["indexes"], np.random.rand(len(sample["indexes"])))
@@ -47,6 +47,7 @@ class HL_GAUSS_SPR(Q_Network_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        frame_replay=False,
     ):
 
         self.shift_size = 4
@@ -92,6 +93,7 @@ class HL_GAUSS_SPR(Q_Network_Family):
             seed,
             optimizer,
             compress_memory,
+            frame_replay=frame_replay,
         )
 
         self.name = "HL_GAUSS_SPR"
@@ -110,6 +112,7 @@ class HL_GAUSS_SPR(Q_Network_Family):
                 prediction_depth=max(self.prediction_depth, self.n_step),
                 alpha=self.prioritized_replay_alpha,
                 eps=self.prioritized_replay_eps,
+                frame_stack=4 if self.frame_replay else None,
             )
         else:
             self.replay_buffer = TransitionReplayBuffer(
@@ -117,6 +120,7 @@ class HL_GAUSS_SPR(Q_Network_Family):
                 self.observation_space,
                 1,
                 prediction_depth=max(self.prediction_depth, self.n_step),
+                frame_stack=4 if self.frame_replay else None,
             )
 
     def setup_model(self):
@@ -159,18 +163,9 @@ class HL_GAUSS_SPR(Q_Network_Family):
         self._target = jax.jit(self._target)
         self._train_step = jax.jit(self._train_step)
 
-    def actions(self, obs, epsilon):
-        if epsilon <= np.random.uniform(0, 1):
-            actions = np.asarray(
-                self._get_actions(
-                    self.target_params if self.scaled_by_reset else self.params,
-                    obs,
-                    next(self.key_seq) if self.param_noise else None,
-                )
-            )
-        else:
-            actions = np.random.choice(self.action_size[0], [self.worker_size, 1])
-        return actions
+    def act_params(self, train_state=None):
+        params, target_params, _ = self.get_train_state() if train_state is None else train_state
+        return (target_params if self.scaled_by_reset else params,)
 
     def get_q(self, params, obses, key=None) -> jnp.ndarray:
         return self.model(params, key, self.preproc(params, key, obses))
@@ -231,9 +226,9 @@ class HL_GAUSS_SPR(Q_Network_Family):
             self.replay_buffer.update_priorities(data["indexes"], new_priorities)
 
         if self.logger_run and steps % self.log_interval == 0:
-            self.logger_run.log_metric("loss/qloss", loss, steps)
-            self.logger_run.log_metric("loss/rprloss", rprloss, steps)
-            self.logger_run.log_metric("loss/targets", t_mean, steps)
+            self.log_metrics(
+                {"loss/qloss": loss, "loss/rprloss": rprloss, "loss/targets": t_mean}, steps
+            )
 
         return loss
 
@@ -39,6 +39,10 @@ class APE_X_TD3(Ape_X_Deteministic_Policy_Gradient_Family):
         seed=None,
         optimizer="adamw",
         compress_memory=False,
+        replay_shards=1,
+        eval_env_builder=None,
+        eval_eps=20,
+        eval_workers=8,
     ):
         super().__init__(
             workers,
@@ -66,6 +70,10 @@ class APE_X_TD3(Ape_X_Deteministic_Policy_Gradient_Family):
             seed,
             optimizer,
             compress_memory,
+            replay_shards,
+            eval_env_builder,
+            eval_eps,
+            eval_workers,
         )
 
         self.action_noise = self.exploration_initial_eps ** (1 + self.exploration_decay)
@@ -11,6 +11,14 @@ from jax_baselines.DDPG.base_class import Deteministic_Policy_Gradient_Family
 
 
 class TD7(Deteministic_Policy_Gradient_Family):
+    eval_state = (
+        "fixed_encoder_params",
+        "policy_params",
+        "checkpoint_encoder_params",
+        "checkpoint_policy_params",
+        "obs_rms",
+    )
+
     def __init__(
         self,
         env_builder: callable,
@@ -37,6 +45,14 @@ class TD7(Deteministic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="adamw",
+        memmap_dir=None,
+        prefetch=False,
+        deferred_priorities=False,
+        eval_workers=8,
+        background_eval=False,
+        replay_ratio=None,
+        pipeline=False,
+        max_policy_lag=None,
     ):
         super().__init__(
             env_builder,
@@ -64,6 +80,14 @@ class TD7(Deteministic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            memmap_dir,
+            prefetch,
+            deferred_priorities,
+            eval_workers,
+            background_eval,
+            replay_ratio,
+            pipeline,
+            max_policy_lag,
         )
 
         self.name = "TD7"
@@ -150,12 +174,12 @@ class TD7(Deteministic_Policy_Gradient_Family):
                 actions = np.clip(
                     actions
                     + self.action_noise
-                    * np.random.normal(0, 1, size=(self.worker_size, self.action_size[0])),
+                    * np.random.normal(0, 1, size=(len(obs[0]), self.action_size[0])),
                     -1,
                     1,
                 )
         else:
-            actions = np.random.uniform(-1.0, 1.0, size=(self.worker_size, self.action_size[0]))
+            actions = np.random.uniform(-1.0, 1.0, size=(len(obs[0]), self.action_size[0]))
         return actions
 
     def end_episode(self, steps, score, eplen):
@@ -238,7 +262,8 @@ class TD7(Deteministic_Policy_Gradient_Family):
             targets.append(t_mean)
 
             if self.prioritized_replay:
-                self.replay_buffer.update_priorities(data["indexes"], new_priorities)
+                self.update_priorities(data["indexes"], new_priorities)
+        self.flush_priorities()
 
         mean_repr_loss = jnp.mean(jnp.array(repr_losses))
         mean_loss = jnp.mean(jnp.array(losses))
@@ -489,36 +514,20 @@ class TD7(Deteministic_Policy_Gradient_Family):
 
             if steps % self.eval_freq == 0:
                 eval_result = self.eval(steps)
+                self.snapshot_replay()
 
             if steps % log_interval == 0 and eval_result is not None and self.loss_mean is not None:
                 pbar.set_description(self.discription(eval_result))
 
-    def eval(self, steps):
-        total_reward = np.zeros(self.eval_eps)
-        total_ep_len = np.zeros(self.eval_eps)
-        total_truncated = np.zeros(self.eval_eps)
-        for ep in range(self.eval_eps):
-            obs, info = self.eval_env.reset()
-            obs = [np.expand_dims(obs, axis=0)]
-            terminated = False
-            truncated = False
-            eplen = 0
-            while not terminated and not truncated:
-                actions = self.actions(obs, steps, use_checkpoint=True, exploration=False)
-                next_obs, reward, terminated, truncated, info = self.eval_env.step(actions[0])
-                next_obs = [np.expand_dims(next_obs, axis=0)]
-                # self.replay_buffer.add(obs, actions[0], reward, next_obs, terminated, truncated)
-                total_reward[ep] += reward
-                obs = next_obs
-                eplen += 1
-            total_ep_len[ep] = eplen
-            total_truncated[ep] = float(truncated)
-
-        mean_reward = np.mean(total_reward)
-        mean_ep_len = np.mean(total_ep_len)
+    def run_eval(self, steps):
+        result = self.evaluator.run(
+            lambda obs: self.actions(obs, steps, use_checkpoint=True, exploration=False)
+        )
+        mean_reward = np.mean(result["episode_reward"])
+        mean_ep_len = np.mean(result["episode_len"])
 
         if self.logger_run:
             self.logger_run.log_metric("env/episode_reward", mean_reward, steps)
             self.logger_run.log_metric("env/episode len", mean_ep_len, steps)
-            self.logger_run.log_metric("env/time over", np.mean(total_truncated), steps)
+            self.logger_run.log_metric("env/time over", np.mean(result["truncated"]), steps)
         return {"mean_reward": mean_reward, "mean_ep_len": mean_ep_len}
@@ -13,6 +13,14 @@ from jax_baselines.common.utils import (
 
 
 class TPPO(Actor_Critic_Policy_Gradient_Family):
+    train_metrics = (
+        "loss/critic_loss",
+        "loss/actor_loss",
+        "loss/entropy_loss",
+        "loss/kl_divergense",
+        "loss/mean_target",
+    )
+
     def __init__(
         self,
         env_builder,
@@ -37,6 +45,8 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
         full_tensorboard_log=False,
         seed=None,
         optimizer="rmsprop",
+        eval_workers=8,
+        background_eval=False,
     ):
         super().__init__(
             env_builder,
@@ -55,6 +65,8 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
             full_tensorboard_log,
             seed,
             optimizer,
+            eval_workers,
+            background_eval,
         )
 
         self.name = "TPPO"
@@ -113,12 +125,6 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
         return critic_loss
 
     def _preprocess(self, params, key, obses, actions, rewards, nxtobses, terminateds, truncateds):
-        obses = [jnp.stack(zo) for zo in zip(*obses)]
-        nxtobses = [jnp.stack(zo) for zo in zip(*nxtobses)]
-        actions = jnp.stack(actions)
-        rewards = jnp.stack(rewards)
-        terminateds = jnp.stack(terminateds)
-        truncateds = jnp.stack(truncateds)
         obses = convert_jax(obses)
         nxtobses = convert_jax(nxtobses)
         feature = jax.vmap(self.preproc, in_axes=(None, None, 0))(params, key, obses)
@@ -134,7 +140,7 @@ class TPPO(Actor_Critic_Policy_Gradient_Family):
             key,
             True,
         )
-        adv = jax.vmap(get_gaes, in_axes=(0, 0, 0, 0, 0, None, None))(
+        adv = jax.vmap(get_gaes, in_axes=(1, 1, 1, 1, 1, None, None), out_axes=1)(
             rewards, terminateds, truncateds, value, next_value, self.gamma, self.lamda
         )
         obses = [jnp.vstack(o) for o in obses]
@@ -289,6 +289,210 @@ class LazyFrames(object):
         return self._force()[i]
 
 
+class FusedAtariEnv(gym.Wrapper):
+    def __init__(
+        self,
+        env,
+        noop_max=30,
+        skip=4,
+        max_episode_steps=10000,
+        episode_life=True,
+        kill_on_life_loss=False,
+        clip_rewards=True,
+        n_frames=4,
+        stack_buffer=64,
+        ale_grayscale=False,
+    ):
+        """The DeepMind Atari preprocessing of make_wrap_atari in a single wrapper.
+
+        It gives the observations, rewards and infos of NoopResetEnv, MaxAndSkipEnv, TimeLimit,
+        EpisodicLifeEnv, FireResetEnv, WarpFrame, ClipRewardEnv and FrameStack, without their
+        per step arrays: the emulator is stepped through its ALE interface, the screens are
+        fetched into preallocated buffers, max pooled and converted in place, and resized into a
+        slot of a rolling frame stack. The observation is a read only view of the stack, valid
+        until stack_buffer - 2 * n_frames more frames are stacked, one per step and n_frames per
+        reset, long enough for the learners that copy it into a buffer before the next steps.
+
+        :param env: (Gym Environment) the ALE environment, without frame skipping
+        :param noop_max: (int) the maximum value of no-ops to run on reset
+        :param skip: (int) number of frames an action is repeated for
+        :param max_episode_steps: (int) steps before truncation, None for no limit
+        :param episode_life: (bool) end the episodes at every lost life
+        :param kill_on_life_loss: (bool) reset the game at every lost life
+        :param clip_rewards: (bool) clip the rewards by their sign, logging the original reward
+        :param n_frames: (int) the number of frames to stack
+        :param stack_buffer: (int) frames of the rolling frame stack
+        :param ale_grayscale: (bool) fetch the grayscale screens of ALE instead of converting
+            the RGB screens, faster but ALE's grayscale palette differs slightly from cv2's
+        """
+        gym.Wrapper.__init__(self, env)
+        self.ale = env.unwrapped.ale
+        self.action_set = env.unwrapped._action_set
+        action_meanings = env.unwrapped.get_action_meanings()
+        assert action_meanings[0] == "NOOP"
+        print("Action meaning : ", action_meanings)
+        self.fire_reset = "FIRE" in action_meanings
+        if self.fire_reset:
+            assert action_meanings[1] == "FIRE"
+            assert len(action_meanings) >= 3
+        self.has_truncation = hasattr(self.ale, "game_truncated")
+
+        self.noop_max = noop_max
+        self.skip = skip
+        self.max_episode_steps = max_episode_steps
+        self.episode_life = episode_life
+        self.kill_on_life_loss = kill_on_life_loss
+        self.clip_rewards = clip_rewards
+        self.n_frames = n_frames
+        self.width = 84
+        self.height = 84
+        self.observation_space = spaces.Box(
+            low=0, high=255, shape=(self.height, self.width, n_frames), dtype=np.uint8
+        )
+
+        screen_shape = env.observation_space.shape[:2]
+        if not ale_grayscale:
+            screen_shape = screen_shape + (3,)
+        self.ale_grayscale = ale_grayscale
+        # the last two screens of a step for max pooling, and the screen of a reset
+        self._screens = np.zeros((2,) + screen_shape, dtype=np.uint8)
+        self._max_screen = np.zeros(screen_shape, dtype=np.uint8)
+        self._reset_screen = np.zeros(screen_shape, dtype=np.uint8)
+        self._gray = np.zeros(screen_shape[:2], dtype=np.uint8)
+        self._reset_obs = False
+        # frames are written at increasing positions, the observation is a view of the last
+        # n_frames, and the last frames move back to the front when the buffer runs out
+        self._stack = np.zeros(
+            (max(stack_buffer, 4 * n_frames), self.height, self.width), dtype=np.uint8
+        )
+        self._pos = n_frames - 1
+
+        self.lives = 0
+        self.was_real_done = True
+        self.elapsed_steps = 0
+
+    def _get_screen(self, out):
+        if self.ale_grayscale:
+            self.ale.getScreenGrayscale(out)
+        else:
+            self.ale.getScreenRGB(out)
+
+    def _game_over(self):
+        if self.has_truncation:
+            return self.ale.game_over(with_truncation=False), self.ale.game_truncated()
+        return self.ale.game_over(), False
+
+    def _noop_reset(self, **kwargs):
+        """Reset of TimeLimit and NoopResetEnv, the observation is the screen after the no-ops."""
+        self.elapsed_steps = 0
+        self.env.reset(**kwargs)
+        noops = np.random.randint(1, self.noop_max + 1)
+        for _ in range(noops):
+            self.ale.act(self.action_set[0])
+            terminated, truncated = self._game_over()
+            if terminated or truncated:
+                self.env.reset(**kwargs)
+        self._get_screen(self._reset_screen)
+        self._reset_obs = True
+        return self.ale.lives()
+
+    def _skip_step(self, action):
+        """Step of MaxAndSkipEnv and TimeLimit, the screens of the last two frames are kept."""
+        total_reward = 0.0
+        for i in range(self.skip):
+            total_reward += self.ale.act(self.action_set[action])
+            terminated, truncated = self._game_over()
+            if i >= self.skip - 2:
+                self._get_screen(self._screens[i - self.skip + 2])
+            if terminated or truncated:
+                break
+        self._reset_obs = False
+        self.elapsed_steps += 1
+        if self.max_episode_steps is not None and self.elapsed_steps >= self.max_episode_steps:
+            truncated = True
+        return total_reward, terminated, truncated, self.ale.lives()
+
+    def _episodic_reset(self, **kwargs):
+        """Reset of EpisodicLifeEnv."""
+        if not self.episode_life or self.was_real_done or self.kill_on_life_loss:
+            lives = self._noop_reset(**kwargs)
+        else:
+            _, _, _, lives = self._skip_step(0)
+        self.lives = lives
+        return lives
+
+    def _episodic_step(self, action):
+        """Step of EpisodicLifeEnv."""
+        reward, terminated, truncated, lives = self._skip_step(action)
+        if self.episode_life:
+            self.was_real_done = terminated or truncated
+            if self.was_real_done:
+                lives = 0
+            if 0 < lives < self.lives:
+                terminated = True
+            self.lives = lives
+        return reward, terminated, truncated, lives
+
+    def _advance(self, frames):
+        if self._pos + frames >= len(self._stack):
+            keep = self.n_frames - 1
+            self._stack[:keep] = self._stack[self._pos - keep + 1 : self._pos + 1]
+            self._pos = keep - 1
+        self._pos += frames
+
+    def _observe(self):
+        """Warp the current screen into the newest frame of the stack, as WarpFrame."""
+        if self._reset_obs:
+            screen = self._reset_screen
+        elif self.skip == 1:
+            screen = self._screens[1]
+        else:
+            screen = np.maximum(self._screens[0], self._screens[1], out=self._max_screen)
+        if not self.ale_grayscale:
+            screen = cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY, dst=self._gray)
+        cv2.resize(
+            screen,
+            (self.width, self.height),
+            dst=self._stack[self._pos],
+            interpolation=cv2.INTER_AREA,
+        )
+
+    def _get_ob(self):
+        obs = self._stack[self._pos - self.n_frames + 1 : self._pos + 1].transpose(1, 2, 0)
+        obs.flags.writeable = False
+        return obs
+
+    def reset(self, **kwargs):
+        self._advance(self.n_frames)
+        lives = self._episodic_reset(**kwargs)
+        if self.fire_reset:
+            # as FireResetEnv, the observation and info are the ones of the last fire step
+            _, terminated, truncated, lives = self._episodic_step(1)
+            if terminated or truncated:
+                self._episodic_reset(**kwargs)
+            _, terminated, truncated, lives = self._episodic_step(2)
+            self._observe()
+            if terminated or truncated:
+                self._episodic_reset(**kwargs)
+        else:
+            self._observe()
+        self._stack[self._pos - self.n_frames + 1 : self._pos] = self._stack[self._pos]
+        info = {"lives": lives}
+        if self.clip_rewards:
+            info["original_reward"] = 0
+        return self._get_ob(), info
+
+    def step(self, action):
+        self._advance(1)
+        reward, terminated, truncated, lives = self._episodic_step(action)
+        self._observe()
+        info = {"lives": lives}
+        if self.clip_rewards:
+            info["original_reward"] = reward
+            reward = np.sign(reward)
+        return self._get_ob(), reward, terminated, truncated, info
+
+
 def make_atari(env_id, max_episode_steps=None):
     env = gym.make(env_id, render_mode="rgb_array")
     env = NoopResetEnv(env, noop_max=30)
@@ -321,8 +525,12 @@ def wrap_deepmind(
     return env
 
 
-def make_wrap_atari(env_id="Breakout-v0", clip_rewards=False):
+def make_wrap_atari(env_id="Breakout-v0", clip_rewards=False, fused=True):
     # env = gym.make(env_id)
+    if fused:
+        env = gym.make(env_id, render_mode="rgb_array")
+        skip = 4 if "NoFrameskip" in env.spec.id else 1
+        return FusedAtariEnv(env, skip=skip, clip_rewards=clip_rewards)
     env = make_atari(env_id)
     env = gym.wrappers.TimeLimit(env, max_episode_steps=10000)
     env = wrap_deepmind(env, clip_rewards=clip_rewards, frame_stack=True)
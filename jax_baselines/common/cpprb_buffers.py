@@ -1,79 +1,186 @@
+import io
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
 import cpprb
 import numpy as np
 
+from jax_baselines.common.replay_snapshot import load_snapshot, save_snapshot
+
 
 class EpochBuffer(object):
     def __init__(self, epoch_size: int, observation_space: list, worker_size=1, action_space=1):
+        """Rollout storage of on-policy agents.
+
+        Transitions are written by slice into contiguous time-major (epoch_size, worker_size, ...)
+        arrays, and get_buffer returns them already stacked, so the jitted update always sees
+        the same shapes. Two stores are kept and swapped by get_buffer, so the arrays handed to
+        the update are not written by the next rollout while the update may still read them.
+
+        :param epoch_size: (int) number of steps of every worker per rollout
+        :param observation_space: (list) shapes of the observations
+        :param worker_size: (int) number of environments stepped together
+        :param action_space: (int or list) shape of the action
+        """
         self.epoch_size = epoch_size
-        self.obsdict = dict(
-            (
-                "obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
-            )
-            for idx, o in enumerate(observation_space)
-        )
-        self.nextobsdict = dict(
-            (
-                "next_obs{}".format(idx),
-                {"shape": o, "dtype": np.uint8}
-                if len(o) >= 3
-                else {"shape": o, "dtype": np.float32},
-            )
-            for idx, o in enumerate(observation_space)
-        )
-        self.obscompress = None
         self.worker_size = worker_size
-        self.local_buffers = [
-            cpprb.ReplayBuffer(
-                epoch_size,
-                env_dict={
-                    **self.obsdict,
-                    "action": {"shape": action_space},
-                    "reward": {},
-                    **self.nextobsdict,
-                    "terminated": {},
-                    "truncated": {},
-                },
-            )
-            for _ in range(worker_size)
-        ]
+        self.observation_space = observation_space
+        self.action_space = list(np.atleast_1d(action_space))
+        self.stores = [self.make_store(), self.make_store()]
+        self.store_idx = 0
+        self.step = 0
 
-    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated):
-        for w in range(self.worker_size):
-            obsdict = dict(zip(self.obsdict.keys(), [o[w] for o in obs_t]))
-            nextobsdict = dict(zip(self.nextobsdict.keys(), [no[w] for no in nxtobs_t]))
-            self.local_buffers[w].add(
-                **obsdict,
-                action=action[w],
-                reward=reward[w],
-                **nextobsdict,
-                terminated=terminated[w],
-                truncated=truncated[w],
-            )
-            if terminated[w] or truncated[w]:
-                self.local_buffers[w].on_episode_end()
+    def make_store(self):
+        shape = (self.epoch_size, self.worker_size)
+        obs_dtypes = [np.uint8 if len(o) >= 3 else np.float32 for o in self.observation_space]
+        return {
+            "obses": [
+                np.zeros(shape + tuple(o), dtype=d)
+                for o, d in zip(self.observation_space, obs_dtypes)
+            ],
+            "actions": np.zeros(shape + tuple(self.action_space), dtype=np.float32),
+            "rewards": np.zeros(shape + (1,), dtype=np.float32),
+            "nxtobses": [
+                np.zeros(shape + tuple(o), dtype=d)
+                for o, d in zip(self.observation_space, obs_dtypes)
+            ],
+            "terminateds": np.zeros(shape + (1,), dtype=np.float32),
+            "truncateds": np.zeros(shape + (1,), dtype=np.float32),
+        }
+
+    def add(
+        self, obs_t, action, reward, nxtobs_t, terminated, truncated, final_obs=None, done_idx=None
+    ):
+        store = self.stores[self.store_idx]
+        t = self.step
+        for o, buffer in zip(obs_t, store["obses"]):
+            buffer[t] = o
+        for no, buffer in zip(nxtobs_t, store["nxtobses"]):
+            buffer[t] = no
+        if final_obs is not None:
+            # the finished workers end on their final obs, not on the reset obs of next_obs
+            for fo, buffer in zip(final_obs, store["nxtobses"]):
+                buffer[t][done_idx] = fo
+        store["actions"][t] = np.reshape(action, store["actions"].shape[1:])
+        store["rewards"][t, :, 0] = reward
+        store["terminateds"][t, :, 0] = terminated
+        store["truncateds"][t, :, 0] = truncated
+        self.step += 1
 
     def get_buffer(self):
-        transitions = {
-            "obses": [],
-            "actions": [],
-            "rewards": [],
-            "nxtobses": [],
-            "terminateds": [],
-            "truncateds": [],
-        }
-        for w in range(self.worker_size):
-            trans = self.local_buffers[w].get_all_transitions()
-            transitions["obses"].append([trans[o] for o in self.obsdict.keys()])
-            transitions["actions"].append(trans["action"])
-            transitions["rewards"].append(trans["reward"])
-            transitions["nxtobses"].append([trans[o] for o in self.nextobsdict.keys()])
-            transitions["terminateds"].append(trans["terminated"])
-            transitions["truncateds"].append(trans["truncated"])
-            self.local_buffers[w].clear()
-        return transitions
+        store = self.stores[self.store_idx]
+        if self.step < self.epoch_size:
+            store = {
+                k: [o[: self.step] for o in v] if isinstance(v, list) else v[: self.step]
+                for k, v in store.items()
+            }
+        self.store_idx = 1 - self.store_idx
+        self.step = 0
+        return store
+
+
+def final_next_obs(nxtobs_t, final_obs=None, done_idx=None, rows=None):
+    """Next obs of rows of a batched step, with the final obs of the finished environments.
+
+    The vectorized envs return the next obs as they are, the reset obs for the environments
+    that finished, and the final obs of those apart. The batch is only copied when one of the
+    returned rows finished.
+
+    :param nxtobs_t: (list) batched next obs
+    :param final_obs: (list) final obs of the rows of done_idx, in row order, None if the next
+        obs are already the final ones
+    :param done_idx: (np.ndarray) mask of the finished rows
+    :param rows: (np.ndarray) rows to return, all of them if None
+    :return: (list) the next obs of the rows
+    """
+    if rows is not None:
+        nxtobs_t = [no[rows] for no in nxtobs_t]
+    if final_obs is None or not np.any(done_idx):
+        return nxtobs_t
+    if rows is None:
+        rows = np.arange(len(done_idx))
+        nxtobs_t = [np.copy(no) for no in nxtobs_t]
+    done_rows = np.asarray(done_idx)[rows]
+    final_rows = (np.cumsum(done_idx) - 1)[rows[done_rows]]
+    for no, fo in zip(nxtobs_t, final_obs):
+        no[done_rows] = fo[final_rows]
+    return nxtobs_t
+
+
+class NstepAccumulator(object):
+    def __init__(self, worker_size: int, n_step: int, gamma: float, obsdict: dict, action_space=1):
+        """Batched n-step return accumulator for vectorized environments.
+
+        Keeps a (worker, n_step, ...) ring of pending transitions and emits every completed
+        n-step transition of all workers at once, so the global buffer gets one bulk insert per
+        environment step instead of one Python call per worker.
+
+        :param worker_size: (int) number of environments stepped together
+        :param n_step: (int) length of the n-step return
+        :param gamma: (float) discount factor
+        :param obsdict: (dict) cpprb style observation dict, {"obs0": {"shape", "dtype"}, ...}
+        :param action_space: (int or list) shape of a single action
+        """
+        if isinstance(action_space, int):
+            action_space = (action_space,)
+        self.worker_size = worker_size
+        self.n_step = n_step
+        self.gamma = gamma
+        self.obs = dict(
+            (k, np.zeros((worker_size, n_step, *v["shape"]), dtype=v["dtype"]))
+            for k, v in obsdict.items()
+        )
+        self.action = np.zeros((worker_size, n_step, *action_space), dtype=np.float32)
+        self.reward = np.zeros((worker_size, n_step), dtype=np.float32)
+        self.age = np.zeros((worker_size, n_step), dtype=np.int32)
+        self.valid = np.zeros((worker_size, n_step), dtype=np.bool_)
+        self.discounts = np.power(gamma, np.arange(n_step + 1), dtype=np.float32)
+        self.ptr = np.zeros(worker_size, dtype=np.int32)
+
+    def add(self, obs_t, action, reward, terminated, truncated, workers=None):
+        """Push one batched step and pop every n-step transition completed by it.
+
+        :param workers: (np.ndarray) workers of the rows of the step, all workers if None
+        :return: (tuple) rows of the step that completed a transition, and the obs, action,
+            n-step reward and done of the completed transitions; their next_obs is the current
+            next_obs of those rows
+        """
+        if workers is None:
+            workers = np.arange(self.worker_size)
+        batch_size = len(workers)
+        slot = self.ptr[workers]
+        for k, o in zip(self.obs.keys(), obs_t):
+            self.obs[k][workers, slot] = o
+        self.action[workers, slot] = np.reshape(action, (batch_size, *self.action.shape[2:]))
+        self.reward[workers, slot] = 0.0
+        self.age[workers, slot] = 0
+        self.valid[workers, slot] = True
+
+        valid = self.valid[workers]
+        age = self.age[workers]
+        reward = np.reshape(reward, (batch_size, 1))
+        self.reward[workers] += np.where(valid, self.discounts[age] * reward, 0.0)
+        age += valid
+        self.age[workers] = age
+
+        terminated = np.reshape(terminated, (batch_size,)).astype(np.bool_)
+        done = np.logical_or(terminated, np.reshape(truncated, (batch_size,)))
+        emit = np.logical_and(valid, (age >= self.n_step) | done[:, None])
+        rows, slots = np.nonzero(emit)
+        self.valid[workers[rows], slots] = False
+        self.ptr[workers] = (slot + 1) % self.n_step
+        return (
+            rows,
+            [o[workers[rows], slots] for o in self.obs.values()],
+            self.action[workers[rows], slots],
+            self.reward[workers[rows], slots],
+            terminated[rows],
+        )
+
+    def clear(self):
+        self.valid[:] = False
+        self.ptr[:] = 0
 
 
 class ReplayBuffer(object):
@@ -148,8 +255,20 @@ class ReplayBuffer(object):
     def is_full(self) -> int:
         return len(self) == self.max_size
 
-    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
         obsdict = dict(zip(self.obsdict.keys(), obs_t))
+        nxtobs_t = final_next_obs(nxtobs_t, final_obs, done_idx)
         nextobsdict = dict(zip(self.nextobsdict.keys(), nxtobs_t))
         self.buffer.add(**obsdict, action=action, reward=reward, **nextobsdict, done=terminated)
 
@@ -181,6 +300,54 @@ class ReplayBuffer(object):
     def clear(self):
         self.buffer.clear()
 
+    def snapshot(self):
+        """Copy the stored transitions out of the buffer, oldest first.
+
+        :return: (tuple) the transition arrays and the buffer state
+        """
+        stored = self.buffer.get_stored_size()
+        # once the buffer is full, the oldest transition is the one at the write pointer
+        shift = self.buffer.get_next_index() if stored == self.max_size else 0
+        arrays = dict(
+            (k, np.roll(v, -shift, axis=0)) for k, v in self.buffer.get_all_transitions().items()
+        )
+        return arrays, {"stored_size": stored, "next_index": self.buffer.get_next_index()}
+
+    def restore(self, arrays, state):
+        """Refill the buffer with the transitions of snapshot, oldest first.
+
+        The restored buffer overwrites the same transition next as the saved one, but stores it
+        at a rotated position, so indexes sampled before the snapshot are not valid after it.
+        """
+        self.buffer.clear()
+        with io.BytesIO() as f:
+            # cpprb's own transition file, so an Nstep buffer stores the n-step transitions as is
+            np.savez(
+                f,
+                safe=True,
+                version=1,
+                data=arrays,
+                Nstep=self.buffer.is_Nstep(),
+                cache=None,
+                next_of=None,
+            )
+            f.seek(0)
+            self.buffer.load_transitions(f)
+
+    def save_replay(self, path, compress=False, background=True):
+        """Write a snapshot of the buffer to the directory path.
+
+        :param path: (str) snapshot directory
+        :param compress: (bool) compress the transition chunks
+        :param background: (bool) write on a background thread, the transitions are copied first
+        :return: (threading.Thread) the writer thread, None if written in the foreground
+        """
+        arrays, state = self.snapshot()
+        return save_snapshot(path, arrays, state, compress, background=background)
+
+    def load_replay(self, path):
+        self.restore(*load_snapshot(path))
+
 
 class NstepReplayBuffer(ReplayBuffer):
     def __init__(
@@ -241,20 +408,9 @@ class NstepReplayBuffer(ReplayBuffer):
                 next_of=self.obscompress,
                 stack_compress=self.obscompress,
             )
-            self.local_buffers = [
-                cpprb.ReplayBuffer(
-                    2000,
-                    env_dict={
-                        **self.obsdict,
-                        "action": {"shape": action_space},
-                        "reward": {},
-                        **self.nextobsdict,
-                        "done": {},
-                    },
-                    Nstep=n_s,
-                )
-                for _ in range(worker_size)
-            ]
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, action_space
+            )
             self.add = self.multiworker_add
         else:
             self.buffer = cpprb.ReplayBuffer(
@@ -271,29 +427,100 @@ class NstepReplayBuffer(ReplayBuffer):
                 stack_compress=self.obscompress,
             )
 
-    def add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
-        super().add(obs_t, action, reward, nxtobs_t, terminated, truncated)
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        super().add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
         if terminated or truncated:
             self.buffer.on_episode_end()
 
-    def multiworker_add(self, obs_t, action, reward, nxtobs_t, terminated, truncated=False):
-        for w in range(self.worker_size):
-            obsdict = dict(zip(self.obsdict.keys(), [o[w] for o in obs_t]))
-            nextobsdict = dict(zip(self.nextobsdict.keys(), [no[w] for no in nxtobs_t]))
-            self.local_buffers[w].add(
-                **obsdict,
-                action=action[w],
-                reward=reward[w],
-                **nextobsdict,
-                done=terminated[w],
-            )
-            if terminated[w] or truncated[w]:
-                self.local_buffers[w].on_episode_end()
-                self.buffer.add(**self.local_buffers[w].get_all_transitions())
-                self.local_buffers[w].clear()
+    def multiworker_add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        workers, obs, action, reward, done = self.nstep_accumulator.add(
+            obs_t, action, reward, terminated, truncated, workers
+        )
+        if len(workers) == 0:
+            return
+        self.buffer.add(
+            **dict(zip(self.obsdict.keys(), obs)),
+            action=action,
+            reward=reward,
+            **dict(
+                zip(
+                    self.nextobsdict.keys(),
+                    final_next_obs(nxtobs_t, final_obs, done_idx, workers),
+                )
+            ),
+            done=done,
+        )
+
+    def restore(self, arrays, state):
+        super().restore(arrays, state)
+        # the pending n-step transitions belong to episodes the restarted run does not continue
+        if self.worker_size > 1:
+            self.nstep_accumulator.clear()
+
+
+class PriorityTrackingMixin(object):
+    """Keeps the raw priorities of a cpprb prioritized buffer in self.priorities, which cpprb does
+    not expose, so the snapshots of ReplayBuffer carry them. The buffer using it sets
+    self.priorities and calls track_priorities after its adds."""
+
+    def update_priorities(self, indexes, priorities):
+        priorities = np.reshape(np.asarray(priorities, dtype=np.float64), (-1,))
+        self.buffer.update_priorities(indexes, priorities)
+        self.priorities[indexes] = priorities
+
+    def track_priorities(self, start, stored, added):
+        """Give the transitions written by an add the max priority.
 
+        :param start: (int) next index of the buffer before the add
+        :param stored: (int) stored size of the buffer before the add
+        :param added: (int) number of transitions given to the add
+        """
+        written = (self.buffer.get_next_index() - start) % self.max_size
+        # the next index is back at start when a whole buffer is written
+        if written == 0 and (self.buffer.get_stored_size() > stored or added >= self.max_size):
+            written = self.max_size
+        slots = (start + np.arange(written)) % self.max_size
+        self.priorities[slots] = self.buffer.get_max_priority()
 
-class PrioritizedReplayBuffer(ReplayBuffer):
+    def snapshot(self):
+        arrays, state = super().snapshot()
+        stored = state["stored_size"]
+        shift = state["next_index"] if stored == self.max_size else 0
+        arrays["priorities"] = np.roll(self.priorities[:stored], -shift)
+        return arrays, state
+
+    def restore(self, arrays, state):
+        priorities = arrays.pop("priorities")
+        super().restore(arrays, state)
+        self.priorities[:] = 0.0
+        self.update_priorities(np.arange(len(priorities)), priorities)
+
+
+class PrioritizedReplayBuffer(PriorityTrackingMixin, ReplayBuffer):
     def __init__(
         self,
         size: int,
@@ -344,6 +571,26 @@ class PrioritizedReplayBuffer(ReplayBuffer):
             next_of=self.obscompress,
             stack_compress=self.obscompress,
         )
+        # raw priorities of the stored transitions, cpprb does not expose them for snapshots
+        self.priorities = np.zeros(size, dtype=np.float64)
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        start, stored = self.buffer.get_next_index(), self.buffer.get_stored_size()
+        super().add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
+        self.track_priorities(start, stored, np.size(reward))
 
     def sample(self, batch_size: int, beta=0.5):
         smpl = self.buffer.sample(batch_size, beta)
@@ -357,11 +604,8 @@ class PrioritizedReplayBuffer(ReplayBuffer):
             "indexes": smpl["indexes"],
         }
 
-    def update_priorities(self, indexes, priorities):
-        self.buffer.update_priorities(indexes, priorities)
-
 
-class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
+class PrioritizedNstepReplayBuffer(PriorityTrackingMixin, NstepReplayBuffer):
     def __init__(
         self,
         size: int,
@@ -424,20 +668,9 @@ class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
                 next_of=self.obscompress,
                 stack_compress=self.obscompress,
             )
-            self.local_buffers = [
-                cpprb.ReplayBuffer(
-                    2000,
-                    env_dict={
-                        **self.obsdict,
-                        "action": {"shape": action_space},
-                        "reward": {},
-                        **self.nextobsdict,
-                        "done": {},
-                    },
-                    Nstep=n_s,
-                )
-                for _ in range(worker_size)
-            ]
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, action_space
+            )
             self.add = self.multiworker_add
         else:
             self.buffer = cpprb.PrioritizedReplayBuffer(
@@ -455,6 +688,44 @@ class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
                 next_of=self.obscompress,
                 stack_compress=self.obscompress,
             )
+        # raw priorities of the stored transitions, cpprb does not expose them for snapshots
+        self.priorities = np.zeros(size, dtype=np.float64)
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        start, stored = self.buffer.get_next_index(), self.buffer.get_stored_size()
+        super().add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
+        self.track_priorities(start, stored, np.size(reward))
+
+    def multiworker_add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        start, stored = self.buffer.get_next_index(), self.buffer.get_stored_size()
+        super().multiworker_add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
+        self.track_priorities(start, stored, np.size(reward))
 
     def sample(self, batch_size: int, beta=0.5):
         smpl = self.buffer.sample(batch_size, beta)
@@ -468,9 +739,6 @@ class PrioritizedNstepReplayBuffer(NstepReplayBuffer):
             "indexes": smpl["indexes"],
         }
 
-    def update_priorities(self, indexes, priorities):
-        self.buffer.update_priorities(indexes, priorities)
-
 
 class MultiPrioritizedReplayBuffer:
     def __init__(
@@ -529,11 +797,16 @@ class MultiPrioritizedReplayBuffer:
                 "next": list(self.nextobsdict.keys()),
             }
 
+        self.alpha = alpha
+        self.eps = eps
+        self.make_buffer(manager)
+
+    def make_buffer(self, manager):
         self.buffer = cpprb.MPPrioritizedReplayBuffer(
-            size,
+            self.max_size,
             env_dict=self.env_dict,
-            alpha=alpha,
-            eps=eps,
+            alpha=self.alpha,
+            eps=self.eps,
             ctx=manager,
             backend="SharedMemory",
         )
@@ -541,7 +814,7 @@ class MultiPrioritizedReplayBuffer:
     def __len__(self):
         return self.buffer.get_stored_size()
 
-    def buffer_info(self):
+    def buffer_info(self, worker_idx=0):
         return self.buffer, self.env_dict, self.n_s
 
     def sample(self, batch_size: int, beta=0.5):
@@ -558,3 +831,254 @@ class MultiPrioritizedReplayBuffer:
 
     def update_priorities(self, indexes, priorities):
         self.buffer.update_priorities(indexes, priorities)
+
+    def save_replay(self, path, compress=False, background=True):
+        """Write a snapshot of the stored transitions to the directory path.
+
+        The workers add to the shared buffer from other processes, so the priorities are not
+        tracked and the restored transitions start with the max priority.
+        """
+        stored = self.buffer.get_stored_size()
+        shift = self.buffer.get_next_index() if stored == self.max_size else 0
+        arrays = dict(
+            (k, np.roll(v, -shift, axis=0)) for k, v in self.buffer.get_all_transitions().items()
+        )
+        state = {"stored_size": stored, "next_index": self.buffer.get_next_index()}
+        return save_snapshot(path, arrays, state, compress, background=background)
+
+    def load_replay(self, path):
+        arrays, state = load_snapshot(path)
+        self.buffer.clear()
+        self.buffer.add(**arrays)
+
+    def close(self):
+        pass
+
+
+class PrioritizedReplayShard(object):
+    def __init__(self, size: int, env_dict: dict, alpha: float, eps=1e-4, manager=None):
+        """One shard of ShardedPrioritizedReplayBuffer, a cpprb MPPrioritizedReplayBuffer with a
+        shared memory copy of its priorities so the learner can read the shard's total priority.
+
+        :param size: (int) max number of transitions in the shard
+        :param env_dict: (dict) cpprb env_dict of the transitions
+        :param alpha: (float) how much prioritization is used
+        :param eps: (float) small value added to the priorities
+        :param manager: (multiprocessing.Manager) context of the shared buffer
+        """
+        self.size = size
+        self.alpha = alpha
+        self.eps = eps
+        self.buffer = cpprb.MPPrioritizedReplayBuffer(
+            size,
+            env_dict=env_dict,
+            alpha=alpha,
+            eps=eps,
+            ctx=manager,
+            backend="SharedMemory",
+        )
+        # priorities ** alpha of every slot, followed by the number of inserted transitions
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * (size + 1))
+        self._attach()
+        self.priorities[:] = 0.0
+        self.inserted[:] = 0.0
+
+    def _attach(self):
+        self.priorities = np.ndarray((self.size,), dtype=np.float64, buffer=self.shm.buf)
+        self.inserted = np.ndarray(
+            (1,), dtype=np.float64, buffer=self.shm.buf, offset=8 * self.size
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["priorities"], state["inserted"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the shard is owned by the learner process, workers only attach to it
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self._attach()
+
+    def __len__(self):
+        return self.buffer.get_stored_size()
+
+    def add(self, priorities, **kwargs):
+        priorities = np.reshape(np.asarray(priorities, dtype=np.float64), (-1,))
+        start = self.buffer.add(**kwargs, priorities=priorities)
+        self.priorities[(start + np.arange(len(priorities))) % self.size] = np.power(
+            priorities + self.eps, self.alpha
+        )
+        # several workers can share a shard, a lost count only affects the throughput report
+        self.inserted[0] += len(priorities)
+        return start
+
+    def total(self):
+        return np.sum(self.priorities[: len(self)])
+
+    def min(self):
+        return np.min(self.priorities[: len(self)])
+
+    def sample(self, batch_size: int, beta=0.5):
+        return self.buffer.sample(batch_size, beta)
+
+    def update_priorities(self, indexes, priorities):
+        priorities = np.reshape(np.asarray(priorities, dtype=np.float64), (-1,))
+        self.buffer.update_priorities(indexes, priorities)
+        self.priorities[indexes] = np.power(priorities + self.eps, self.alpha)
+
+    def snapshot(self):
+        stored = len(self)
+        shift = self.buffer.get_next_index() if stored == self.size else 0
+        arrays = dict(
+            (k, np.roll(v, -shift, axis=0)) for k, v in self.buffer.get_all_transitions().items()
+        )
+        arrays["priorities"] = np.roll(self.priorities[:stored], -shift)
+        return arrays, {"stored_size": stored, "next_index": self.buffer.get_next_index()}
+
+    def restore(self, arrays, state):
+        # the shard keeps priorities ** alpha, add takes the raw priorities
+        priorities = np.power(arrays.pop("priorities"), 1.0 / self.alpha) - self.eps
+        self.buffer.clear()
+        self.priorities[:] = 0.0
+        self.add(np.maximum(priorities, 0.0), **arrays)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ShardedPrioritizedReplayBuffer(MultiPrioritizedReplayBuffer):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        n_step=1,
+        gamma=0.99,
+        manager=None,
+        compress_memory=False,
+        eps=1e-4,
+        num_shards=4,
+    ):
+        """Prioritized replay split into independent shards, so workers adding to different
+        shards and the learner sampling do not wait on a single lock.
+
+        Workers are assigned to shards by their index. The learner draws a stratified sample
+        over the shards in proportion to their total priority and routes the priority updates
+        back to the shard owning each transition.
+
+        :param num_shards: (int) number of shards, the size is split evenly between them
+        """
+        self.num_shards = num_shards
+        self.shard_size = int(np.ceil(size / num_shards))
+        super().__init__(
+            size,
+            observation_space,
+            alpha,
+            action_space,
+            n_step,
+            gamma,
+            manager,
+            compress_memory,
+            eps,
+        )
+
+    def make_buffer(self, manager):
+        self.shards = [
+            PrioritizedReplayShard(self.shard_size, self.env_dict, self.alpha, self.eps, manager)
+            for _ in range(self.num_shards)
+        ]
+        self.sampled = np.zeros(self.num_shards)
+        self.sample_time = np.zeros(self.num_shards)
+        self.last_report = (time.time(), np.zeros(self.num_shards))
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def buffer_info(self, worker_idx=0):
+        return self.shards[worker_idx % self.num_shards], self.env_dict, self.n_s
+
+    def sample(self, batch_size: int, beta=0.5):
+        totals = np.array([shard.total() for shard in self.shards])
+        cumsum = np.cumsum(totals)
+        mass = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * cumsum[-1]
+        counts = np.bincount(
+            np.searchsorted(cumsum, mass / batch_size, side="right").clip(max=self.num_shards - 1),
+            minlength=self.num_shards,
+        )
+        # cpprb normalizes the weights by the shard's min priority, rescale them to the min
+        # priority of all shards
+        mins = np.array([shard.min() if len(shard) > 0 else np.inf for shard in self.shards])
+        smpls = []
+        for idx, (shard, count) in enumerate(zip(self.shards, counts)):
+            if count == 0:
+                continue
+            start = time.perf_counter()
+            smpl = shard.sample(count, beta)
+            self.sample_time[idx] += time.perf_counter() - start
+            self.sampled[idx] += count
+            smpl["weights"] = smpl["weights"] * np.power(mins[idx] / np.min(mins), -beta)
+            smpl["indexes"] = smpl["indexes"] + idx * self.shard_size
+            smpls.append(smpl)
+        smpl = dict((k, np.concatenate([s[k] for s in smpls])) for k in smpls[0])
+        return {
+            "obses": [smpl[o] for o in self.obsdict.keys()],
+            "actions": smpl["action"],
+            "rewards": smpl["reward"],
+            "nxtobses": [smpl[no] for no in self.nextobsdict.keys()],
+            "terminateds": smpl["done"],
+            "weights": smpl["weights"],
+            "indexes": smpl["indexes"],
+        }
+
+    def update_priorities(self, indexes, priorities):
+        shard_idxs, indexes = np.divmod(np.asarray(indexes), self.shard_size)
+        priorities = np.reshape(np.asarray(priorities), (-1,))
+        for idx, shard in enumerate(self.shards):
+            mask = shard_idxs == idx
+            if np.any(mask):
+                shard.update_priorities(indexes[mask], priorities[mask])
+
+    def shard_stats(self):
+        """Per shard insert and sample throughput (transitions / sec) since the last call.
+
+        Inserts are counted over wall clock time, samples over the time spent in the shard's
+        sample call.
+        """
+        now = time.time()
+        inserted = np.array([shard.inserted[0] for shard in self.shards])
+        last_time, last_inserted = self.last_report
+        insert_rate = (inserted - last_inserted) / max(now - last_time, 1e-6)
+        sample_rate = self.sampled / np.maximum(self.sample_time, 1e-6)
+        self.last_report = (now, inserted)
+        self.sampled[:] = 0
+        self.sample_time[:] = 0
+        stats = {}
+        for idx in range(self.num_shards):
+            stats[f"replay/shard{idx}/insert_per_sec"] = insert_rate[idx]
+            stats[f"replay/shard{idx}/sample_per_sec"] = sample_rate[idx]
+        return stats
+
+    def save_replay(self, path, compress=False, background=True):
+        """Write a snapshot of every shard, with its priorities, to path/shard{idx}."""
+        snapshots = [shard.snapshot() for shard in self.shards]
+
+        def write():
+            for idx, (arrays, state) in enumerate(snapshots):
+                save_snapshot(f"{path}/shard{idx}", arrays, state, compress, background=False)
+
+        if not background:
+            return write()
+        thread = threading.Thread(target=write, daemon=True)
+        thread.start()
+        return thread
+
+    def load_replay(self, path):
+        for idx, shard in enumerate(self.shards):
+            shard.restore(*load_snapshot(f"{path}/shard{idx}"))
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
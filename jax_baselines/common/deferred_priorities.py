@@ -0,0 +1,31 @@
+import jax.numpy as jnp
+import numpy as np
+
+
+class DeferredPrioritiesMixin(object):
+    """Priority updates of an agent that runs its gradient steps one at a time. With
+    self.deferred_priorities the new priorities stay on the device in self.pending_priorities until
+    flush_priorities, which merges the ones of all the gradient steps into one buffer update."""
+
+    def update_priorities(self, indexes, priorities):
+        """Send new priorities to the replay buffer, with deferred_priorities keep them on the
+        device until flush_priorities.
+        """
+        if self.deferred_priorities:
+            self.pending_priorities.append((indexes, priorities))
+        else:
+            self.replay_buffer.update_priorities(indexes, priorities)
+
+    def flush_priorities(self):
+        """Merge the deferred priorities of the last gradient steps into one buffer update, with a
+        single device to host copy. The last priority of a duplicated index wins.
+        """
+        if len(self.pending_priorities) == 0:
+            return
+        indexes = np.concatenate([np.asarray(i).reshape(-1) for i, _ in self.pending_priorities])
+        priorities = np.asarray(
+            jnp.concatenate([jnp.reshape(p, (-1,)) for _, p in self.pending_priorities])
+        )
+        self.pending_priorities = []
+        indexes, last = np.unique(indexes[::-1], return_index=True)
+        self.replay_buffer.update_priorities(indexes, priorities[::-1][last])
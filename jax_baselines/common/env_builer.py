@@ -1,15 +1,40 @@
+import multiprocessing as mp
 from abc import ABC, abstractmethod
+from functools import partial
+from multiprocessing import shared_memory
 
 import gymnasium as gym
 import numpy as np
 import ray
 from gymnasium import spaces
 
+from jax_baselines.common.frame_transport import newest_frames, push_frames
 
-def get_env_builder(env_name, **kwargs):
+
+def get_env_builder(
+    env_name, vec_env="ray", envs_per_worker=1, async_workers=0, frame_transport=0, **kwargs
+):
     def env_builder(worker=1, render_mode=None):
+        if vec_env == "jax":
+            from jax_baselines.common.jax_envs import JaxGymEnv, JaxVectorizedEnv
+
+            if worker > 1:
+                return JaxVectorizedEnv(env_name, worker_num=worker)
+            return JaxGymEnv(env_name)
         if worker > 1:
-            return rayVectorizedGymEnv(env_name, worker_num=worker)
+            if vec_env == "subproc":
+                return subprocVectorizedGymEnv(env_name, worker_num=worker)
+            if vec_env in ["gym_sync", "gym_async"]:
+                return gymnasiumVectorizedEnv(
+                    env_name, worker_num=worker, asynchronous=vec_env == "gym_async"
+                )
+            return rayVectorizedGymEnv(
+                env_name,
+                worker_num=worker,
+                envs_per_worker=envs_per_worker,
+                async_workers=async_workers,
+                frame_transport=frame_transport,
+            )
         else:
             from jax_baselines.common.atari_wrappers import (
                 get_env_type,
@@ -65,6 +90,13 @@ class Env(ABC):
 
     @abstractmethod
     def get_result(self):
+        """Results of the last step.
+
+        :return: (tuple) next_obs, final_obs, done_idx, rewards, terminateds, truncateds and
+            infos. next_obs are the stacked obs the environments continue from, so a finished
+            environment gives its reset obs there, and its final obs in final_obs, one per True
+            of the done_idx mask
+        """
         pass
 
     @abstractmethod
@@ -85,84 +117,436 @@ class VectorizedEnv(Env):
 
 
 class rayVectorizedGymEnv(VectorizedEnv):
-    def __init__(self, env_id, worker_num=8, render=False):
-        ray.init(num_cpus=worker_num)
+    def __init__(
+        self,
+        env_id,
+        worker_num=8,
+        render=False,
+        envs_per_worker=1,
+        async_workers=0,
+        frame_transport=0,
+    ):
+        """Vectorized env of ray actors.
+
+        worker_num environments are split over ceil(worker_num / envs_per_worker) actors, and
+        every actor steps its environments in a local loop and returns them as one stacked
+        batch, so a step costs one remote call per actor instead of one per environment.
+
+        With async_workers > 0, get_result returns the results of the first async_workers actors
+        to finish, and the others keep stepping in the background. current_obs and step then
+        cover only the environments of env_ids, the ones returned by the last get_result, and
+        result_obs and result_actions hold the obs and actions of the returned transitions.
+
+        With frame_transport > 0, the actors send only the newest frame of the channel last frame
+        stacks of image observations, and the whole stack of a reset obs. The stacks are rolled
+        here from the obs the environments were stepped with.
+
+        :param env_id: (str) gym or atari environment id
+        :param worker_num: (int) total number of environments
+        :param render: (bool) render the first environment
+        :param envs_per_worker: (int) environments stepped by each ray actor
+        :param async_workers: (int) actors waited for by get_result, all of them if 0
+        :param frame_transport: (int) number of frames stacked in the image observations sent
+            one frame at a time, whole observations are sent if 0
+        """
+        num_actors = int(np.ceil(worker_num / envs_per_worker))
+        ray.init(num_cpus=num_actors)
         self.env_id = env_id
         self.worker_num = worker_num
+        self.envs_per_worker = envs_per_worker
+        self.async_workers = min(async_workers, num_actors)
+        self.actor_envs = np.array_split(np.arange(worker_num), num_actors)
         self.workers = [
-            gymRayworker.remote(env_id, render=(w == 0) if render else False)
-            for w in range(worker_num)
+            gymRayworker.remote(
+                env_id,
+                render=(w == 0) if render else False,
+                num_envs=len(e),
+                frame_transport=frame_transport,
+            )
+            for w, e in enumerate(self.actor_envs)
         ]
         self.env_info = ray.get(self.workers[0].get_info.remote())
+        if len(self.env_info["observation_space"].shape) < 3:
+            frame_transport = 0
+        self.frame_transport = frame_transport
         resets = ray.get([w.get_reset.remote() for w in self.workers])
-        obs_list, self.reset_info = zip(*resets)
-        self.obs = np.stack(obs_list, axis=0)
+        obs_list, reset_info = zip(*resets)
+        self.reset_info = sum(reset_info, ())
+        self.obs = np.concatenate(obs_list, axis=0)
+        self.ready = list(range(num_actors))
+        self.env_ids = np.arange(worker_num)
+        self.pending = {}
+        self.step_obs = np.copy(self.obs)
+        self.step_actions = None
 
     def get_info(self):
         return self.env_info
 
     def current_obs(self):
-        return self.obs
+        if len(self.env_ids) == self.worker_num:
+            return self.obs
+        return self.obs[self.env_ids]
 
     def step(self, actions):
-        self.steps = [w.step.remote(a) for w, a in zip(self.workers, actions)]
+        actions = np.asarray(actions)
+        if self.async_workers:
+            if self.step_actions is None:
+                self.step_actions = np.zeros((self.worker_num, *actions.shape[1:]), actions.dtype)
+            self.step_obs[self.env_ids] = self.obs[self.env_ids]
+            self.step_actions[self.env_ids] = actions
+        splits = np.cumsum([len(self.actor_envs[w]) for w in self.ready])[:-1]
+        for w, a in zip(self.ready, np.split(actions, splits)):
+            self.pending[self.workers[w].step.remote(a)] = w
 
     def get_result(self):
-        steps = ray.get(self.steps)
+        refs = list(self.pending)
+        if self.async_workers:
+            refs, _ = ray.wait(refs, num_returns=self.async_workers)
+        actors = [self.pending.pop(r) for r in refs]
+        order = np.argsort(actors)
+        self.ready = [actors[i] for i in order]
+        steps = ray.get([refs[i] for i in order])
+        self.env_ids = np.concatenate([self.actor_envs[w] for w in self.ready])
         next_obs, end_states, rewards, terminateds, truncateds, dones, infos = zip(*steps)
-        next_obs = np.stack(next_obs, axis=0)
-        rewards = np.stack(rewards, axis=0)
-        terminateds = np.stack(terminateds, axis=0)
-        truncateds = np.stack(truncateds, axis=0)
-        if any(dones):
-            self.obs = np.copy(next_obs)
-            for idx, done in enumerate(dones):
-                if done:
-                    next_obs[idx] = end_states[idx]
+        next_obs = np.concatenate(next_obs, axis=0)
+        end_states = sum(end_states, ())
+        rewards = np.concatenate(rewards, axis=0)
+        terminateds = np.concatenate(terminateds, axis=0)
+        truncateds = np.concatenate(truncateds, axis=0)
+        dones = np.concatenate(dones, axis=0)
+        infos = sum(infos, ())
+        if self.frame_transport:
+            obs = self.obs if len(self.env_ids) == self.worker_num else self.obs[self.env_ids]
+            next_obs = push_frames(obs, next_obs)
+            final_obs = next_obs[dones]
+            if np.any(dones):
+                # the end states of the finished environments are their reset obs
+                next_obs[dones] = np.stack([end_states[idx] for idx in np.nonzero(dones)[0]])
+        elif np.any(dones):
+            final_obs = np.stack([end_states[idx] for idx in np.nonzero(dones)[0]], axis=0)
         else:
+            final_obs = next_obs[:0]
+        if len(self.env_ids) == self.worker_num:
             self.obs = next_obs
-        return next_obs, rewards, terminateds, truncateds, infos
+        else:
+            # the obs handed out by current_obs may still be in use, so it is not written
+            self.obs = np.copy(self.obs)
+            self.obs[self.env_ids] = next_obs
+        return next_obs, final_obs, dones, rewards, terminateds, truncateds, infos
+
+    @property
+    def result_obs(self):
+        return self.step_obs[self.env_ids]
+
+    @property
+    def result_actions(self):
+        return self.step_actions[self.env_ids]
 
     def close(self):
         ray.shutdown()
 
 
+class subprocVectorizedGymEnv(VectorizedEnv):
+    def __init__(self, env_id, worker_num=8, render=False):
+        """Vectorized env of subprocesses that share their results through shared memory.
+
+        Every worker writes its observation, reward and done flags into preallocated
+        (worker_num, ...) shared arrays, and only the action and the info dict go through its
+        pipe. current_obs and get_result return views of the shared arrays, valid until the next
+        step call. The observations are double buffered, so the obs of current_obs is not
+        overwritten by the step it is passed to, and the final obs of a finished episode is
+        only written by the worker that finished it.
+
+        The workers are started from a forkserver instead of forking the process, which may run
+        jax threads, and attach to the shared arrays by name. Like any spawned process they
+        import the main module, so a script creating the env needs a __main__ guard.
+
+        :param env_id: (str) gym or atari environment id
+        :param worker_num: (int) number of subprocesses
+        :param render: (bool) render the first worker
+        """
+        self.env_id = env_id
+        self.worker_num = worker_num
+        env = make_env(env_id)
+        self.env_info = get_env_info(env, env_id)
+        env.close()
+        observation_space = self.env_info["observation_space"]
+        self.shms = []
+        self.shared_arrays = []
+        self.obses = self._shared_array(
+            (2, worker_num) + observation_space.shape, observation_space.dtype
+        )
+        self.final_obs = self._shared_array(
+            (worker_num,) + observation_space.shape, observation_space.dtype
+        )
+        self.rewards = self._shared_array((worker_num,), np.float64)
+        self.terminateds = self._shared_array((worker_num,), np.bool_)
+        self.truncateds = self._shared_array((worker_num,), np.bool_)
+        self.slot = 0
+
+        ctx = mp.get_context("forkserver")
+        # the forkserver imports the env modules once for all the workers
+        ctx.set_forkserver_preload(["jax_baselines.common.env_builer"])
+        self.conns = []
+        self.processes = []
+        for w in range(worker_num):
+            conn, worker_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=gym_subproc_worker,
+                args=(env_id, worker_conn, w, self.shared_arrays, (w == 0) if render else False),
+                daemon=True,
+            )
+            process.start()
+            worker_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        self.reset_info = tuple(conn.recv() for conn in self.conns)
+
+    def _shared_array(self, shape, dtype):
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self.shms.append(shm)
+        self.shared_arrays.append((shm.name, shape, np.dtype(dtype)))
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def get_info(self):
+        return self.env_info
+
+    def current_obs(self):
+        return self.obses[self.slot]
+
+    def step(self, actions):
+        for conn, a in zip(self.conns, actions):
+            conn.send(("step", (a, 1 - self.slot)))
+
+    def get_result(self):
+        infos = tuple(conn.recv() for conn in self.conns)
+        self.slot = 1 - self.slot
+        dones = self.terminateds | self.truncateds
+        return (
+            self.obses[self.slot],
+            self.final_obs[dones],
+            dones,
+            self.rewards,
+            self.terminateds,
+            self.truncateds,
+            infos,
+        )
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.obses = self.final_obs = self.rewards = self.terminateds = self.truncateds = None
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+
+class gymnasiumVectorizedEnv(VectorizedEnv):
+    def __init__(self, env_id, worker_num=8, asynchronous=True):
+        """Vectorized env on gymnasium.vector, without the start-up cost of the ray runtime.
+
+        gymnasium resets a finished environment itself and reports its last observation in
+        the info dict, get_result returns those as the final_obs of the finished environments.
+
+        :param env_id: (str) gym or atari environment id
+        :param worker_num: (int) number of environments
+        :param asynchronous: (bool) step the environments in subprocesses with AsyncVectorEnv,
+            or in this process with SyncVectorEnv
+        """
+        from jax_baselines.common.atari_wrappers import get_env_type
+
+        self.env_id = env_id
+        self.worker_num = worker_num
+        self.asynchronous = asynchronous
+        kwargs = {}
+        self.final_key = "final_observation"
+        if hasattr(gym.vector, "AutoresetMode"):
+            # gymnasium >= 1.0 resets on the next step unless asked to reset in the same step
+            kwargs["autoreset_mode"] = gym.vector.AutoresetMode.SAME_STEP
+            self.final_key = "final_obs"
+        env_fns = [lambda: make_env(env_id) for _ in range(worker_num)]
+        if asynchronous:
+            self.env = gym.vector.AsyncVectorEnv(env_fns, **kwargs)
+        else:
+            self.env = gym.vector.SyncVectorEnv(env_fns, **kwargs)
+        env_type, _ = get_env_type(env_id)
+        self.env_info = {
+            "observation_space": self.env.single_observation_space,
+            "action_space": self.env.single_action_space,
+            "env_type": env_type,
+            "env_id": env_id,
+        }
+        self.discrete = not isinstance(self.env.single_action_space, spaces.Box)
+        self.obs, info = self.env.reset()
+        self.reset_info = self._split_info(info)
+
+    def _split_info(self, info):
+        infos = tuple({} for _ in range(self.worker_num))
+        for k, v in info.items():
+            if k.startswith("_") or k in [self.final_key, "final_info"]:
+                continue
+            for idx in np.nonzero(info.get("_" + k, np.ones(self.worker_num, np.bool_)))[0]:
+                infos[idx][k] = v[idx]
+        return infos
+
+    def get_info(self):
+        return self.env_info
+
+    def current_obs(self):
+        return self.obs
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if self.discrete:
+            actions = actions[:, 0]
+        if self.asynchronous:
+            self.env.step_async(actions)
+        else:
+            self.result = self.env.step(actions)
+
+    def get_result(self):
+        if self.asynchronous:
+            obs, rewards, terminateds, truncateds, info = self.env.step_wait()
+        else:
+            obs, rewards, terminateds, truncateds, info = self.result
+        dones = info.get("_" + self.final_key, np.zeros(self.worker_num, dtype=np.bool_))
+        if np.any(dones):
+            final_obs = np.stack([info[self.final_key][idx] for idx in np.nonzero(dones)[0]])
+        else:
+            final_obs = obs[:0]
+        self.obs = obs
+        return obs, final_obs, dones, rewards, terminateds, truncateds, self._split_info(info)
+
+    def close(self):
+        self.env.close()
+
+
+def make_env(env_name):
+    from jax_baselines.common.atari_wrappers import get_env_type, make_wrap_atari
+
+    env_type, env_id = get_env_type(env_name)
+    if env_type == "atari_env":
+        return make_wrap_atari(env_name, clip_rewards=True)
+    return gym.make(env_name)
+
+
+def get_env_info(env, env_name):
+    from jax_baselines.common.atari_wrappers import get_env_type
+
+    env_type, env_id = get_env_type(env_name)
+    return {
+        "observation_space": env.observation_space,
+        "action_space": env.action_space,
+        "env_type": env_type,
+        "env_id": env_id,
+    }
+
+
+def gym_subproc_worker(env_name, conn, idx, shared_arrays, render=False):
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in shared_arrays]
+    obses, final_obs, rewards, terminateds, truncateds = (
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        for shm, (_, shape, dtype) in zip(shms, shared_arrays)
+    )
+    env = make_env(env_name)
+    discrete = not isinstance(env.action_space, spaces.Box)
+    obs, info = env.reset()
+    obses[0, idx] = obs
+    conn.send(info)
+    try:
+        while True:
+            cmd, data = conn.recv()
+            if cmd == "close":
+                break
+            action, slot = data
+            if render:
+                env.render()
+            if discrete:
+                action = action[0]
+            obs, reward, terminated, truncated, info = env.step(action)
+            if terminated or truncated:
+                final_obs[idx] = obs
+                obs, _ = env.reset()
+            obses[slot, idx] = obs
+            rewards[idx] = reward
+            terminateds[idx] = terminated
+            truncateds[idx] = truncated
+            conn.send(info)
+    except KeyboardInterrupt:
+        pass
+    env.close()
+    conn.close()
+    del obses, final_obs, rewards, terminateds, truncateds
+    for shm in shms:
+        shm.close()
+
+
 @ray.remote
 class gymRayworker:
-    def __init__(self, env_name_, render=False):
+    def __init__(self, env_name_, render=False, num_envs=1, frame_transport=0):
         from jax_baselines.common.atari_wrappers import get_env_type, make_wrap_atari
 
         self.env_type, self.env_id = get_env_type(env_name_)
         if self.env_type == "atari_env":
-            self.env = make_wrap_atari(env_name_, clip_rewards=True)
+            self.envs = [make_wrap_atari(env_name_, clip_rewards=True) for _ in range(num_envs)]
         else:
-            self.env = gym.make(env_name_)
-        if not isinstance(self.env.action_space, spaces.Box):
+            self.envs = [gym.make(env_name_) for _ in range(num_envs)]
+        if not isinstance(self.envs[0].action_space, spaces.Box):
             self.action_conv = lambda a: a[0]
         else:
             self.action_conv = lambda a: a
+        if len(self.envs[0].observation_space.shape) < 3:
+            frame_transport = 0
+        if frame_transport:
+            self.obs_conv = partial(newest_frames, frame_stack=frame_transport)
+        else:
+            self.obs_conv = np.asarray
+        self.frame_transport = frame_transport
         self.render = render
 
     def get_reset(self):
-        obs, info = self.env.reset()
-        return obs, info
+        obs, infos = zip(*[env.reset() for env in self.envs])
+        return np.stack(obs, axis=0), infos
 
     def get_info(self):
         return {
-            "observation_space": self.env.observation_space,
-            "action_space": self.env.action_space,
+            "observation_space": self.envs[0].observation_space,
+            "action_space": self.envs[0].action_space,
             "env_type": self.env_type,
             "env_id": self.env_id,
         }
 
-    def step(self, action):
+    def step(self, actions):
         if self.render:
-            self.env.render()
-        obs, reward, terminated, truncated, info = self.env.step(self.action_conv(action))
-        done = terminated or truncated
-        if done:
-            done_obs = obs
-            obs, _ = self.env.reset()
-        else:
-            done_obs = None
-        return obs, done_obs, reward, terminated, truncated, done, info
+            self.envs[0].render()
+        obses, done_obses, rewards, terminateds, truncateds, infos = [], [], [], [], [], []
+        for env, action in zip(self.envs, actions):
+            obs, reward, terminated, truncated, info = env.step(self.action_conv(action))
+            if terminated or truncated:
+                end_obs = obs
+                obs, _ = env.reset()
+                if self.frame_transport:
+                    # the final stack is rolled from its newest frame, the reset one is sent whole
+                    obs, end_obs = end_obs, obs
+                done_obses.append(end_obs)
+            else:
+                done_obses.append(None)
+            obses.append(self.obs_conv(obs))
+            rewards.append(reward)
+            terminateds.append(terminated)
+            truncateds.append(truncated)
+            infos.append(info)
+        terminateds = np.array(terminateds)
+        truncateds = np.array(truncateds)
+        return (
+            np.stack(obses, axis=0),
+            tuple(done_obses),
+            np.array(rewards),
+            terminateds,
+            truncateds,
+            terminateds | truncateds,
+            tuple(infos),
+        )
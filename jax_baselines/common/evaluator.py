@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class Evaluator(object):
+    def __init__(self, envs, eval_eps, env_fn=None, num_envs=1, seed=None):
+        """Run the evaluation episodes of several environments side by side.
+
+        The eval_eps episodes are split over the environments, and at every step the
+        observations of the environments still running are stacked into one batch, so the
+        policy is called once per step for all of them. Rewards, episode lengths and original
+        rewards are accounted per environment, as in a sequential evaluation on each of them.
+
+        :param envs: (list) gym environments, at most eval_eps are used
+        :param eval_eps: (int) number of evaluation episodes
+        :param env_fn: (callable) makes the environments added to envs up to num_envs, on the
+            first run so a run that never evaluates does not build them
+        :param num_envs: (int) number of environments, envs are all used when they are more
+        :param seed: (int) the environment idx is reset with seed + idx on the first run, None
+            to leave them unseeded
+        """
+        self.envs = list(envs)
+        self.env_fn = env_fn
+        self.num_envs = min(max(num_envs, len(self.envs)), max(eval_eps, 1))
+        del self.envs[self.num_envs :]
+        # the seeds of the next reset, only the first one is seeded
+        self.seeds = [None if seed is None else seed + idx for idx in range(self.num_envs)]
+        self.eval_eps = eval_eps
+        self.episodes = np.array_split(np.arange(eval_eps), self.num_envs)
+
+    def make_envs(self):
+        """Add the environments of env_fn up to num_envs."""
+        while len(self.envs) < self.num_envs:
+            self.envs.append(self.env_fn())
+
+    def run(self, actions_fn):
+        """Run eval_eps episodes.
+
+        :param actions_fn: (callable) maps the stacked observations [obs] of the running
+            environments to their actions, the row of each environment is given to its step
+        :return: (dict) episode_reward, episode_len and truncated of every episode, and
+            original_rewards, None if the environments do not report an original_reward
+        """
+        total_reward = np.zeros(self.eval_eps)
+        total_ep_len = np.zeros(self.eval_eps)
+        total_truncated = np.zeros(self.eval_eps)
+
+        self.make_envs()
+        obs, infos = zip(*[env.reset(seed=seed) for env, seed in zip(self.envs, self.seeds)])
+        self.seeds = [None] * self.num_envs
+        obs = list(obs)
+        have_original_reward = "original_reward" in infos[0].keys()
+        have_lives = "lives" in infos[0].keys()
+        original_reward = [info["original_reward"] if have_original_reward else 0 for info in infos]
+        original_rewards = []
+        episode = [0] * len(self.envs)
+        running = [idx for idx, eps in enumerate(self.episodes) if len(eps) > 0]
+
+        while len(running) > 0:
+            actions = actions_fn([np.stack([obs[idx] for idx in running], axis=0)])
+            for idx, action in zip(running, actions):
+                ep = self.episodes[idx][episode[idx]]
+                obs[idx], reward, terminated, truncated, info = self.envs[idx].step(action)
+                if have_original_reward:
+                    original_reward[idx] += info["original_reward"]
+                total_reward[ep] += reward
+                total_ep_len[ep] += 1
+                if not terminated and not truncated:
+                    continue
+
+                total_truncated[ep] = float(truncated)
+                # with lives, an episode ends at every lost life and the original reward of
+                # the game is recorded when the last one is lost
+                if have_original_reward and (not have_lives or info["lives"] == 0):
+                    original_rewards.append(original_reward[idx])
+                    original_reward[idx] = 0
+                episode[idx] += 1
+                obs[idx], _ = self.envs[idx].reset()
+            running = [idx for idx in running if episode[idx] < len(self.episodes[idx])]
+
+        return {
+            "episode_reward": total_reward,
+            "episode_len": total_ep_len,
+            "truncated": total_truncated,
+            "original_rewards": original_rewards if have_original_reward else None,
+        }
+
+
+class BackgroundEvaluator(object):
+    def __init__(self):
+        """Run evaluations on a worker thread while the learner keeps training.
+
+        A single evaluation runs at a time, submit waits for the previous one to finish, so
+        the policy snapshots do not pile up when an evaluation takes longer than eval_freq.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.result = None
+
+    def submit(self, eval_fn, steps):
+        """Start eval_fn(steps) on the worker thread.
+
+        :param eval_fn: (callable) evaluates a snapshot of the policy and logs the result at steps
+        :param steps: (int) step the snapshot was taken at
+        :return: (dict) result of the last finished evaluation, None before the first one
+        """
+        self.join()
+        self.future = self.executor.submit(eval_fn, steps)
+        return self.result
+
+    def join(self):
+        """Wait for the running evaluation.
+
+        :return: (dict) result of the last finished evaluation
+        """
+        if self.future is not None:
+            self.result = self.future.result()
+            self.future = None
+        return self.result
@@ -0,0 +1,301 @@
+import numpy as np
+
+from jax_baselines.common.segment_tree import MinSegmentTree, SumSegmentTree
+
+
+class FrameReplayBuffer(object):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list = [],
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        frame_stack=4,
+    ):
+        """Replay buffer that stores each frame of the stacked image observations once.
+
+        Every worker writes its steps to its own time ordered rows, one row per step holding the
+        newest frame of obs, plus one extra row holding the last next_obs of each episode.
+        The frame_stack stacks of obs and next_obs and the n-step returns are rebuilt at sample
+        time with vectorized gathers. Stacks at the start of an episode repeat its first frame,
+        like FrameStack does after a reset.
+
+        :param size: (int) max number of transitions
+        :param observation_space: (list) shapes of the observations, observations with 3 or more
+            dims are treated as channel last frame stacks
+        :param action_space: (int or list) shape of a single action
+        :param worker_size: (int) number of environments added together
+        :param n_step: (int) n-step return length
+        :param gamma: (float) discount factor of the n-step return
+        :param frame_stack: (int) number of frames stacked in an image observation
+        """
+        if isinstance(action_space, int):
+            action_space = (action_space,)
+        self.worker_size = worker_size
+        self.n_step = n_step
+        self.frame_stack = frame_stack
+        self.discounts = np.power(gamma, np.arange(n_step)).astype(np.float32)
+        self.rows = int(np.ceil(size / worker_size))
+        self.max_size = self.rows * worker_size
+        self.obsdict = dict(
+            (
+                "obs{}".format(idx),
+                {"shape": o, "dtype": np.uint8}
+                if len(o) >= 3
+                else {"shape": o, "dtype": np.float32},
+            )
+            for idx, o in enumerate(observation_space)
+        )
+        self.frame_keys = [k for k, v in self.obsdict.items() if len(v["shape"]) >= 3]
+        self.buffer = {}
+        for k, v in self.obsdict.items():
+            shape = list(v["shape"])
+            if k in self.frame_keys:
+                # only the newest frame of the stack is stored
+                shape[-1] = shape[-1] // frame_stack
+            self.buffer[k] = np.zeros((self.rows, worker_size, *shape), dtype=v["dtype"])
+        self.buffer["action"] = np.zeros((self.rows, worker_size, *action_space), dtype=np.float32)
+        self.buffer["reward"] = np.zeros((self.rows, worker_size), dtype=np.float32)
+        self.buffer["terminated"] = np.zeros((self.rows, worker_size), dtype=np.bool_)
+        self.buffer["done"] = np.zeros((self.rows, worker_size), dtype=np.bool_)
+        # first row of an episode, and the extra row holding the last next_obs of an episode
+        self.buffer["first"] = np.zeros((self.rows, worker_size), dtype=np.bool_)
+        self.buffer["final"] = np.zeros((self.rows, worker_size), dtype=np.bool_)
+        self.workers = np.arange(worker_size)
+        self.clear()
+
+    def __len__(self) -> int:
+        return int(np.sum(self._valid_range()[2]))
+
+    @property
+    def storage(self):
+        return self.buffer
+
+    @property
+    def buffer_size(self) -> int:
+        return self.max_size
+
+    def can_sample(self, n_samples: int) -> bool:
+        return len(self) >= n_samples
+
+    def is_full(self) -> int:
+        return len(self) == self.max_size
+
+    def _valid_range(self):
+        # rows need frame_stack - 1 rows of history and n_step rows of future in the buffer
+        low = np.maximum(self.count - self.rows + self.frame_stack - 1, 0)
+        high = self.count - self.n_step
+        return low, high, np.maximum(high - low, 0)
+
+    def _write(self, pos, workers, obs, **kwargs):
+        rows = pos % self.rows
+        for k, o in zip(self.obsdict.keys(), obs):
+            if k in self.frame_keys:
+                o = o[..., -self.buffer[k].shape[-1] :]
+            self.buffer[k][rows, workers] = o
+        for k, v in kwargs.items():
+            self.buffer[k][rows, workers] = v
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        if workers is not None:
+            raise ValueError("frame replay needs every worker to be stepped together")
+        terminated = np.reshape(terminated, (-1,))
+        done = np.logical_or(terminated, np.reshape(truncated, (-1,)))
+        self._write(
+            self.count,
+            self.workers,
+            obs_t,
+            action=np.reshape(action, self.buffer["action"].shape[1:]),
+            reward=np.reshape(reward, (-1,)),
+            terminated=terminated,
+            done=done,
+            first=self.new_episode,
+            final=False,
+        )
+        if np.any(done):
+            # the last next_obs of an episode is not the obs of any later row, so keep it
+            workers = self.workers[done]
+            self._write(
+                self.count[workers] + 1,
+                workers,
+                [no[done] for no in nxtobs_t] if final_obs is None else final_obs,
+                reward=0.0,
+                terminated=False,
+                done=False,
+                first=False,
+                final=True,
+            )
+        self.count = self.count + 1 + done
+        self.new_episode = done
+        return done
+
+    def episode_end(self):
+        pass
+
+    def _stack(self, pos, workers):
+        """Gather the frame stacks of the rows at pos, repeating the first frame of an episode."""
+        history = [pos]
+        for _ in range(self.frame_stack - 1):
+            prev = history[-1]
+            history.append(
+                np.where(self.buffer["first"][prev % self.rows, workers], prev, prev - 1)
+            )
+        rows = np.stack(history[::-1], axis=1) % self.rows
+        obs = []
+        for k in self.obsdict.keys():
+            if k in self.frame_keys:
+                frames = self.buffer[k][rows, workers[:, None]]
+                frames = np.moveaxis(frames, 1, -2)
+                obs.append(np.reshape(frames, (*frames.shape[:-2], -1)))
+            else:
+                obs.append(self.buffer[k][pos % self.rows, workers])
+        return obs
+
+    def _gather(self, pos, workers):
+        future = (pos[:, None] + np.arange(self.n_step)) % self.rows
+        dones = self.buffer["done"][future, workers[:, None]]
+        # the return is cut after the first done of the window
+        alive = np.cumprod(np.concatenate([np.ones_like(dones[:, :1]), ~dones[:, :-1]], 1), 1)
+        rewards = np.sum(
+            self.buffer["reward"][future, workers[:, None]] * alive * self.discounts, axis=1
+        )
+        steps = np.sum(alive, axis=1)
+        nxtpos = pos + steps
+        return {
+            "obses": self._stack(pos, workers),
+            "actions": self.buffer["action"][pos % self.rows, workers],
+            "rewards": rewards[:, None],
+            "nxtobses": self._stack(nxtpos, workers),
+            "terminateds": self.buffer["terminated"][(nxtpos - 1) % self.rows, workers][
+                :, None
+            ].astype(np.float32),
+        }
+
+    def _sample_pos(self, batch_size):
+        low, high, length = self._valid_range()
+        cumsum = np.cumsum(length)
+        pos = np.zeros(batch_size, dtype=np.int64)
+        workers = np.zeros(batch_size, dtype=np.int64)
+        redraw = np.ones(batch_size, dtype=np.bool_)
+        # rows holding only a last next_obs are not transitions, draw them again
+        while np.any(redraw):
+            u = np.random.randint(0, cumsum[-1], size=np.sum(redraw))
+            w = np.searchsorted(cumsum, u, side="right")
+            workers[redraw] = w
+            pos[redraw] = low[w] + u - (cumsum[w] - length[w])
+            redraw = self.buffer["final"][pos % self.rows, workers]
+        return pos, workers
+
+    def sample(self, batch_size: int):
+        return self._gather(*self._sample_pos(batch_size))
+
+    def clear(self):
+        self.count = np.zeros(self.worker_size, dtype=np.int64)
+        self.new_episode = np.ones(self.worker_size, dtype=np.bool_)
+
+
+class PrioritizedFrameReplayBuffer(FrameReplayBuffer):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        eps=1e-4,
+        frame_stack=4,
+    ):
+        self.alpha = alpha
+        self.eps = eps
+        super().__init__(
+            size, observation_space, action_space, worker_size, n_step, gamma, frame_stack
+        )
+
+    def clear(self):
+        super().clear()
+        tree_capacity = 1
+        while tree_capacity < self.max_size:
+            tree_capacity *= 2
+        self.sum_tree = SumSegmentTree(tree_capacity)
+        self.min_tree = MinSegmentTree(tree_capacity)
+        self.max_priority = 1.0
+
+    def _set_priorities(self, pos, workers, priorities):
+        if len(pos) == 0:
+            return
+        indexes = (pos % self.rows) * self.worker_size + workers
+        self.sum_tree[indexes] = priorities
+        self.min_tree[indexes] = np.where(priorities > 0, priorities, np.inf)
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        count = self.count
+        done = super().add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
+        # new rows can not be sampled until their n-step future is written
+        self._set_priorities(count, self.workers, 0.0)
+        self._set_priorities(count[done] + 1, self.workers[done], 0.0)
+        low, high, _ = self._valid_range()
+        for pos in [count - self.n_step, count + 1 - self.n_step]:
+            ready = (pos >= low) & (pos < high)
+            ready[ready] = ~self.buffer["final"][pos[ready] % self.rows, self.workers[ready]]
+            self._set_priorities(pos[ready], self.workers[ready], self.max_priority**self.alpha)
+        # the oldest rows lose their history when the rows before them are overwritten
+        for offset in range(1, self.frame_stack):
+            pos = self.count - self.rows + offset - 1
+            stale = pos >= 0
+            self._set_priorities(pos[stale], self.workers[stale], 0.0)
+        return done
+
+    def sample(self, batch_size: int, beta=0.5):
+        total = self.sum_tree.sum()
+        mass = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * total / batch_size
+        indexes = self.sum_tree.find_prefixsum_idx(mass)
+        rows, workers = np.divmod(indexes, self.worker_size)
+        last = self.count[workers] - 1
+        pos = last - (last - rows) % self.rows
+        size = len(self)
+        weights = np.power(self.sum_tree[indexes] / total * size, -beta)
+        max_weight = np.power(self.min_tree.min() / total * size, -beta)
+        return {
+            **self._gather(pos, workers),
+            "weights": (weights / max_weight).astype(np.float32),
+            "indexes": indexes,
+        }
+
+    def update_priorities(self, indexes, priorities):
+        priorities = np.reshape(np.asarray(priorities), (-1,)) + self.eps
+        # rows overwritten since they were sampled keep their new priority
+        alive = self.sum_tree[indexes] > 0
+        if not np.any(alive):
+            return
+        indexes, priorities = indexes[alive], priorities[alive]
+        self.sum_tree[indexes] = priorities**self.alpha
+        self.min_tree[indexes] = priorities**self.alpha
+        self.max_priority = max(self.max_priority, np.max(priorities))
@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+import numpy as np
+
+PackedFrames = namedtuple("PackedFrames", ["first", "frames", "resets", "dones"])
+
+
+def newest_frames(obs, frame_stack):
+    """Newest frame of channel last frame stacks.
+
+    :param obs: (np.ndarray) frame stacks [..., H, W, C]
+    :param frame_stack: (int) number of frames stacked in the C channels
+    :return: (np.ndarray) the newest frames [..., H, W, C // frame_stack]
+    """
+    obs = np.asarray(obs)
+    return np.ascontiguousarray(obs[..., -(obs.shape[-1] // frame_stack) :])
+
+
+def push_frames(stacks, frames):
+    """Frame stacks of the next step, shifted by one frame with frames as the newest one.
+
+    :param stacks: (np.ndarray) frame stacks [..., H, W, C]
+    :param frames: (np.ndarray) newest frames [..., H, W, c]
+    :return: (np.ndarray) new frame stacks [..., H, W, C]
+    """
+    return np.concatenate([stacks[..., frames.shape[-1] :], frames], axis=-1)
+
+
+def pack_frames(obses, nxtobses, dones, frame_stack):
+    """Pack the frame stacks of a trajectory into its newest frames.
+
+    The obs of a step is the next obs of the previous one, unless an episode ended in between,
+    so the trajectory is kept as its first obs, the newest frame of every next obs and the
+    reset obs of the episodes started inside it.
+
+    :param obses: (np.ndarray) frame stacks of the obs [T, H, W, C]
+    :param nxtobses: (np.ndarray) frame stacks of the next obs [T, H, W, C]
+    :param dones: (np.ndarray) episode ends of the steps [T]
+    :param frame_stack: (int) number of frames stacked in the C channels
+    :return: (PackedFrames) the packed trajectory, rebuilt by unpack_frames
+    """
+    dones = np.reshape(np.asarray(dones, dtype=np.bool_), (-1,))
+    return PackedFrames(
+        np.asarray(obses[0]),
+        newest_frames(nxtobses, frame_stack),
+        np.asarray(obses[1:][dones[:-1]]),
+        dones,
+    )
+
+
+def unpack_frames(packed, frame_stack):
+    """Rebuild the frame stacks of a packed trajectory.
+
+    The frames of every episode part are laid out after the frames of its first stack, and the
+    stacks of obs and next obs are gathered from them at once.
+
+    :param packed: (PackedFrames) trajectory packed by pack_frames
+    :param frame_stack: (int) number of frames stacked in the C channels
+    :return: (tuple) frame stacks of the obs and of the next obs [T, H, W, C]
+    """
+    first, frames, resets, dones = packed
+    steps, c = len(frames), frames.shape[-1]
+    starts = np.concatenate([first[None], resets], axis=0)
+    # [S, H, W, C] -> [S, frame_stack, H, W, c]
+    start_frames = np.moveaxis(starts.reshape(*starts.shape[:-1], frame_stack, c), -2, 1)
+    segment = np.concatenate([[0], np.cumsum(dones[:-1])])
+    # position of the newest frame of every next obs in the laid out frames
+    pos = np.arange(steps) + (segment + 1) * frame_stack
+    timeline = np.empty((steps + len(starts) * frame_stack, *frames.shape[1:]), frames.dtype)
+    is_frame = np.zeros(len(timeline), dtype=np.bool_)
+    is_frame[pos] = True
+    timeline[is_frame] = frames
+    timeline[~is_frame] = start_frames.reshape(-1, *frames.shape[1:])
+    window = pos[:, None] + np.arange(-frame_stack, 1)
+    # [T, frame_stack + 1, H, W, c] -> [T, H, W, (frame_stack + 1) * c]
+    stacks = np.moveaxis(timeline[window], 1, -2).reshape(steps, *frames.shape[1:-1], -1)
+    # the windows hold frame_stack + 1 frames, the obs is the first frame_stack of them
+    obses = stacks[..., : frame_stack * c]
+    nxtobses = stacks[..., c:]
+    return np.ascontiguousarray(obses), np.ascontiguousarray(nxtobses)
@@ -0,0 +1,257 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import NstepAccumulator, final_next_obs
+
+
+class DeviceReplayBuffer(object):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list = [],
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        stage_size=1024,
+    ):
+        """Replay buffer stored as a pytree of device arrays.
+
+        Transitions are staged on the host and written to the device in one scatter per flush.
+        Sampling is a pure function of the buffer state and a PRNG key, so it can run inside a
+        jitted train step and several gradient steps can be fused into a single dispatch.
+
+        :param size: (int) max number of transitions
+        :param observation_space: (list) shapes of the observations
+        :param action_space: (int or list) shape of a single action
+        :param worker_size: (int) number of environments added together, used for n-step returns
+        :param n_step: (int) n-step return length
+        :param gamma: (float) discount factor of the n-step return
+        :param stage_size: (int) number of host staged transitions written to the device at once
+        """
+        self.max_size = size
+        if isinstance(action_space, int):
+            action_space = (action_space,)
+        self.obsdict = dict(
+            (
+                "obs{}".format(idx),
+                {"shape": o, "dtype": np.uint8}
+                if len(o) >= 3
+                else {"shape": o, "dtype": np.float32},
+            )
+            for idx, o in enumerate(observation_space)
+        )
+        self.nextobsdict = dict(("next_{}".format(k), v) for k, v in self.obsdict.items())
+        self.env_dict = {
+            **self.obsdict,
+            "action": {"shape": action_space, "dtype": np.float32},
+            "reward": {"shape": (1,), "dtype": np.float32},
+            **self.nextobsdict,
+            "done": {"shape": (1,), "dtype": np.float32},
+        }
+        self.nstep_accumulator = None
+        if n_step > 1:
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, action_space
+            )
+        self.stage_size = max(stage_size, worker_size * n_step)
+        self.stage = dict(
+            (k, np.zeros((self.stage_size, *v["shape"]), dtype=v["dtype"]))
+            for k, v in self.env_dict.items()
+        )
+        self.staged = 0
+        self._idx = 0
+        self._stored = 0
+        self.buffer_state = self.creat_buffer_state()
+        self._write = jax.jit(self._write, donate_argnums=(0,))
+        self._sample = jax.jit(self._sample, static_argnums=(3,))
+
+    def creat_buffer_state(self):
+        return dict(
+            (k, jnp.zeros((self.max_size, *v["shape"]), dtype=v["dtype"]))
+            for k, v in self.env_dict.items()
+        )
+
+    def __len__(self) -> int:
+        return min(self._stored + self.staged, self.max_size)
+
+    @property
+    def storage(self):
+        return self.buffer_state
+
+    @property
+    def buffer_size(self) -> int:
+        return self.max_size
+
+    def can_sample(self, n_samples: int) -> bool:
+        return len(self) >= n_samples
+
+    def is_full(self) -> int:
+        return len(self) == self.max_size
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        batch_size = obs_t[0].shape[0]
+        if self.nstep_accumulator is not None:
+            workers, obs_t, action, reward, terminated = self.nstep_accumulator.add(
+                obs_t, action, reward, terminated, truncated, workers
+            )
+            nxtobs_t = final_next_obs(nxtobs_t, final_obs, done_idx, workers)
+            final_obs = None
+            batch_size = len(workers)
+        if batch_size == 0:
+            return
+        if self.staged + batch_size > self.stage_size:
+            self.flush()
+        rows = slice(self.staged, self.staged + batch_size)
+        for k, o in zip(self.obsdict.keys(), obs_t):
+            self.stage[k][rows] = o
+        for k, no in zip(self.nextobsdict.keys(), nxtobs_t):
+            self.stage[k][rows] = no
+        if final_obs is not None:
+            # the finished workers end on their final obs, not on the reset obs of next_obs
+            for k, fo in zip(self.nextobsdict.keys(), final_obs):
+                self.stage[k][rows][done_idx] = fo
+        self.stage["action"][rows] = np.reshape(action, (batch_size, -1))
+        self.stage["reward"][rows] = np.reshape(reward, (batch_size, 1))
+        self.stage["done"][rows] = np.reshape(terminated, (batch_size, 1))
+        self.staged += batch_size
+
+    def flush(self):
+        """Write the host staged transitions to the device buffer."""
+        if self.staged == 0:
+            return
+        # rows past the staged ones point outside the buffer and are dropped by the scatter
+        idxs = np.full(self.stage_size, self.max_size, dtype=np.int32)
+        idxs[: self.staged] = (self._idx + np.arange(self.staged)) % self.max_size
+        self.buffer_state = self._write(self.buffer_state, self.stage, idxs)
+        self._idx = (self._idx + self.staged) % self.max_size
+        self._stored = min(self._stored + self.staged, self.max_size)
+        self.staged = 0
+
+    def _write(self, buffer_state, stage, idxs):
+        return dict((k, v.at[idxs].set(stage[k], mode="drop")) for k, v in buffer_state.items())
+
+    def sample_fn(self, buffer_state, buffer_len, key, batch_size, beta=None):
+        """Uniformly sample a batch inside a jitted function."""
+        idxs = jax.random.randint(key, (batch_size,), 0, buffer_len)
+        return self._gather(buffer_state, idxs)
+
+    def _gather(self, buffer_state, idxs):
+        return {
+            "obses": [buffer_state[o][idxs] for o in self.obsdict.keys()],
+            "actions": buffer_state["action"][idxs],
+            "rewards": buffer_state["reward"][idxs],
+            "nxtobses": [buffer_state[no][idxs] for no in self.nextobsdict.keys()],
+            "terminateds": buffer_state["done"][idxs],
+        }
+
+    def sample(self, batch_size: int, key=None):
+        self.flush()
+        if key is None:
+            key = jax.random.PRNGKey(np.random.randint(0, 2**31 - 1))
+        return self._sample(self.buffer_state, len(self), key, batch_size)
+
+    def _sample(self, buffer_state, buffer_len, key, batch_size):
+        return self.sample_fn(buffer_state, buffer_len, key, batch_size)
+
+    def clear(self):
+        self.buffer_state = self.creat_buffer_state()
+        self.staged = 0
+        self._idx = 0
+        self._stored = 0
+        if self.nstep_accumulator is not None:
+            self.nstep_accumulator.clear()
+
+
+class PrioritizedDeviceReplayBuffer(DeviceReplayBuffer):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        eps=1e-4,
+        stage_size=1024,
+    ):
+        """Prioritized variant of DeviceReplayBuffer, priorities are sampled in graph with a
+        stratified search over their cumulative sum."""
+        self.alpha = alpha
+        self.eps = eps
+        super().__init__(
+            size, observation_space, action_space, worker_size, n_step, gamma, stage_size
+        )
+        self._update = jax.jit(self._update, donate_argnums=(0,))
+
+    def creat_buffer_state(self):
+        buffer_state = super().creat_buffer_state()
+        buffer_state["priorities"] = jnp.zeros((self.max_size,), dtype=jnp.float32)
+        buffer_state["max_priority"] = jnp.ones((), dtype=jnp.float32)
+        return buffer_state
+
+    def _write(self, buffer_state, stage, idxs):
+        # new transitions get the max priority seen so far
+        priorities = (
+            buffer_state["priorities"].at[idxs].set(buffer_state["max_priority"], mode="drop")
+        )
+        return {
+            **super()._write(dict((k, buffer_state[k]) for k in stage), stage, idxs),
+            "priorities": priorities,
+            "max_priority": buffer_state["max_priority"],
+        }
+
+    def sample_fn(self, buffer_state, buffer_len, key, batch_size, beta=0.4):
+        """Stratified prioritized sampling inside a jitted function."""
+        valid = jnp.arange(self.max_size) < buffer_len
+        priorities = jnp.where(valid, buffer_state["priorities"], 0.0)
+        cumsum = jnp.cumsum(priorities)
+        total = cumsum[-1]
+        segment = (jnp.arange(batch_size) + jax.random.uniform(key, (batch_size,))) / batch_size
+        idxs = jnp.searchsorted(cumsum, segment * total, side="right")
+        idxs = jnp.minimum(idxs, buffer_len - 1)
+        min_priority = jnp.min(jnp.where(valid, buffer_state["priorities"], jnp.inf))
+        weights = jnp.power(priorities[idxs] / min_priority, -beta)
+        return {
+            **self._gather(buffer_state, idxs),
+            "weights": weights,
+            "indexes": idxs,
+        }
+
+    def update_fn(self, buffer_state, indexes, priorities):
+        """Update priorities inside a jitted function."""
+        priorities = jnp.power(jnp.squeeze(priorities) + self.eps, self.alpha)
+        buffer_state = dict(buffer_state)
+        buffer_state["priorities"] = buffer_state["priorities"].at[indexes].set(priorities)
+        buffer_state["max_priority"] = jnp.maximum(
+            buffer_state["max_priority"], jnp.max(priorities)
+        )
+        return buffer_state
+
+    def sample(self, batch_size: int, beta=0.5, key=None):
+        self.flush()
+        if key is None:
+            key = jax.random.PRNGKey(np.random.randint(0, 2**31 - 1))
+        return self._sample(self.buffer_state, len(self), key, batch_size, beta)
+
+    def _sample(self, buffer_state, buffer_len, key, batch_size, beta=0.5):
+        return self.sample_fn(buffer_state, buffer_len, key, batch_size, beta)
+
+    def update_priorities(self, indexes, priorities):
+        self.buffer_state = self._update(self.buffer_state, indexes, priorities)
+
+    def _update(self, buffer_state, indexes, priorities):
+        return self.update_fn(buffer_state, indexes, priorities)
@@ -0,0 +1,198 @@
+import gymnasium as gym
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnasium import spaces
+
+from jax_baselines.common.env_builer import VectorizedEnv
+
+
+class JaxEnv(object):
+    """Environment written as pure JAX functions, so it can be vmapped over workers and stepped
+    inside jax.lax.scan.
+
+    reset(key) returns (state, obs) and step(state, action, key) returns
+    (state, obs, reward, terminated, truncated), for a single environment.
+    """
+
+    env_id = None
+    observation_space = None
+    action_space = None
+
+    def reset(self, key):
+        pass
+
+    def step(self, state, action, key):
+        pass
+
+
+class CartPole(JaxEnv):
+    """CartPole-v1 of gymnasium, with the same dynamics, termination and 500 step limit."""
+
+    env_id = "CartPole-v1"
+    gravity = 9.8
+    masscart = 1.0
+    masspole = 0.1
+    total_mass = masspole + masscart
+    length = 0.5
+    polemass_length = masspole * length
+    force_mag = 10.0
+    tau = 0.02
+    theta_threshold_radians = 12 * 2 * np.pi / 360
+    x_threshold = 2.4
+    max_episode_steps = 500
+
+    def __init__(self):
+        high = np.array(
+            [self.x_threshold * 2, np.inf, self.theta_threshold_radians * 2, np.inf],
+            dtype=np.float32,
+        )
+        self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self.action_space = spaces.Discrete(2)
+
+    def reset(self, key):
+        physics = jax.random.uniform(key, (4,), minval=-0.05, maxval=0.05)
+        return (physics, jnp.zeros((), dtype=jnp.int32)), physics
+
+    def step(self, state, action, key):
+        physics, t = state
+        x, x_dot, theta, theta_dot = physics
+        force = jnp.where(action == 1, self.force_mag, -self.force_mag)
+        costheta = jnp.cos(theta)
+        sintheta = jnp.sin(theta)
+        temp = (force + self.polemass_length * theta_dot**2 * sintheta) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / (
+            self.length * (4.0 / 3.0 - self.masspole * costheta**2 / self.total_mass)
+        )
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+        physics = jnp.stack(
+            [
+                x + self.tau * x_dot,
+                x_dot + self.tau * xacc,
+                theta + self.tau * theta_dot,
+                theta_dot + self.tau * thetaacc,
+            ]
+        )
+        t = t + 1
+        terminated = (jnp.abs(physics[0]) > self.x_threshold) | (
+            jnp.abs(physics[2]) > self.theta_threshold_radians
+        )
+        truncated = jnp.logical_and(t >= self.max_episode_steps, ~terminated)
+        return (physics, t), physics, jnp.ones((), dtype=jnp.float32), terminated, truncated
+
+
+jax_envs = {"CartPole-v1": CartPole}
+
+
+def make_jax_env(env_id):
+    if env_id not in jax_envs:
+        raise ValueError(f"{env_id} has no JAX implementation, available: {list(jax_envs)}")
+    return jax_envs[env_id]()
+
+
+class JaxVectorizedEnv(VectorizedEnv):
+    def __init__(self, env_id, worker_num=8, seed=0):
+        """worker_num copies of a JaxEnv stepped with jax.vmap.
+
+        reset_fn and step_fn are pure functions of the batched state, used by the fully jitted
+        learn loops. current_obs, step and get_result wrap them for the python learn loops of
+        the other vectorized envs.
+
+        :param env_id: (str) id of a JaxEnv of jax_envs
+        :param worker_num: (int) number of environments
+        :param seed: (int) seed of the environment keys
+        """
+        self.env = make_jax_env(env_id)
+        self.env_id = env_id
+        self.worker_num = worker_num
+        self.env_info = {
+            "observation_space": self.env.observation_space,
+            "action_space": self.env.action_space,
+            "env_type": "jax_env",
+            "env_id": env_id,
+        }
+        self.discrete = not isinstance(self.env.action_space, spaces.Box)
+        self.key = jax.random.PRNGKey(seed)
+        self._reset_fn = jax.jit(self.reset_fn)
+        self._step_fn = jax.jit(self.step_fn)
+        self.key, key = jax.random.split(self.key)
+        self.state, self.obs = self._reset_fn(key)
+
+    def reset_fn(self, key):
+        return jax.vmap(self.env.reset)(jax.random.split(key, self.worker_num))
+
+    def step_fn(self, state, action, key):
+        """Step every environment and reset the finished ones.
+
+        :return: (tuple) the state, the obs to act on, which is the reset obs of the finished
+            environments, the next obs, reward, terminated and truncated of the step
+        """
+        step_key, reset_key = jax.random.split(key)
+        state, next_obs, reward, terminated, truncated = jax.vmap(self.env.step)(
+            state, action, jax.random.split(step_key, self.worker_num)
+        )
+        reset_state, reset_obs = self.reset_fn(reset_key)
+        done = jnp.logical_or(terminated, truncated)
+
+        def select(reset, current):
+            return jnp.where(
+                jnp.reshape(done, done.shape + (1,) * (current.ndim - 1)), reset, current
+            )
+
+        state = jax.tree_util.tree_map(select, reset_state, state)
+        obs = select(reset_obs, next_obs)
+        return state, obs, next_obs, reward, terminated, truncated
+
+    def get_info(self):
+        return self.env_info
+
+    def current_obs(self):
+        return np.asarray(self.obs)
+
+    def step(self, actions):
+        actions = jnp.asarray(actions)
+        if self.discrete:
+            actions = actions[:, 0]
+        self.key, key = jax.random.split(self.key)
+        self.result = self._step_fn(self.state, actions, key)
+
+    def get_result(self):
+        self.state, self.obs, next_obs, rewards, terminateds, truncateds = self.result
+        infos = tuple({} for _ in range(self.worker_num))
+        dones = np.asarray(terminateds | truncateds)
+        return (
+            np.asarray(self.obs),
+            np.asarray(next_obs)[dones],
+            dones,
+            np.asarray(rewards),
+            np.asarray(terminateds),
+            np.asarray(truncateds),
+            infos,
+        )
+
+    def close(self):
+        pass
+
+
+class JaxGymEnv(gym.Env):
+    def __init__(self, env_id, seed=0):
+        """Single JaxEnv behind the gymnasium API, used as the eval env of the JAX envs."""
+        self.env = make_jax_env(env_id)
+        self.observation_space = self.env.observation_space
+        self.action_space = self.env.action_space
+        self.key = jax.random.PRNGKey(seed)
+        self._reset = jax.jit(self.env.reset)
+        self._step = jax.jit(self.env.step)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.key = jax.random.PRNGKey(seed)
+        self.key, key = jax.random.split(self.key)
+        self.state, obs = self._reset(key)
+        return np.asarray(obs), {}
+
+    def step(self, action):
+        action = np.reshape(np.asarray(action), self.action_space.shape)
+        self.key, key = jax.random.split(self.key)
+        self.state, obs, reward, terminated, truncated = self._step(self.state, action, key)
+        return np.asarray(obs), float(reward), bool(terminated), bool(truncated), {}
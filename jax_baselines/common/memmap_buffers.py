@@ -0,0 +1,225 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import NstepAccumulator, final_next_obs
+from jax_baselines.common.segment_tree import MinSegmentTree, SumSegmentTree
+
+
+class MemmapReplayBuffer(object):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list = [],
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        memmap_dir=None,
+    ):
+        """Replay buffer whose image observations live in np.memmap files.
+
+        Image observation columns (obs and next_obs with 3 or more dims) are stored in files under
+        memmap_dir, the small columns (action, reward, done) stay in RAM. Sampled indexes are
+        sorted before the gather so the reads from disk are sequential.
+
+        :param size: (int) max number of transitions
+        :param observation_space: (list) shapes of the observations
+        :param action_space: (int or list) shape of a single action
+        :param worker_size: (int) number of environments added together, used for n-step returns
+        :param n_step: (int) n-step return length
+        :param gamma: (float) discount factor of the n-step return
+        :param memmap_dir: (str) directory for the memmap files, a temporary directory is used
+            when None. The files are removed by close or when the buffer is garbage collected
+        """
+        self.max_size = size
+        if isinstance(action_space, int):
+            action_space = (action_space,)
+        self.obsdict = dict(
+            (
+                "obs{}".format(idx),
+                {"shape": o, "dtype": np.uint8}
+                if len(o) >= 3
+                else {"shape": o, "dtype": np.float32},
+            )
+            for idx, o in enumerate(observation_space)
+        )
+        self.nextobsdict = dict(("next_{}".format(k), v) for k, v in self.obsdict.items())
+        if memmap_dir is not None:
+            os.makedirs(memmap_dir, exist_ok=True)
+        # one sub directory per buffer, so several runs can share memmap_dir
+        self.memmap_dir = tempfile.mkdtemp(prefix="replay_", dir=memmap_dir)
+        self._remove_files = weakref.finalize(self, shutil.rmtree, self.memmap_dir, True)
+        self.buffer = {}
+        for k, v in {**self.obsdict, **self.nextobsdict}.items():
+            if len(v["shape"]) >= 3:
+                self.buffer[k] = np.memmap(
+                    os.path.join(self.memmap_dir, f"{k}.dat"),
+                    dtype=v["dtype"],
+                    mode="w+",
+                    shape=(size, *v["shape"]),
+                )
+            else:
+                self.buffer[k] = np.zeros((size, *v["shape"]), dtype=v["dtype"])
+        self.buffer["action"] = np.zeros((size, *action_space), dtype=np.float32)
+        self.buffer["reward"] = np.zeros((size, 1), dtype=np.float32)
+        self.buffer["done"] = np.zeros((size, 1), dtype=np.float32)
+        self.nstep_accumulator = None
+        if n_step > 1:
+            self.nstep_accumulator = NstepAccumulator(
+                worker_size, n_step, gamma, self.obsdict, action_space
+            )
+        self._idx = 0
+        self._stored = 0
+
+    def __len__(self) -> int:
+        return self._stored
+
+    @property
+    def storage(self):
+        return self.buffer
+
+    @property
+    def buffer_size(self) -> int:
+        return self.max_size
+
+    def can_sample(self, n_samples: int) -> bool:
+        return len(self) >= n_samples
+
+    def is_full(self) -> int:
+        return len(self) == self.max_size
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        batch_size = obs_t[0].shape[0]
+        if self.nstep_accumulator is not None:
+            workers, obs_t, action, reward, terminated = self.nstep_accumulator.add(
+                obs_t, action, reward, terminated, truncated, workers
+            )
+            nxtobs_t = final_next_obs(nxtobs_t, final_obs, done_idx, workers)
+            final_obs = None
+            batch_size = len(workers)
+        if batch_size == 0:
+            return None
+        idxs = (self._idx + np.arange(batch_size)) % self.max_size
+        for k, o in zip(self.obsdict.keys(), obs_t):
+            self.buffer[k][idxs] = o
+        for k, no in zip(self.nextobsdict.keys(), nxtobs_t):
+            self.buffer[k][idxs] = no
+        if final_obs is not None:
+            # the finished workers end on their final obs, not on the reset obs of next_obs
+            for k, fo in zip(self.nextobsdict.keys(), final_obs):
+                self.buffer[k][idxs[done_idx]] = fo
+        self.buffer["action"][idxs] = np.reshape(action, (batch_size, -1))
+        self.buffer["reward"][idxs] = np.reshape(reward, (batch_size, 1))
+        self.buffer["done"][idxs] = np.reshape(terminated, (batch_size, 1))
+        self._idx = (self._idx + batch_size) % self.max_size
+        self._stored = min(self._stored + batch_size, self.max_size)
+        return idxs
+
+    def episode_end(self):
+        pass
+
+    def _gather(self, idxs):
+        return {
+            "obses": [self.buffer[o][idxs] for o in self.obsdict.keys()],
+            "actions": self.buffer["action"][idxs],
+            "rewards": self.buffer["reward"][idxs],
+            "nxtobses": [self.buffer[no][idxs] for no in self.nextobsdict.keys()],
+            "terminateds": self.buffer["done"][idxs],
+        }
+
+    def sample(self, batch_size: int):
+        idxs = np.sort(np.random.randint(0, len(self), size=batch_size))
+        return self._gather(idxs)
+
+    def clear(self):
+        self._idx = 0
+        self._stored = 0
+        if self.nstep_accumulator is not None:
+            self.nstep_accumulator.clear()
+
+    def close(self):
+        """Remove the memmap files, the buffer can not be used after it."""
+        self.buffer = {}
+        self._remove_files()
+
+
+class PrioritizedMemmapReplayBuffer(MemmapReplayBuffer):
+    def __init__(
+        self,
+        size: int,
+        observation_space: list,
+        alpha: float,
+        action_space=1,
+        worker_size=1,
+        n_step=1,
+        gamma=0.99,
+        eps=1e-4,
+        memmap_dir=None,
+    ):
+        super().__init__(
+            size, observation_space, action_space, worker_size, n_step, gamma, memmap_dir
+        )
+        self.alpha = alpha
+        self.eps = eps
+        tree_capacity = 1
+        while tree_capacity < size:
+            tree_capacity *= 2
+        self.sum_tree = SumSegmentTree(tree_capacity)
+        self.min_tree = MinSegmentTree(tree_capacity)
+        self.max_priority = 1.0
+
+    def add(
+        self,
+        obs_t,
+        action,
+        reward,
+        nxtobs_t,
+        terminated,
+        truncated=False,
+        workers=None,
+        final_obs=None,
+        done_idx=None,
+    ):
+        idxs = super().add(
+            obs_t, action, reward, nxtobs_t, terminated, truncated, workers, final_obs, done_idx
+        )
+        if idxs is not None:
+            self.sum_tree[idxs] = self.max_priority**self.alpha
+            self.min_tree[idxs] = self.max_priority**self.alpha
+        return idxs
+
+    def sample(self, batch_size: int, beta=0.5):
+        total = self.sum_tree.sum(0, len(self))
+        mass = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * total / batch_size
+        idxs = np.minimum(self.sum_tree.find_prefixsum_idx(mass), len(self) - 1)
+        idxs = np.sort(idxs)
+        p_min = self.min_tree.min(0, len(self)) / total
+        max_weight = (p_min * len(self)) ** (-beta)
+        p_sample = self.sum_tree[idxs] / total
+        weights = (p_sample * len(self)) ** (-beta) / max_weight
+        return {
+            **self._gather(idxs),
+            "weights": weights.astype(np.float32),
+            "indexes": idxs,
+        }
+
+    def update_priorities(self, indexes, priorities):
+        priorities = np.reshape(np.asarray(priorities), (-1,)) + self.eps
+        self.sum_tree[indexes] = priorities**self.alpha
+        self.min_tree[indexes] = priorities**self.alpha
+        self.max_priority = max(self.max_priority, np.max(priorities))
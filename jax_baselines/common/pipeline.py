@@ -0,0 +1,167 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParamsChannel(object):
+    def __init__(self, params, version=0):
+        """Single slot holding the newest params published by the learner.
+
+        The slot is a (version, params) tuple replaced by one reference store, so the reader
+        always gets a matching pair without taking a lock, and the params it holds are never
+        written again since jax arrays are immutable.
+
+        :param params: (dict) the initial params
+        :param version: (int) the number of updates the params are the result of
+        """
+        self.slot = (version, params)
+
+    def publish(self, params, version):
+        self.slot = (version, params)
+
+    def latest(self):
+        """:return: (tuple) the version and the params of the last publish"""
+        return self.slot
+
+
+class LockedReplayBuffer(object):
+    def __init__(self, replay_buffer):
+        """Wraps a host replay buffer so the actor and the learner threads of the pipelined mode
+        can add to it and sample from it. The methods reading or writing the transitions share a
+        lock, so a replay snapshot taken while the learner runs is consistent.
+
+        :param replay_buffer: the wrapped buffer, any buffer of cpprb_buffers, memmap_buffers or
+            frame_buffers
+        """
+        self.replay_buffer = replay_buffer
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.replay_buffer, name)
+
+    def __len__(self):
+        return len(self.replay_buffer)
+
+    def add(self, *args, **kwargs):
+        with self.lock:
+            self.replay_buffer.add(*args, **kwargs)
+
+    def sample(self, *args):
+        with self.lock:
+            return self.replay_buffer.sample(*args)
+
+    def update_priorities(self, indexes, priorities):
+        with self.lock:
+            self.replay_buffer.update_priorities(indexes, priorities)
+
+    def clear(self):
+        with self.lock:
+            self.replay_buffer.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return self.replay_buffer.snapshot()
+
+    def restore(self, arrays, state):
+        with self.lock:
+            self.replay_buffer.restore(arrays, state)
+
+    def save_replay(self, *args, **kwargs):
+        # the transitions are copied under the lock, a background write runs after it
+        with self.lock:
+            return self.replay_buffer.save_replay(*args, **kwargs)
+
+    def load_replay(self, path):
+        with self.lock:
+            self.replay_buffer.load_replay(path)
+
+
+class PipelineLearner(object):
+    def __init__(
+        self,
+        train_fn,
+        params_fn,
+        replay_ratio,
+        learning_starts,
+        updates,
+        max_policy_lag=None,
+    ):
+        """Train on a worker thread at a fixed replay ratio while the actor collects.
+
+        The learner runs updates gradient steps at a time as long as it is behind
+        replay_ratio updates per env step collected past learning_starts, and publishes the
+        params after every call. The actor reports its env steps with collected, which
+        waits while the newest params are more than max_policy_lag updates behind the ones
+        the replay ratio asks for, so a slow learner holds the actor back instead of letting
+        the replay ratio and the policy lag drift.
+
+        :param train_fn: (callable) train_fn(last_steps, steps, updates) runs updates gradient
+            steps, last_steps and steps are the env steps of the previous call and of this one
+        :param params_fn: (callable) returns the params to publish
+        :param replay_ratio: (float) gradient steps per env step
+        :param learning_starts: (int) env steps collected before the first update
+        :param updates: (int) gradient steps per train_fn call
+        :param max_policy_lag: (int) most updates the published params can be behind, None for
+            no bound, at least updates
+        """
+        self.train_fn = train_fn
+        self.params_fn = params_fn
+        self.replay_ratio = replay_ratio
+        self.learning_starts = learning_starts
+        self.updates = updates
+        self.max_policy_lag = None if max_policy_lag is None else max(max_policy_lag, updates)
+        self.channel = ParamsChannel(params_fn())
+        self.cond = threading.Condition()
+        self.env_steps = 0
+        self.trained_steps = 0
+        self.stopped = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = self.executor.submit(self.run)
+
+    def target_updates(self, env_steps):
+        return max(int(self.replay_ratio * (env_steps - self.learning_starts)), 0)
+
+    def behind(self):
+        return self.target_updates(self.env_steps) - self.channel.latest()[0]
+
+    def run(self):
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.stopped or self.behind() >= self.updates)
+                    if self.stopped:
+                        return
+                    steps = self.env_steps
+                self.train_fn(self.trained_steps, steps, self.updates)
+                self.trained_steps = steps
+                self.channel.publish(self.params_fn(), self.channel.latest()[0] + self.updates)
+                with self.cond:
+                    self.cond.notify_all()
+        finally:
+            with self.cond:
+                self.stopped = True
+                self.cond.notify_all()
+
+    def collected(self, env_steps):
+        """Report the env steps collected by the actor.
+
+        :param env_steps: (int) env steps collected so far
+        :return: (tuple) the policy lag in updates and the newest params
+        """
+        with self.cond:
+            self.env_steps = env_steps
+            self.cond.notify_all()
+            if self.max_policy_lag is not None:
+                self.cond.wait_for(lambda: self.stopped or self.behind() <= self.max_policy_lag)
+        if self.stopped:
+            # raises the error the learner stopped on
+            self.future.result()
+        version, params = self.channel.latest()
+        return self.target_updates(env_steps) - version, params
+
+    def close(self):
+        """Stop the learner after its running call and wait for it."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.future.result()
+        self.executor.shutdown()
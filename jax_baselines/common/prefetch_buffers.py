@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+
+class PrefetchReplayBuffer(object):
+    def __init__(self, replay_buffer, prioritized_replay=False, batch_size=None):
+        """Wraps a host replay buffer and samples the next batches on a background thread.
+
+        The batches are queued in chunks of batch_size rows, each drawn by its own sample call,
+        and a sample call of several chunks concatenates them, so the fused updates of a
+        varying number of gradient steps still take their batches from the queue. Each sample
+        call returns the chunks queued since the previous one, already moved to the device with
+        jax.device_put, samples the chunks missing from the queue in place, and queues the
+        chunks of the larger of its and the previous call with the same arguments. Without prioritized replay the chunks are
+        queued right away, so they are sampled and transferred while the current update runs.
+        With prioritized replay they are queued by update_priorities, so every batch is drawn
+        after the priorities of the previous update are written, and the sample overlaps with
+        the environment steps instead of the update.
+
+        A prefetched batch does not contain the transitions added after it was queued. The
+        methods reading or writing the transitions share a lock, so the wrapped buffer is never
+        read and written at the same time.
+
+        :param replay_buffer: the wrapped buffer, any buffer of cpprb_buffers, memmap_buffers or
+            frame_buffers
+        :param prioritized_replay: (bool) whether the wrapped buffer is prioritized
+        :param batch_size: (int) rows of a queued chunk, the size of the first sample call when
+            None. A sample call that is not a multiple of it is sampled in place
+        """
+        self.replay_buffer = replay_buffer
+        self.prioritized_replay = prioritized_replay
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        self.chunks = 0
+        self.last_chunks = 0
+        self.sample_args = None
+        self.clear_stats()
+
+    def __getattr__(self, name):
+        return getattr(self.replay_buffer, name)
+
+    def __len__(self):
+        return len(self.replay_buffer)
+
+    def add(self, *args, **kwargs):
+        with self.lock:
+            self.replay_buffer.add(*args, **kwargs)
+
+    def _sample(self, *args):
+        start = time.perf_counter()
+        with self.lock:
+            data = self.replay_buffer.sample(*args)
+        indexes = data.pop("indexes", None)
+        data = jax.device_put(data)
+        if indexes is not None:
+            data["indexes"] = indexes
+        self.sample_time += time.perf_counter() - start
+        return data
+
+    def _queue(self):
+        for _ in range(self.chunks - len(self.futures)):
+            self.futures.append(
+                self.executor.submit(self._sample, self.batch_size, *self.sample_args)
+            )
+
+    def _drop_queue(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def sample(self, batch_size, *args):
+        start = time.perf_counter()
+        if self.batch_size is None:
+            self.batch_size = batch_size
+        chunks, rest = divmod(batch_size, self.batch_size)
+        if args != self.sample_args:
+            self._drop_queue()
+            self.sample_args = args
+        futures, self.futures = self.futures[:chunks], self.futures[chunks:]
+        batches = [future.result() for future in futures]
+        # the chunks missing from the queue are sampled here
+        self.missed_count += chunks - len(futures)
+        batches += [self._sample(self.batch_size, *args) for _ in range(chunks - len(futures))]
+        if rest > 0:
+            self.missed_count += 1
+            batches.append(self._sample(rest, *args))
+        self.wait_time += time.perf_counter() - start
+        self.sample_count += 1
+        # a replay ratio alternates between two numbers of chunks, the queue holds the larger
+        self.chunks, self.last_chunks = max(chunks, self.last_chunks), chunks
+        if self.prioritized_replay:
+            # the chunks left were drawn before the priorities of this batch are written
+            self._drop_queue()
+        else:
+            self._queue()
+        return concatenate_batches(batches)
+
+    def update_priorities(self, indexes, priorities):
+        with self.lock:
+            self.replay_buffer.update_priorities(indexes, np.asarray(priorities))
+        if self.sample_args is not None:
+            self._queue()
+
+    def clear(self):
+        self._drop_queue()
+        with self.lock:
+            self.replay_buffer.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return self.replay_buffer.snapshot()
+
+    def restore(self, arrays, state):
+        self._drop_queue()
+        with self.lock:
+            self.replay_buffer.restore(arrays, state)
+
+    def save_replay(self, *args, **kwargs):
+        # the transitions are copied under the lock, a background write runs after it
+        with self.lock:
+            return self.replay_buffer.save_replay(*args, **kwargs)
+
+    def load_replay(self, path):
+        self._drop_queue()
+        with self.lock:
+            self.replay_buffer.load_replay(path)
+
+    def clear_stats(self):
+        self.sample_time = 0.0
+        self.wait_time = 0.0
+        self.sample_count = 0
+        self.missed_count = 0
+
+    def stats(self):
+        """Mean time per batch spent sampling and transferring on the background thread, and
+        mean time the learner waited for it, in milliseconds. Their difference is the time hidden
+        by the prefetch. The missed chunks are the ones per batch that were not queued and were
+        sampled in place.
+        """
+        count = max(self.sample_count, 1)
+        stats = {
+            "replay/prefetch_sample_ms": 1e3 * self.sample_time / count,
+            "replay/prefetch_wait_ms": 1e3 * self.wait_time / count,
+            "replay/prefetch_hidden_ms": 1e3 * (self.sample_time - self.wait_time) / count,
+            "replay/prefetch_missed_chunks": self.missed_count / count,
+        }
+        self.clear_stats()
+        return stats
+
+
+def concatenate_batches(batches):
+    """Concatenate the sampled batches along their rows.
+
+    :param batches: (list) batches of sample, on the device but for their host indexes
+    :return: (dict) the batch of all their rows
+    """
+    if len(batches) == 1:
+        return batches[0]
+    indexes = [batch.pop("indexes") for batch in batches if "indexes" in batch]
+    data = jax.tree_util.tree_map(lambda *x: jnp.concatenate(x), *batches)
+    if len(indexes) > 0:
+        data["indexes"] = np.concatenate(indexes)
+    return data
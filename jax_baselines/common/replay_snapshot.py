@@ -0,0 +1,94 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+
+
+def save_snapshot(
+    path, arrays: dict, state: dict, compress=False, chunk_size=50000, background=True
+):
+    """Write a replay buffer snapshot to the directory path.
+
+    Every array of arrays is split along its first axis into files of chunk_size rows, so a
+    large buffer is never held twice in one np.savez call, and state holds the small values
+    (pointers, counters, priorities bounds). The snapshot is written to path.tmp and moved to
+    path when complete, so a run preempted while writing keeps the previous snapshot.
+
+    :param path: (str) snapshot directory
+    :param arrays: (dict) arrays of the buffer, already copied out of the live buffer
+    :param state: (dict) scalars and small arrays of the buffer
+    :param compress: (bool) write the chunks with np.savez_compressed
+    :param chunk_size: (int) rows per chunk file
+    :param background: (bool) write on a background thread
+    :return: (threading.Thread) the writer thread, None if written in the foreground
+    """
+    if background:
+        thread = threading.Thread(
+            target=save_snapshot,
+            args=(path, arrays, state, compress, chunk_size, False),
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    chunks = {}
+    for key, array in arrays.items():
+        chunks[key] = max(int(np.ceil(len(array) / chunk_size)), 1)
+        for idx in range(chunks[key]):
+            chunk = array[idx * chunk_size : (idx + 1) * chunk_size]
+            if compress:
+                np.savez_compressed(os.path.join(tmp_path, f"{key}.{idx:05d}.npz"), chunk=chunk)
+            else:
+                np.save(os.path.join(tmp_path, f"{key}.{idx:05d}.npy"), chunk)
+    np.savez(
+        os.path.join(tmp_path, "state.npz"),
+        __chunks__=np.array(list(chunks.items()), dtype=object),
+        __compress__=compress,
+        **state,
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return None
+
+
+def check_snapshot_support(replay_buffer):
+    """Raise a ValueError if replay_buffer can not write snapshots with save_replay.
+
+    :param replay_buffer: the replay buffer of an agent, under its prefetch or pipeline wrapper
+    """
+    # the prefetch and pipeline wrappers keep the wrapped buffer in replay_buffer
+    while "replay_buffer" in vars(replay_buffer):
+        replay_buffer = replay_buffer.replay_buffer
+    if not hasattr(replay_buffer, "save_replay"):
+        raise ValueError(
+            "{} does not support replay snapshots, only the cpprb replay buffers do".format(
+                type(replay_buffer).__name__
+            )
+        )
+
+
+def load_snapshot(path):
+    """Read a snapshot written by save_snapshot.
+
+    :param path: (str) snapshot directory
+    :return: (tuple) the arrays and the state dicts
+    """
+    with np.load(os.path.join(path, "state.npz"), allow_pickle=True) as data:
+        state = dict((k, data[k]) for k in data.files)
+    chunks = state.pop("__chunks__")
+    compress = bool(state.pop("__compress__"))
+    arrays = {}
+    for key, num_chunks in chunks:
+        parts = []
+        for idx in range(num_chunks):
+            if compress:
+                with np.load(os.path.join(path, f"{key}.{idx:05d}.npz")) as data:
+                    parts.append(data["chunk"])
+            else:
+                parts.append(np.load(os.path.join(path, f"{key}.{idx:05d}.npy")))
+        arrays[key] = np.concatenate(parts)
+    return arrays, state
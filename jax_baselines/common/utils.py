@@ -36,11 +36,51 @@ def restore(ckpt_dir):
     return jax.tree_unflatten(treedef, flat_state)
 
 
-def key_gen(seed):
-    key = jax.random.PRNGKey(seed)
-    while True:
-        key, subkey = jax.random.split(key)
-        yield subkey
+class KeySupply(object):
+    def __init__(self, seed, chunk_size=4096):
+        """Iterator of PRNG keys split on the device chunk_size at a time.
+
+        The keys of a chunk are handed out from a host array, and the next chunk is split and
+        copied to the host in the background as soon as the current one is taken, so next()
+        neither dispatches to nor waits on the device. The keys are raw uint32 keys, taken by
+        jax.random and the apply functions of the models like the ones of jax.random.PRNGKey.
+
+        :param seed: (int) seed of the key sequence
+        :param chunk_size: (int) number of keys split at a time
+        """
+        self.chunk_size = chunk_size
+        self.key = jax.random.PRNGKey(seed)
+        self.next_keys = self.split()
+        self.refill()
+
+    def split(self):
+        self.key, subkey = jax.random.split(self.key)
+        keys = jax.random.split(subkey, self.chunk_size)
+        keys.copy_to_host_async()
+        return keys
+
+    def refill(self):
+        self.keys = np.asarray(self.next_keys)
+        self.idx = 0
+        self.next_keys = self.split()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.idx == self.chunk_size:
+            self.refill()
+        key = self.keys[self.idx]
+        self.idx += 1
+        return key
+
+
+def key_gen(seed, chunk_size=4096):
+    """Key sequence of an agent, next(key_seq) gives a new key.
+
+    :return: (KeySupply) the keys of seed, split chunk_size at a time
+    """
+    return KeySupply(seed, chunk_size)
 
 
 def random_split_like_tree(rng_key: jax.random.PRNGKey, target: PyTree = None, treedef=None):
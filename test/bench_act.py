@@ -0,0 +1,56 @@
+import argparse
+import time
+from collections import deque
+
+import jax
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.DQN.dqn import DQN
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+
+def bench_actions(agent, obs, epsilon, steps=2000):
+    """Host microseconds per actions call, the actions are on the host when it returns."""
+    for _ in range(10):
+        # compile
+        agent.actions([obs], epsilon)
+    start = time.perf_counter()
+    for _ in range(steps):
+        agent.actions([obs], epsilon)
+    return 1e6 * (time.perf_counter() - start) / steps
+
+
+def bench_discription(agent, steps=200):
+    """Host microseconds to summarize the last losses for the progress bar."""
+    agent.lossque = deque([jax.numpy.asarray(np.float32(l)) for l in range(10)], maxlen=10)
+    agent.update_eps = 0.1
+    agent.discription()
+    start = time.perf_counter()
+    for _ in range(steps):
+        agent.discription()
+    return 1e6 * (time.perf_counter() - start) / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default="CartPole-v1", help="environment")
+    parser.add_argument("--worker", type=int, default=8, help="batch of observations")
+    args = parser.parse_args()
+    env_builder, env_info = get_env_builder(args.env)
+    for param_noise in [False, True]:
+        agent = DQN(
+            env_builder,
+            model_builder_maker=model_builder_maker,
+            param_noise=param_noise,
+            policy_kwargs={"node": 256, "hidden_n": 2},
+        )
+        obs = np.random.normal(size=(args.worker, *agent.observation_space[0])).astype(np.float32)
+        name = "noisynet" if param_noise else "epsilon greedy"
+        for epsilon in [0.0, 0.5, 1.0]:
+            print(
+                "{}, epsilon = {} : {:.1f} us per step".format(
+                    name, epsilon, bench_actions(agent, obs, epsilon)
+                )
+            )
+    print("progress bar losses : {:.1f} us".format(bench_discription(agent)))
@@ -0,0 +1,38 @@
+import argparse
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from jax_baselines.common.atari_wrappers import make_wrap_atari
+
+
+def bench(env_name, fused, steps=5000):
+    env = make_wrap_atari(env_name, clip_rewards=True, fused=fused)
+    env.reset(seed=0)
+    np.random.seed(0)
+    actions = np.random.randint(env.action_space.n, size=steps)
+    start = time.perf_counter()
+    for action in actions:
+        obs, reward, terminated, truncated, info = env.step(action)
+        np.asarray(obs)
+        if terminated or truncated:
+            env.reset()
+    elapsed = time.perf_counter() - start
+    env.close()
+    return elapsed / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default="BreakoutNoFrameskip-v4", help="environment")
+    parser.add_argument("--steps", type=int, default=5000, help="agent steps per run")
+    args = parser.parse_args()
+    frames = 4 if "NoFrameskip" in gym.spec(args.env).id else 1
+    for name, fused in [("wrapper chain", False), ("fused", True)]:
+        latency = bench(args.env, fused, args.steps)
+        print(
+            "{}, {} : {:.1f} us per step, {:.1f} us per frame".format(
+                args.env, name, latency * 1e6, latency * 1e6 / frames
+            )
+        )
@@ -0,0 +1,86 @@
+import argparse
+import time
+
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+
+
+def make_agent(algo, env_builder, prioritized_replay, batch_size):
+    if algo == "DQN":
+        from jax_baselines.DQN.dqn import DQN as agent_class
+        from model_builder.flax.qnet.dqn_builder import model_builder_maker
+    elif algo == "C51":
+        from jax_baselines.C51.c51 import C51 as agent_class
+        from model_builder.flax.qnet.c51_builder import model_builder_maker
+    elif algo == "QRDQN":
+        from jax_baselines.QRDQN.qrdqn import QRDQN as agent_class
+        from model_builder.flax.qnet.qrdqn_builder import model_builder_maker
+    elif algo == "IQN":
+        from jax_baselines.IQN.iqn import IQN as agent_class
+        from model_builder.flax.qnet.iqn_builder import model_builder_maker
+    elif algo == "FQF":
+        from jax_baselines.FQF.fqf import FQF as agent_class
+        from model_builder.flax.qnet.fqf_builder import model_builder_maker
+    agent = agent_class(
+        env_builder,
+        model_builder_maker=model_builder_maker,
+        batch_size=batch_size,
+        prioritized_replay=prioritized_replay,
+        policy_kwargs={"node": 256, "hidden_n": 2},
+    )
+    # train_step logs through the run opened by learn
+    agent.logger_run = None
+    return agent
+
+
+def fill(agent, size=10000):
+    obs_shape = agent.observation_space[0]
+    for _ in range(size // 100):
+        agent.replay_buffer.add(
+            [np.random.normal(size=(100, *obs_shape)).astype(np.float32)],
+            np.random.randint(agent.action_size[0], size=(100, 1)),
+            np.random.normal(size=100),
+            [np.random.normal(size=(100, *obs_shape)).astype(np.float32)],
+            np.random.rand(100) < 0.01,
+            np.zeros(100),
+        )
+
+
+def bench(agent, gradient_steps, fused, updates=512):
+    """Updates per second of gradient_steps updates run as one fused call, or one call each."""
+    calls, steps = (1, gradient_steps) if fused else (gradient_steps, 1)
+    for _ in range(2):
+        # compile
+        for _ in range(calls):
+            agent.train_step(0, steps)
+    start = time.perf_counter()
+    for _ in range(updates // gradient_steps):
+        for _ in range(calls):
+            loss = agent.train_step(0, steps)
+    np.asarray(loss)
+    return updates / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default="CartPole-v1", help="environment")
+    parser.add_argument(
+        "--algo", type=str, nargs="+", default=["DQN", "C51", "QRDQN", "IQN", "FQF"], help="algos"
+    )
+    parser.add_argument("--gradient_steps", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch", type=int, default=32, help="batch size")
+    parser.add_argument("--per", action="store_true", help="prioritized replay")
+    args = parser.parse_args()
+    env_builder, env_info = get_env_builder(args.env)
+    for algo in args.algo:
+        agent = make_agent(algo, env_builder, args.per, args.batch)
+        fill(agent)
+        for gradient_steps in args.gradient_steps:
+            single = bench(agent, gradient_steps, fused=False)
+            fused = bench(agent, gradient_steps, fused=True)
+            print(
+                "{}, K = {} : {:.0f} updates/s one call per update, {:.0f} updates/s fused".format(
+                    algo, gradient_steps, single, fused
+                )
+            )
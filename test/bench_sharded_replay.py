@@ -0,0 +1,82 @@
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import (
+    MultiPrioritizedReplayBuffer,
+    ReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
+)
+
+observation_space = [[84, 84, 4]]
+chunk = 1000  # Ape-X worker local buffer size
+
+
+def worker(buffer_info, stop, seed):
+    # same flush as Ape_X_Worker.run, a local buffer added to the global one in one call
+    gloabal_buffer, env_dict, n_s = buffer_info
+    local_buffer = ReplayBuffer(chunk, env_dict=env_dict, n_s=n_s)
+    rng = np.random.default_rng(seed)
+    obs = [rng.integers(0, 256, size=(1, 84, 84, 4), dtype=np.uint8)]
+    for _ in range(chunk):
+        local_buffer.add(obs, 0, 1.0, obs, False, False)
+    transition = local_buffer.get_buffer()
+    while not stop.is_set():
+        gloabal_buffer.add(**transition, priorities=rng.random(chunk))
+
+
+def bench(replay_buffer, num_workers, batch_size=512, samples=200):
+    stop = mp.Event()
+    jobs = [
+        mp.Process(target=worker, args=(replay_buffer.buffer_info(idx), stop, idx))
+        for idx in range(num_workers)
+    ]
+    for job in jobs:
+        job.start()
+    while len(replay_buffer) < 20 * batch_size:
+        time.sleep(0.1)
+    latency = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        data = replay_buffer.sample(batch_size, 0.4)
+        replay_buffer.update_priorities(data["indexes"], np.random.rand(batch_size))
+        latency.append(time.perf_counter() - start)
+    stop.set()
+    for job in jobs:
+        job.join()
+    return np.array(latency) * 1e3
+
+
+if __name__ == "__main__":
+    m = mp.Manager()
+    num_workers = 8
+    single = MultiPrioritizedReplayBuffer(200000, observation_space, 0.6, 1, 1, 0.99, m)
+    latency = bench(single, num_workers)
+    print(
+        "single buffer, {} workers : sample+update {:.2f} ms (p99 {:.2f} ms)".format(
+            num_workers, np.mean(latency), np.percentile(latency, 99)
+        )
+    )
+    for num_shards in [2, 4, 8]:
+        sharded = ShardedPrioritizedReplayBuffer(
+            200000, observation_space, 0.6, 1, 1, 0.99, m, num_shards=num_shards
+        )
+        sharded.shard_stats()
+        latency = bench(sharded, num_workers)
+        stats = sharded.shard_stats()
+        print(
+            "{} shards, {} workers : sample+update {:.2f} ms (p99 {:.2f} ms)".format(
+                num_shards, num_workers, np.mean(latency), np.percentile(latency, 99)
+            )
+        )
+        for idx in range(num_shards):
+            print(
+                "  shard {} : insert {:.0f} / sec, sample {:.0f} / sec".format(
+                    idx,
+                    stats[f"replay/shard{idx}/insert_per_sec"],
+                    stats[f"replay/shard{idx}/sample_per_sec"],
+                )
+            )
+        sharded.close()
+    m.shutdown()
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+
+from jax_baselines.SPR.efficent_buffer import SumTree
+
+
+class RecursiveSumTree:
+    """Per element recursive sum tree, the previous SPR/BBF implementation, kept as a baseline."""
+
+    write = 0
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = np.zeros(2 * capacity - 1, dtype=np.float64)
+        self.data = np.zeros(capacity, dtype=np.int32)
+        self.n_entries = 0
+
+    def _propagate(self, idx, change):
+        parent = (idx - 1) // 2
+        self.tree[parent] += change
+        if parent != 0:
+            self._propagate(parent, change)
+
+    def _retrieve(self, idx, s):
+        left = 2 * idx + 1
+        right = left + 1
+        if left >= len(self.tree):
+            return idx
+        if s <= self.tree[left]:
+            return self._retrieve(left, s)
+        else:
+            return self._retrieve(right, s - self.tree[left])
+
+    def total(self):
+        return self.tree[0]
+
+    def add(self, p, data):
+        idx = self.write + self.capacity - 1
+        self.data[self.write] = data
+        self.update(idx, p)
+        self.write = (self.write + 1) % self.capacity
+        self.n_entries = min(self.n_entries + 1, self.capacity)
+
+    def update(self, idx, p):
+        change = p - self.tree[idx]
+        self.tree[idx] = p
+        self._propagate(idx, change)
+
+    def get(self, s):
+        idx = self._retrieve(0, s)
+        return (idx, self.tree[idx], self.data[idx - self.capacity + 1])
+
+
+def fill(tree, priorities):
+    if isinstance(tree, SumTree):
+        # fill leaves directly and rebuild the tree in one pass
+        tree.tree[tree.leaf_offset : tree.leaf_offset + len(priorities)] = priorities
+        tree.data[: len(priorities)] = np.arange(len(priorities))
+        tree.n_entries = len(priorities)
+        tree._propagate(np.arange(len(priorities)) + tree.leaf_offset)
+    else:
+        for i, p in enumerate(priorities):
+            tree.add(p, i)
+
+
+def bench_recursive(tree, batch_size, iters):
+    start = time.perf_counter()
+    for _ in range(iters):
+        segment = tree.total() / batch_size
+        idxs = []
+        for i in range(batch_size):
+            idx, _, _ = tree.get(np.random.uniform(segment * i, segment * (i + 1)))
+            idxs.append(idx)
+        for idx in idxs:
+            tree.update(idx, np.random.uniform())
+    return (time.perf_counter() - start) / iters
+
+
+def bench_batched(tree, batch_size, iters):
+    start = time.perf_counter()
+    for _ in range(iters):
+        segment = tree.total() / batch_size
+        s = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        idxs, _, _ = tree.get(s)
+        tree.update(idxs, np.random.uniform(size=batch_size))
+    return (time.perf_counter() - start) / iters
+
+
+if __name__ == "__main__":
+    batch_size = 32 * 2  # BBF style batch_size * gradient_steps
+    iters = 20
+    print(f"sample + update of {batch_size} items, mean over {iters} iterations")
+    for size in [int(1e5), int(3e5), int(1e6)]:
+        priorities = np.random.uniform(size=size)
+        recursive = RecursiveSumTree(size)
+        fill(recursive, priorities)
+        batched = SumTree(size)
+        fill(batched, priorities)
+        assert np.isclose(recursive.total(), batched.total())
+        t_rec = bench_recursive(recursive, batch_size, iters)
+        t_bat = bench_batched(batched, batch_size, iters)
+        print(
+            f"size {size:>8d} : recursive {t_rec * 1e3:8.3f} ms, "
+            f"batched {t_bat * 1e3:8.3f} ms, speedup x{t_rec / t_bat:6.1f}"
+        )
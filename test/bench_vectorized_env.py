@@ -0,0 +1,79 @@
+import argparse
+import pickle
+import time
+
+import numpy as np
+import ray
+
+from jax_baselines.common.env_builer import get_env_builder
+
+
+def bench(env_name, num_workers, iterations=2000, **kwargs):
+    start = time.perf_counter()
+    env_builder, env_info = get_env_builder(env_name, **kwargs)
+    env = env_builder(num_workers)
+    startup = time.perf_counter() - start
+    action_space = env.get_info()["action_space"]
+    env_steps = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        obs = env.current_obs()
+        env.step(np.stack([[action_space.sample()] for _ in range(len(obs))]))
+        (
+            next_obses,
+            final_obses,
+            done_idx,
+            rewards,
+            terminateds,
+            truncateds,
+            infos,
+        ) = env.get_result()
+        env_steps += len(rewards)
+    elapsed = time.perf_counter() - start
+    sent = step_bytes(env, action_space) if hasattr(env, "workers") else None
+    env.close()
+    return startup, env_steps / elapsed, sent
+
+
+def step_bytes(env, action_space, steps=100):
+    """Mean bytes a ray actor sends back per env step, as serialized for the object store."""
+    sent = 0
+    for _ in range(steps):
+        actions = np.stack([[action_space.sample()] for _ in range(len(env.actor_envs[0]))])
+        sent += len(pickle.dumps(ray.get(env.workers[0].step.remote(actions)), protocol=5))
+    return sent / steps / len(env.actor_envs[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env", type=str, default="BreakoutNoFrameskip-v4", help="environment")
+    parser.add_argument("--workers", type=int, nargs="+", default=[16, 32, 64], help="workers")
+    parser.add_argument(
+        "--async_fraction", type=float, default=0.5, help="fraction of workers waited for"
+    )
+    parser.add_argument("--iterations", type=int, default=2000, help="iterations per run")
+    parser.add_argument(
+        "--frame_transport", type=int, default=4, help="frames stacked in the image obs"
+    )
+    args = parser.parse_args()
+    for num_workers in args.workers:
+        async_workers = max(int(num_workers * args.async_fraction), 1)
+        for name, kwargs in [
+            ("ray", {}),
+            ("ray, frame transport", {"frame_transport": args.frame_transport}),
+            (f"ray, first {async_workers}", {"async_workers": async_workers}),
+            ("subproc", {"vec_env": "subproc"}),
+            ("gymnasium sync", {"vec_env": "gym_sync"}),
+            ("gymnasium async", {"vec_env": "gym_async"}),
+        ]:
+            startup, steps_per_sec, sent = bench(args.env, num_workers, args.iterations, **kwargs)
+            print(
+                "{}, {} workers, {} : start-up {:.2f} s, {:.0f} steps/s{}".format(
+                    args.env,
+                    num_workers,
+                    name,
+                    startup,
+                    steps_per_sec,
+                    "" if sent is None else ", {:.0f} bytes/step sent".format(sent),
+                )
+            )
@@ -47,6 +47,11 @@ if __name__ == "__main__":
     parser.add_argument("--initial_eps", type=float, default=0.4, help="initial epsilon")
     parser.add_argument("--eps_decay", type=float, default=3, help="exploration fraction")
     parser.add_argument("--cvar", type=float, default=1.0, help="cvar")
+    parser.add_argument("--replay_shards", type=int, default=1, help="prioritized replay shards")
+    parser.add_argument(
+        "--background_eval", action="store_true", help="evaluate the learner on a background thread"
+    )
+    parser.add_argument("--eval_workers", type=int, default=8, help="parallel eval envs")
     parser.add_argument("--time_scale", type=float, default=20.0, help="unity time scale")
     parser.add_argument(
         "--capture_frame_rate", type=int, default=1, help="unity capture frame rate"
@@ -92,6 +97,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
         )
     elif args.algo == "TD3":
         if args.model_lib == "flax":
@@ -118,6 +126,9 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
         )
 
     agent.learn(int(args.steps))
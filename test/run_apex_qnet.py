@@ -51,6 +51,11 @@ if __name__ == "__main__":
     parser.add_argument("--eps_decay", type=float, default=3, help="exploration fraction")
     parser.add_argument("--clip_rewards", action="store_true")
     parser.add_argument("--compress_memory", action="store_true")
+    parser.add_argument("--replay_shards", type=int, default=1, help="prioritized replay shards")
+    parser.add_argument(
+        "--background_eval", action="store_true", help="evaluate the learner on a background thread"
+    )
+    parser.add_argument("--eval_workers", type=int, default=8, help="parallel eval envs")
     parser.add_argument("--time_scale", type=float, default=20.0, help="unity time scale")
     parser.add_argument(
         "--capture_frame_rate", type=int, default=1, help="unity capture frame rate"
@@ -100,6 +105,9 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
         )
     elif args.algo == "C51":
         if args.model_lib == "flax":
@@ -130,6 +138,9 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
             categorial_max=args.max,
             categorial_min=args.min,
         )
@@ -162,6 +173,9 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
             n_support=args.n_support,
             delta=args.delta,
         )
@@ -194,6 +208,9 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            replay_shards=args.replay_shards,
+            eval_env_builder=env_builder if args.background_eval else None,
+            eval_workers=args.eval_workers,
             n_support=args.n_support,
             delta=args.delta,
             CVaR=args.CVaR,
@@ -17,6 +17,19 @@ if __name__ == "__main__":
     parser.add_argument("--env", type=str, default="Pendulum-v0", help="environment")
     parser.add_argument("--worker_id", type=int, default=0, help="unlty ml agent's worker id")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vec_env",
+        type=str,
+        default="ray",
+        choices=["ray", "subproc", "gym_sync", "gym_async"],
+        help="vectorized env",
+    )
+    parser.add_argument(
+        "--envs_per_worker", type=int, default=1, help="envs stepped by each ray worker"
+    )
+    parser.add_argument(
+        "--async_workers", type=int, default=0, help="ray workers waited for each step, 0 for all"
+    )
     parser.add_argument("--algo", type=str, default="DDPG", help="algo ID")
     parser.add_argument("--gamma", type=float, default=0.995, help="gamma")
     parser.add_argument(
@@ -43,6 +56,22 @@ if __name__ == "__main__":
     parser.add_argument("--hidden_n", type=int, default=2, help="hidden layer number")
     parser.add_argument("--action_noise", type=float, default=0.1, help="action_noise")
     parser.add_argument("--optimizer", type=str, default="adam", help="optimaizer")
+    parser.add_argument("--memmap_dir", type=str, default=None)
+    parser.add_argument("--prefetch", action="store_true")
+    parser.add_argument("--deferred_priorities", action="store_true")
+    parser.add_argument("--eval_workers", type=int, default=8, help="parallel eval envs")
+    parser.add_argument(
+        "--background_eval", action="store_true", help="evaluate on a background thread"
+    )
+    parser.add_argument(
+        "--replay_ratio", type=float, default=None, help="gradient steps per env step"
+    )
+    parser.add_argument("--pipeline", action="store_true", help="train on a learner thread")
+    parser.add_argument(
+        "--max_policy_lag", type=int, default=None, help="updates the actor params can lag"
+    )
+    parser.add_argument("--replay_snapshot", type=str, default=None, help="replay snapshot dir")
+    parser.add_argument("--compress_snapshot", action="store_true")
     parser.add_argument("--gradient_steps", type=int, default=1, help="gradient_steps")
     parser.add_argument("--train_freq", type=int, default=1, help="train_frequancy")
     parser.add_argument("--critic_num", type=int, default=2, help="tqc critic number")
@@ -56,7 +85,12 @@ if __name__ == "__main__":
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vec_env=args.vec_env,
+        envs_per_worker=args.envs_per_worker,
+        async_workers=args.async_workers,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -92,6 +126,14 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            deferred_priorities=args.deferred_priorities,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
         )
     if args.algo == "TD3":
         if args.model_lib == "flax":
@@ -121,6 +163,14 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            deferred_priorities=args.deferred_priorities,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
         )
     if args.algo == "SAC":
         if args.model_lib == "flax":
@@ -150,6 +200,14 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            deferred_priorities=args.deferred_priorities,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
         )
     if args.algo == "TQC":
         if args.model_lib == "flax":
@@ -183,6 +241,14 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            deferred_priorities=args.deferred_priorities,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
         )
     if args.algo == "TD7":
         if args.model_lib == "flax":
@@ -211,8 +277,19 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            deferred_priorities=args.deferred_priorities,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
         )
 
+    if args.replay_snapshot is not None:
+        agent.set_replay_snapshot(args.replay_snapshot, args.compress_snapshot)
+
     agent.learn(int(args.steps), experiment_name=args.experiment_name)
 
     agent.test()
@@ -15,6 +15,12 @@ if __name__ == "__main__":
     parser.add_argument("--env", type=str, default="BreakoutNoFrameskip-v4", help="environment")
     parser.add_argument("--worker_id", type=int, default=0, help="unlty ml agent's worker id")
     parser.add_argument("--worker", type=int, default=16, help="gym_worker_size")
+    parser.add_argument(
+        "--frame_transport",
+        type=int,
+        default=0,
+        help="stacked frames of image obs sent one frame at a time by ray workers, 0 for whole obs",
+    )
     parser.add_argument("--update_freq", type=int, default=100, help="update frequency")
     parser.add_argument("--algo", type=str, default="A2C", help="algo ID")
     parser.add_argument("--gamma", type=float, default=0.995, help="gamma")
@@ -48,7 +54,10 @@ if __name__ == "__main__":
 
     ray.init(num_cpus=args.worker + 4, num_gpus=0)
 
-    workers = [Impala_Worker.remote(env_name) for i in range(args.worker)]
+    workers = [
+        Impala_Worker.remote(env_name, frame_transport=args.frame_transport)
+        for i in range(args.worker)
+    ]
 
     env_type = "SingleEnv"
 
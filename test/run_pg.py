@@ -12,6 +12,22 @@ if __name__ == "__main__":
     parser.add_argument("--model_lib", type=str, default="flax", help="model lib")
     parser.add_argument("--worker_id", type=int, default=0, help="unlty ml agent's worker id")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vec_env",
+        type=str,
+        default="ray",
+        choices=["ray", "subproc", "gym_sync", "gym_async", "jax"],
+        help="vectorized env",
+    )
+    parser.add_argument(
+        "--envs_per_worker", type=int, default=1, help="envs stepped by each ray worker"
+    )
+    parser.add_argument(
+        "--frame_transport",
+        type=int,
+        default=0,
+        help="stacked frames of image obs sent one frame at a time by ray workers, 0 for whole obs",
+    )
     parser.add_argument("--algo", type=str, default="A2C", help="algo ID")
     parser.add_argument("--gamma", type=float, default=0.995, help="gamma")
     parser.add_argument("--lamda", type=float, default=0.95, help="gae lamda")
@@ -31,13 +47,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "--capture_frame_rate", type=int, default=1, help="unity capture frame rate"
     )
+    parser.add_argument("--eval_workers", type=int, default=8, help="parallel eval envs")
+    parser.add_argument(
+        "--background_eval", action="store_true", help="evaluate on a background thread"
+    )
     parser.set_defaults(gae_normalize=False)
 
     args = parser.parse_args()
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vec_env=args.vec_env,
+        envs_per_worker=args.envs_per_worker,
+        frame_transport=args.frame_transport,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -60,6 +85,8 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
         )
     if args.algo == "PPO":
         agent = PPO(
@@ -76,6 +103,8 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
         )
     if args.algo == "TPPO":
         agent = TPPO(
@@ -92,6 +121,8 @@ if __name__ == "__main__":
             log_dir=args.logdir,
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
         )
 
     agent.learn(int(args.steps), experiment_name=args.experiment_name)
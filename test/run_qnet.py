@@ -50,6 +50,25 @@ if __name__ == "__main__":
     parser.add_argument("--hidden_n", type=int, default=2, help="hidden layer number")
     parser.add_argument("--final_eps", type=float, default=0.1, help="final epsilon")
     parser.add_argument("--worker", type=int, default=1, help="gym_worker_size")
+    parser.add_argument(
+        "--vec_env",
+        type=str,
+        default="ray",
+        choices=["ray", "subproc", "gym_sync", "gym_async", "jax"],
+        help="vectorized env",
+    )
+    parser.add_argument(
+        "--envs_per_worker", type=int, default=1, help="envs stepped by each ray worker"
+    )
+    parser.add_argument(
+        "--frame_transport",
+        type=int,
+        default=0,
+        help="stacked frames of image obs sent one frame at a time by ray workers, 0 for whole obs",
+    )
+    parser.add_argument(
+        "--async_workers", type=int, default=0, help="ray workers waited for each step, 0 for all"
+    )
     parser.add_argument("--optimizer", type=str, default="adamw", help="optimaizer")
     parser.add_argument("--train_freq", type=int, default=1, help="train_frequancy")
     parser.add_argument("--gradient_steps", type=int, default=1, help="gradient steps")
@@ -59,6 +78,23 @@ if __name__ == "__main__":
     )
     parser.add_argument("--clip_rewards", action="store_true")
     parser.add_argument("--compress_memory", action="store_true")
+    parser.add_argument("--device_replay", action="store_true")
+    parser.add_argument("--memmap_dir", type=str, default=None)
+    parser.add_argument("--prefetch", action="store_true")
+    parser.add_argument("--eval_workers", type=int, default=8, help="parallel eval envs")
+    parser.add_argument(
+        "--background_eval", action="store_true", help="evaluate on a background thread"
+    )
+    parser.add_argument(
+        "--replay_ratio", type=float, default=None, help="gradient steps per env step"
+    )
+    parser.add_argument("--pipeline", action="store_true", help="train on a learner thread")
+    parser.add_argument(
+        "--max_policy_lag", type=int, default=None, help="updates the actor params can lag"
+    )
+    parser.add_argument("--replay_snapshot", type=str, default=None, help="replay snapshot dir")
+    parser.add_argument("--compress_snapshot", action="store_true")
+    parser.add_argument("--frame_replay", action="store_true")
     parser.add_argument("--hl_gauss", action="store_true")
     parser.add_argument("--scaled_by_reset", action="store_true")
     parser.add_argument("--time_scale", type=float, default=20.0, help="unity time scale")
@@ -69,7 +105,13 @@ if __name__ == "__main__":
     env_name = args.env
     embedding_mode = "normal"
     env_builder, env_info = get_env_builder(
-        env_name, timescale=args.time_scale, capture_frame_rate=args.capture_frame_rate
+        env_name,
+        vec_env=args.vec_env,
+        envs_per_worker=args.envs_per_worker,
+        frame_transport=args.frame_transport,
+        async_workers=args.async_workers,
+        timescale=args.time_scale,
+        capture_frame_rate=args.capture_frame_rate,
     )
     env_name = env_info["env_id"]
     env_type = env_info["env_type"]
@@ -104,6 +146,15 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_replay=args.device_replay,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
+            frame_replay=args.frame_replay,
         )
     elif args.algo == "C51":
         if args.model_lib == "flax":
@@ -166,6 +217,15 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                device_replay=args.device_replay,
+                memmap_dir=args.memmap_dir,
+                prefetch=args.prefetch,
+                eval_workers=args.eval_workers,
+                background_eval=args.background_eval,
+                replay_ratio=args.replay_ratio,
+                pipeline=args.pipeline,
+                max_policy_lag=args.max_policy_lag,
+                frame_replay=args.frame_replay,
             )
     elif args.algo == "QRDQN":
         if args.model_lib == "flax":
@@ -198,6 +258,15 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_replay=args.device_replay,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
+            frame_replay=args.frame_replay,
         )
     elif args.algo == "IQN":
         if args.model_lib == "flax":
@@ -231,6 +300,15 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_replay=args.device_replay,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
+            frame_replay=args.frame_replay,
         )
     elif args.algo == "FQF":
         if args.model_lib == "flax":
@@ -263,6 +341,15 @@ if __name__ == "__main__":
             policy_kwargs=policy_kwargs,
             optimizer=args.optimizer,
             compress_memory=args.compress_memory,
+            device_replay=args.device_replay,
+            memmap_dir=args.memmap_dir,
+            prefetch=args.prefetch,
+            eval_workers=args.eval_workers,
+            background_eval=args.background_eval,
+            replay_ratio=args.replay_ratio,
+            pipeline=args.pipeline,
+            max_policy_lag=args.max_policy_lag,
+            frame_replay=args.frame_replay,
         )
     elif args.algo == "SPR":
         if args.model_lib == "flax":
@@ -290,6 +377,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                frame_replay=args.frame_replay,
             )
         else:
             agent = SPR(
@@ -311,6 +399,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                frame_replay=args.frame_replay,
             )
 
     elif args.algo == "BBF":
@@ -342,6 +431,7 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                frame_replay=args.frame_replay,
             )
         else:
             agent = BBF(
@@ -366,8 +456,12 @@ if __name__ == "__main__":
                 policy_kwargs=policy_kwargs,
                 optimizer=args.optimizer,
                 compress_memory=args.compress_memory,
+                frame_replay=args.frame_replay,
             )
 
+    if args.replay_snapshot is not None:
+        agent.set_replay_snapshot(args.replay_snapshot, args.compress_snapshot)
+
     agent.learn(int(args.steps), experiment_name=args.experiment_name)
 
     agent.test()
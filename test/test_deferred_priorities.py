@@ -0,0 +1,37 @@
+import jax.numpy as jnp
+import numpy as np
+
+from jax_baselines.common.deferred_priorities import DeferredPrioritiesMixin
+
+
+class Buffer(object):
+    def __init__(self):
+        self.updates = []
+
+    def update_priorities(self, indexes, priorities):
+        self.updates.append((indexes, priorities))
+
+
+class Agent(DeferredPrioritiesMixin):
+    def __init__(self, deferred_priorities):
+        self.deferred_priorities = deferred_priorities
+        self.pending_priorities = []
+        self.replay_buffer = Buffer()
+
+
+# the priorities of the gradient steps are merged into one update, the last one of an index wins
+agent = Agent(True)
+agent.update_priorities(np.array([3, 5]), jnp.array([1.0, 2.0]))
+agent.update_priorities(np.array([5, 7]), jnp.array([3.0, 4.0]))
+assert agent.replay_buffer.updates == []
+agent.flush_priorities()
+((indexes, priorities),) = agent.replay_buffer.updates
+assert np.array_equal(indexes, [3, 5, 7]) and np.array_equal(priorities, [1.0, 3.0, 4.0])
+agent.flush_priorities()
+assert len(agent.replay_buffer.updates) == 1
+
+# without deferred_priorities every gradient step writes its priorities
+agent = Agent(False)
+agent.update_priorities(np.array([3]), jnp.array([1.0]))
+assert len(agent.replay_buffer.updates) == 1
+print("deferred priorities : OK")
@@ -0,0 +1,62 @@
+import jax
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import EpochBuffer
+from jax_baselines.common.utils import get_gaes
+
+epoch_size = 16
+worker_size = 4
+
+buffer = EpochBuffer(epoch_size, [[84, 84, 4], [3]], worker_size, [1])
+stores = []
+for epoch in range(3):
+    for t in range(epoch_size):
+        step = epoch * epoch_size + t
+        obs = [np.full((worker_size, 84, 84, 4), step % 256), np.full((worker_size, 3), step)]
+        nxtobs = [
+            np.full((worker_size, 84, 84, 4), (step + 1) % 256),
+            np.full((worker_size, 3), step + 1),
+        ]
+        terminated = (np.arange(worker_size) + step) % 5 == 0
+        buffer.add(
+            obs,
+            np.arange(worker_size)[:, None],
+            np.arange(worker_size) + step,
+            nxtobs,
+            terminated,
+            np.zeros(worker_size),
+        )
+    data = buffer.get_buffer()
+    stores.append(data)
+    # time-major, already stacked, and of the same shapes every epoch
+    assert data["obses"][0].shape == (epoch_size, worker_size, 84, 84, 4)
+    assert data["obses"][0].dtype == np.uint8
+    assert data["actions"].shape == (epoch_size, worker_size, 1)
+    assert data["rewards"].shape == (epoch_size, worker_size, 1)
+    assert np.all(data["obses"][1][:, :, 0] == epoch * epoch_size + np.arange(epoch_size)[:, None])
+    assert np.all(data["rewards"][:, :, 0] - data["obses"][1][:, :, 0] == np.arange(worker_size))
+
+# the two stores are swapped, so the previous rollout is not overwritten by the next one
+assert (
+    stores[0]["rewards"] is stores[2]["rewards"]
+    and stores[1]["rewards"] is not stores[2]["rewards"]
+)
+
+# the advantages over the worker axis match the per-worker advantages
+values = np.random.rand(epoch_size, worker_size, 1).astype(np.float32)
+next_values = np.random.rand(epoch_size, worker_size, 1).astype(np.float32)
+adv = jax.vmap(get_gaes, in_axes=(1, 1, 1, 1, 1, None, None), out_axes=1)(
+    data["rewards"], data["terminateds"], data["truncateds"], values, next_values, 0.99, 0.95
+)
+for w in range(worker_size):
+    adv_w = get_gaes(
+        data["rewards"][:, w],
+        data["terminateds"][:, w],
+        data["truncateds"][:, w],
+        values[:, w],
+        next_values[:, w],
+        0.99,
+        0.95,
+    )
+    assert np.allclose(adv[:, w], adv_w)
+print("epoch buffer : OK")
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from jax_baselines.common.evaluator import BackgroundEvaluator, Evaluator
+
+
+class LifeEnv(gym.Env):
+    """Every life lasts life_len steps and ends the episode, as with an episodic life wrapper,
+    the game restarts after the last life."""
+
+    def __init__(self, life_len=3, lives=3, original_reward=True):
+        self.life_len = life_len
+        self.max_lives = lives
+        self.lives = 0
+        self.original_reward = original_reward
+        self.seeds = []
+
+    def info(self, original_reward):
+        if not self.original_reward:
+            return {}
+        return {"original_reward": original_reward, "lives": self.lives}
+
+    def reset(self, seed=None, options=None):
+        self.seeds.append(seed)
+        if self.lives == 0:
+            self.lives = self.max_lives
+        self.t = 0
+        return np.full(2, self.lives, dtype=np.float32), self.info(0.0)
+
+    def step(self, action):
+        self.t += 1
+        terminated = self.t == self.life_len
+        if terminated:
+            self.lives -= 1
+        return np.zeros(2, np.float32), 1.0, terminated, False, self.info(2.0 + action)
+
+
+batch_sizes = []
+
+
+def actions_fn(obs):
+    batch_sizes.append(len(obs[0]))
+    return obs[0][:, 0].astype(np.int32)
+
+
+# 7 episodes over 3 envs of 3 lives, the original reward is recorded once per game
+for num_envs in [1, 3]:
+    evaluator = Evaluator([LifeEnv() for _ in range(num_envs)], 7)
+    batch_sizes = []
+    result = evaluator.run(actions_fn)
+    assert np.all(result["episode_reward"] == 3) and np.all(result["episode_len"] == 3)
+    assert np.all(result["truncated"] == 0)
+    if num_envs == 1:
+        # games of 3 lives of 3 steps, the first action of a life is the lives left
+        assert result["original_rewards"] == [9 * 2 + 3 + 2 + 1] * 2
+        assert max(batch_sizes) == 1
+    else:
+        # the envs run 3, 2 and 2 episodes, only the first finishes a game
+        assert len(result["original_rewards"]) == 1
+        assert max(batch_sizes) == 3 and len(batch_sizes) == 9
+
+# without original_reward only the clipped rewards are reported
+result = Evaluator([LifeEnv(original_reward=False) for _ in range(8)], 4).run(actions_fn)
+assert result["original_rewards"] is None and len(result["episode_reward"]) == 4
+
+# the envs of env_fn are built on the first run, and each env is seeded apart on its first reset
+built = []
+
+
+def env_fn():
+    built.append(LifeEnv())
+    return built[-1]
+
+
+evaluator = Evaluator([LifeEnv()], 7, env_fn, 4, seed=10)
+assert len(built) == 0
+evaluator.run(actions_fn)
+evaluator.run(actions_fn)
+assert len(built) == 3 and evaluator.envs[1:] == built
+assert [env.seeds[0] for env in evaluator.envs] == [10, 11, 12, 13]
+assert all(seed is None for env in evaluator.envs for seed in env.seeds[1:])
+
+# background evaluations run one at a time off the calling thread, each submit returns the result
+# of the previous one
+background_evaluator = BackgroundEvaluator()
+started = []
+
+
+def eval_fn(steps):
+    started.append(steps)
+    time.sleep(0.05)
+    assert threading.current_thread() is not threading.main_thread()
+    return {"steps": steps}
+
+
+assert background_evaluator.submit(eval_fn, 10) is None
+assert background_evaluator.submit(eval_fn, 20) == {"steps": 10}
+assert background_evaluator.join() == {"steps": 20} and started == [10, 20]
+print("evaluator : OK")
@@ -0,0 +1,60 @@
+import tempfile
+
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import (
+    EpochBuffer,
+    NstepReplayBuffer,
+    ReplayBuffer,
+    final_next_obs,
+)
+from jax_baselines.common.memmap_buffers import MemmapReplayBuffer
+
+worker_size = 4
+
+# the vectorized envs return the reset obs of the finished workers, and their final obs apart
+next_obs = [np.arange(worker_size * 3, dtype=np.float32).reshape(worker_size, 3)]
+done_idx = np.array([False, True, False, True])
+final_obs = [np.full((2, 3), -1.0, dtype=np.float32) * np.array([[1.0], [2.0]])]
+expected = np.copy(next_obs[0])
+expected[1] = -1.0
+expected[3] = -2.0
+
+patched = final_next_obs(next_obs, final_obs, done_idx)
+assert np.array_equal(patched[0], expected)
+assert not np.array_equal(next_obs[0], expected), "the returned batch is not written"
+assert final_next_obs(next_obs, final_obs, np.zeros(worker_size, bool))[0] is next_obs[0]
+rows = np.array([3, 0, 1])
+assert np.array_equal(final_next_obs(next_obs, final_obs, done_idx, rows)[0], expected[rows])
+
+# every buffer stores the final obs as the next obs of the finished rows
+obs = [np.zeros((worker_size, 3), dtype=np.float32)]
+action = np.zeros((worker_size, 1))
+reward = np.ones(worker_size)
+terminated = done_idx.astype(np.float32)
+truncated = np.zeros(worker_size)
+
+rb = ReplayBuffer(100, [[3]])
+rb.add(obs, action, reward, next_obs, terminated, truncated, final_obs=final_obs, done_idx=done_idx)
+assert np.array_equal(rb.get_buffer()["next_obs0"], expected)
+
+nrb = NstepReplayBuffer(100, [[3]], 1, worker_size, n_step=1)
+nrb.add(
+    obs, action, reward, next_obs, terminated, truncated, final_obs=final_obs, done_idx=done_idx
+)
+stored = nrb.get_buffer()
+order = np.argsort(stored["next_obs0"][:, 2])
+assert np.array_equal(stored["next_obs0"][order], expected[np.argsort(expected[:, 2])])
+
+with tempfile.TemporaryDirectory() as memmap_dir:
+    mrb = MemmapReplayBuffer(100, [[3]], 1, worker_size, memmap_dir=memmap_dir)
+    mrb.add(
+        obs, action, reward, next_obs, terminated, truncated, final_obs=final_obs, done_idx=done_idx
+    )
+    assert np.array_equal(mrb.buffer["next_obs0"][:worker_size], expected)
+    mrb.close()
+
+eb = EpochBuffer(1, [[3]], worker_size, [1])
+eb.add(obs, action, reward, next_obs, terminated, truncated, final_obs=final_obs, done_idx=done_idx)
+assert np.array_equal(eb.get_buffer()["nxtobses"][0][0], expected)
+print("final obs : OK")
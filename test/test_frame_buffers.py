@@ -0,0 +1,119 @@
+from collections import deque
+
+import numpy as np
+
+from jax_baselines.common.frame_buffers import (
+    FrameReplayBuffer,
+    PrioritizedFrameReplayBuffer,
+)
+
+n = 3
+gamma = 0.99
+frame_stack = 4
+worker_size = 3
+steps = 400
+rng = np.random.default_rng(0)
+
+buffers = [
+    FrameReplayBuffer(300, [[6, 6, frame_stack], [3]], 1, worker_size, n, gamma, frame_stack),
+    PrioritizedFrameReplayBuffer(
+        300, [[6, 6, frame_stack], [3]], 0.6, 1, worker_size, n, gamma, 1e-4, frame_stack
+    ),
+]
+
+# the FrameStack wrapper repeats the first frame of an episode, the vector observation holds
+# the worker, episode and step of the transition
+frames = [deque(maxlen=frame_stack) for _ in range(worker_size)]
+episodes = [[[]] for _ in range(worker_size)]
+
+
+def reset(w):
+    frame = rng.integers(0, 256, size=(6, 6, 1), dtype=np.uint8)
+    for _ in range(frame_stack):
+        frames[w].append(frame)
+
+
+for w in range(worker_size):
+    reset(w)
+for t in range(steps):
+    obs = np.stack([np.concatenate(f, axis=-1) for f in frames])
+    ids = np.array([[w, len(episodes[w]) - 1, len(episodes[w][-1])] for w in range(worker_size)])
+    action = rng.integers(0, 4, size=(worker_size, 1))
+    reward = rng.normal(size=(worker_size,)).astype(np.float32)
+    terminated = rng.random(worker_size) < 0.05
+    truncated = rng.random(worker_size) < 0.03
+    for w in range(worker_size):
+        frames[w].append(rng.integers(0, 256, size=(6, 6, 1), dtype=np.uint8))
+    nxtobs = np.stack([np.concatenate(f, axis=-1) for f in frames])
+    for buffer in buffers:
+        buffer.add([obs, ids], action, reward, [nxtobs, ids], terminated, truncated)
+    for w in range(worker_size):
+        episodes[w][-1].append(
+            (obs[w], action[w], reward[w], nxtobs[w], terminated[w], truncated[w])
+        )
+        if terminated[w] or truncated[w]:
+            episodes[w].append([])
+            reset(w)
+
+
+def expected(w, e, i):
+    window = episodes[w][e][i : i + n]
+    ret = sum(gamma**k * step[2] for k, step in enumerate(window))
+    return window[0][0], window[0][1], ret, window[-1][3], window[-1][4]
+
+
+for buffer in buffers:
+    data = buffer.sample(256)
+    for b in range(256):
+        w, e, i = data["obses"][1][b].astype(int)
+        obs, action, ret, nxtobs, terminated = expected(w, e, i)
+        assert np.array_equal(data["obses"][0][b], obs)
+        assert np.array_equal(data["nxtobses"][0][b], nxtobs)
+        assert np.array_equal(data["actions"][b], action)
+        assert np.isclose(data["rewards"][b, 0], ret, atol=1e-5)
+        assert data["terminateds"][b, 0] == terminated
+
+prb = buffers[1]
+prb.update_priorities(data["indexes"], np.full(256, 1e-3))
+data = prb.sample(256, 0.4)
+boosted = data["indexes"][:1]
+prb.update_priorities(boosted, np.array([1e4]))
+data = prb.sample(256, 0.4)
+counts = np.bincount(data["indexes"])
+assert np.argmax(counts) == boosted[0] and counts.max() > 64
+print(
+    "{} stored frames for {} transitions : OK".format(
+        buffers[0].buffer["obs0"].shape[0] * worker_size, len(buffers[0])
+    )
+)
+
+# the SPR trajectory buffer rebuilds the same stacks as the buffer storing them whole
+from jax_baselines.SPR.efficent_buffer import TransitionReplayBuffer  # noqa: E402
+
+full = TransitionReplayBuffer(200, [[6, 6, frame_stack]], 1, prediction_depth=5)
+single = TransitionReplayBuffer(200, [[6, 6, frame_stack]], 1, 5, frame_stack=frame_stack)
+frames = [deque(maxlen=frame_stack)]
+reset(0)
+for t in range(500):
+    obs = np.concatenate(frames[0], axis=-1)[None]
+    frames[0].append(rng.integers(0, 256, size=(6, 6, 1), dtype=np.uint8))
+    nxtobs = np.concatenate(frames[0], axis=-1)[None]
+    terminated, truncated = rng.random() < 0.05, rng.random() < 0.03
+    for buffer in [full, single]:
+        buffer.add([obs], t % 4, 1.0, [nxtobs], terminated, truncated)
+    if terminated or truncated:
+        reset(0)
+
+seed = np.random.randint(2**31)
+np.random.seed(seed)
+expected = full.sample(256)
+np.random.seed(seed)
+data = single.sample(256)
+np.random.seed(seed)
+idxs = np.random.randint(0, len(single), size=256)
+# trajectory steps after the end of the episode are masked by filled, the newest row is not a
+# transition yet and the history of the oldest rows is overwritten by the newest ones
+valid = np.concatenate([np.ones((256, 1), dtype=np.bool_), expected["filled"]], axis=1)
+valid[(idxs - single.buffer.next_roll_idx) % 200 < frame_stack] = False
+assert np.array_equal(data["obses"][0][valid], expected["obses"][0][valid])
+print("{} trajectories of single frames match the stacked buffer : OK".format(len(single)))
@@ -0,0 +1,115 @@
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+
+class FakeFrames(gym.Env):
+    """Channel last stacks of 4 random frames, the frames and the episode ends follow the
+    actions, so envs given the same actions stay equal."""
+
+    def __init__(self, frame_shape=(8, 8, 2)):
+        self.frame_shape = frame_shape
+        shape = (*frame_shape[:-1], frame_shape[-1] * 4)
+        self.observation_space = spaces.Box(0, 255, shape, dtype=np.uint8)
+        self.action_space = spaces.Discrete(4)
+        self.episode = 0
+
+    def frame(self, action):
+        rng = np.random.default_rng([self.episode, self.t, action])
+        return rng.integers(0, 256, self.frame_shape, dtype=np.uint8), rng.random() < 0.05
+
+    def reset(self, seed=None, options=None):
+        self.episode += 1
+        self.t = 0
+        frame, _ = self.frame(0)
+        self.stack = np.concatenate([frame] * 4, axis=-1)
+        return self.stack, {}
+
+    def step(self, action):
+        self.t += 1
+        frame, terminated = self.frame(action)
+        self.stack = np.concatenate([self.stack[..., self.frame_shape[-1] :], frame], axis=-1)
+        return self.stack, 1.0, terminated, self.t >= 50, {}
+
+
+gym.register("FakeFrames-v0", entry_point=FakeFrames)
+# atari sized frames for test/bench_vectorized_env.py
+gym.register("FakeAtariFrames-v0", entry_point=FakeFrames, kwargs={"frame_shape": (84, 84, 1)})
+
+if __name__ == "__main__":
+    import ray
+
+    from jax_baselines.common.env_builer import rayVectorizedGymEnv
+    from jax_baselines.common.frame_transport import pack_frames, unpack_frames
+    from jax_baselines.IMPALA.cpprb_buffers import EpochBuffer, unpack_batch
+
+    worker_size = 4
+    env_name = "test_frame_transport:FakeFrames-v0"
+
+    # the stacks rolled from the newest frames match the whole observations
+    results = []
+    for frame_transport in [0, 4]:
+        env = rayVectorizedGymEnv(
+            env_name, worker_size, envs_per_worker=2, frame_transport=frame_transport
+        )
+        action_rng = np.random.default_rng(0)
+        result = [env.current_obs()]
+        for _ in range(200):
+            env.step(action_rng.integers(4, size=(worker_size, 1)))
+            result.extend(env.get_result()[:3])
+        env.close()
+        results.append(result)
+    whole, rolled = results
+    assert sum(np.sum(done_idx) for done_idx in whole[3::3]) > 10
+    assert all(np.array_equal(w, r) for w, r in zip(whole, rolled))
+
+    # asynchronous workers roll the stacks of the envs they return
+    env = rayVectorizedGymEnv(env_name, worker_size, async_workers=2, frame_transport=4)
+    for _ in range(100):
+        obs = env.current_obs()
+        env.step(np.random.randint(4, size=(len(obs), 1)))
+        next_obs, final_obs, done_idx, *_ = env.get_result()
+        obs = env.result_obs
+        assert np.array_equal(obs[~done_idx][..., 2:], next_obs[~done_idx][..., :-2])
+        assert np.array_equal(obs[done_idx][..., 2:], final_obs[..., :-2])
+    env.close()
+    ray.shutdown()
+
+    # a trajectory is sent as its first obs, its newest frames and its reset obs
+    env = FakeFrames()
+    obs, _ = env.reset()
+    obses, nxtobses, dones = [], [], []
+    for t in range(300):
+        next_obs, reward, terminated, truncated, info = env.step(t % 4)
+        obses.append(obs)
+        nxtobses.append(next_obs)
+        dones.append(terminated or truncated)
+        obs = env.reset()[0] if dones[-1] else next_obs
+    obses, nxtobses = np.stack(obses), np.stack(nxtobses)
+    packed = pack_frames(obses, nxtobses, dones, 4)
+    assert sum(p.nbytes for p in packed) < (obses.nbytes + nxtobses.nbytes) / 4
+    unpacked_obses, unpacked_nxtobses = unpack_frames(packed, 4)
+    assert np.array_equal(unpacked_obses, obses) and np.array_equal(unpacked_nxtobses, nxtobses)
+
+    # the IMPALA workers pack their trajectories, the learner unpacks them
+    env_dict = {
+        "obs0": {"shape": [8, 8, 8], "dtype": np.uint8},
+        "action": {"shape": 1},
+        "log_prob": {},
+        "reward": {},
+        "next_obs0": {"shape": [8, 8, 8], "dtype": np.uint8},
+        "terminated": {},
+        "truncted": {},
+    }
+    trajectories = []
+    for frame_transport in [0, 4]:
+        local_buffer = EpochBuffer(len(obses), env_dict, frame_transport)
+        for o, no, d in zip(obses, nxtobses, dones):
+            local_buffer.add([o[None]], 0, 0.0, 1.0, [no[None]], d)
+        trajectories.append(local_buffer.get_buffer())
+    # the learner samples batches of trajectories
+    whole, packed = (unpack_batch(type(t)(*zip(t))) for t in trajectories)
+    assert trajectories[1].nxtobses == [None]
+    assert np.array_equal(whole.obses[0][0], packed.obses[0][0])
+    assert np.array_equal(whole.nxtobses[0][0], packed.nxtobses[0][0])
+    print("frame transport : OK")
@@ -0,0 +1,110 @@
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+from jax_baselines.common.atari_wrappers import (
+    FusedAtariEnv,
+    MaxAndSkipEnv,
+    NoopResetEnv,
+    wrap_deepmind,
+)
+
+
+class FakeAtari(gym.Env):
+    """ALE-like environment with random screens, rewards and lost lives, which is also its own
+    ALE interface."""
+
+    def __init__(self, max_frames=3000):
+        self.observation_space = spaces.Box(0, 255, (210, 160, 3), dtype=np.uint8)
+        self.action_space = spaces.Discrete(4)
+        self._action_set = np.arange(4)
+        self.ale = self
+        self.max_frames = max_frames
+        self.episode = 0
+
+    def get_action_meanings(self):
+        return ["NOOP", "FIRE", "RIGHT", "LEFT"]
+
+    def act(self, action):
+        self.frame += 1
+        rng = np.random.default_rng([self.episode, self.frame, action])
+        if rng.random() < 0.01:
+            self._lives -= 1
+        return float(rng.choice([0, 0, 0, 1, 4, -2]))
+
+    def getScreenRGB(self, out):
+        rng = np.random.default_rng([self.episode, self.frame, 7])
+        out[:] = rng.integers(0, 256, (210, 160, 3), dtype=np.uint8)
+
+    def getScreenGrayscale(self, out):
+        rng = np.random.default_rng([self.episode, self.frame, 8])
+        out[:] = rng.integers(0, 256, (210, 160), dtype=np.uint8)
+
+    def lives(self):
+        return self._lives
+
+    def game_over(self, with_truncation=True):
+        return self._lives == 0 or (with_truncation and self.game_truncated())
+
+    def game_truncated(self):
+        return self.frame >= self.max_frames
+
+    def reset(self, seed=None, options=None):
+        self.episode += 1
+        self.frame = 0
+        self._lives = 3
+        obs = np.zeros((210, 160, 3), dtype=np.uint8)
+        self.getScreenRGB(obs)
+        return obs, {"lives": self._lives}
+
+    def step(self, action):
+        reward = self.act(action)
+        obs = np.zeros((210, 160, 3), dtype=np.uint8)
+        self.getScreenRGB(obs)
+        terminated = self.game_over(with_truncation=False)
+        return obs, reward, terminated, self.game_truncated(), {"lives": self._lives}
+
+
+# the fused wrapper follows the wrapper chain of make_wrap_atari step by step
+env = FakeAtari()
+env = NoopResetEnv(env, noop_max=30)
+env = MaxAndSkipEnv(env, skip=4)
+env = gym.wrappers.TimeLimit(env, max_episode_steps=200)
+env = wrap_deepmind(env, clip_rewards=True, frame_stack=True)
+fused = FusedAtariEnv(FakeAtari(), max_episode_steps=200, stack_buffer=32)
+assert fused.observation_space.shape == env.observation_space.shape
+
+action_rng = np.random.default_rng(0)
+dones = 0
+past_obs = []
+stacked = 0
+terminated = truncated = True
+for t in range(2000):
+    if terminated or truncated:
+        np.random.seed(t)
+        obs, info = env.reset()
+        np.random.seed(t)
+        fused_obs, fused_info = fused.reset()
+        dones += 1
+        stacked += 4
+    else:
+        action = action_rng.integers(4)
+        stacked += 1
+        obs, reward, terminated, truncated, info = env.step(action)
+        fused_obs, fused_reward, fused_terminated, fused_truncated, fused_info = fused.step(action)
+        assert reward == fused_reward
+        assert terminated == fused_terminated and truncated == fused_truncated
+    assert np.array_equal(np.asarray(obs), fused_obs)
+    assert info == fused_info
+    # the views of the rolling stack stay valid for the next 32 - 2 * 4 stacked frames
+    past_obs.append((stacked, fused_obs, np.array(fused_obs)))
+    past_obs = [past for past in past_obs if stacked - past[0] < 32 - 2 * 4]
+    assert all(np.array_equal(view, copy) for _, view, copy in past_obs)
+assert dones > 10
+
+# ALE grayscale screens keep the same layout
+fused = FusedAtariEnv(FakeAtari(), ale_grayscale=True)
+obs, info = fused.reset()
+obs, reward, terminated, truncated, info = fused.step(1)
+assert obs.shape == (84, 84, 4) and obs.dtype == np.uint8 and not obs.flags.writeable
+print("fused atari : OK")
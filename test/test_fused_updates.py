@@ -0,0 +1,84 @@
+import jax
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.DQN.dqn import DQN
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+gradient_steps = 4
+batch_size = 16
+
+env_builder, env_info = get_env_builder("CartPole-v1")
+agent = DQN(
+    env_builder,
+    model_builder_maker=model_builder_maker,
+    batch_size=batch_size,
+    prioritized_replay=True,
+    target_network_update_freq=2,
+    policy_kwargs={"node": 32, "hidden_n": 1},
+)
+agent.logger_run = None
+for _ in range(10):
+    agent.replay_buffer.add(
+        [np.random.normal(size=(100, 4)).astype(np.float32)],
+        np.random.randint(2, size=(100, 1)),
+        np.random.normal(size=100),
+        [np.random.normal(size=(100, 4)).astype(np.float32)],
+        np.random.rand(100) < 0.1,
+        np.zeros(100),
+    )
+
+# the scan over the batches gives the updates, target syncs and priorities of one call each
+data = agent.replay_buffer.sample(gradient_steps * batch_size, 0.4)
+indexes = data.pop("indexes")
+train_state = agent.get_train_state()
+fused_state, (loss, t_mean), fused_priorities, key = agent._fused_train_step(
+    train_state, 0, jax.random.PRNGKey(0), gradient_steps, data
+)
+state = train_state
+priorities = []
+for k in range(gradient_steps):
+    batch = jax.tree_util.tree_map(lambda x: x[k * batch_size : (k + 1) * batch_size], data)
+    *state, step_loss, step_t_mean, step_priorities = agent._train_step(
+        *state, k + 1, None, **batch
+    )
+    priorities.append(step_priorities)
+for fused_leaf, leaf in zip(
+    jax.tree_util.tree_leaves(fused_state), jax.tree_util.tree_leaves(state)
+):
+    assert np.allclose(fused_leaf, leaf, atol=1e-5)
+assert np.allclose(loss, step_loss, atol=1e-5)
+assert np.allclose(fused_priorities, np.concatenate(priorities), atol=1e-5)
+assert fused_priorities.shape[0] == len(indexes)
+# the key is carried out of the scan for the next call
+assert not np.array_equal(key, jax.random.PRNGKey(0))
+
+# the target network is synced at the even steps of the scan
+params, target_params, _ = fused_state
+for p, t in zip(jax.tree_util.tree_leaves(params), jax.tree_util.tree_leaves(target_params)):
+    assert np.array_equal(p, t)
+
+# train_step runs the fused updates and writes their priorities, with the carried key
+train_key = agent.train_key
+agent.train_step(0, gradient_steps)
+assert agent.train_steps_count == gradient_steps
+assert not np.array_equal(agent.train_key, train_key)
+
+# the sample is shuffled before the split, so every batch spans the buffer and its priorities
+# are written back to the indexes it was trained on
+written = []
+update_priorities = agent.replay_buffer.update_priorities
+
+
+def record_update_priorities(indexes, priorities):
+    written.append((np.copy(indexes), np.asarray(priorities)))
+    update_priorities(indexes, priorities)
+
+
+agent.replay_buffer.update_priorities = record_update_priorities
+agent.train_step(0, 8)
+indexes, priorities = written[-1]
+assert len(indexes) == len(priorities) == 8 * batch_size
+for batch_indexes in np.reshape(indexes, (8, batch_size)):
+    assert np.ptp(batch_indexes) > 0.3 * len(agent.replay_buffer)
+print("fused updates : OK")
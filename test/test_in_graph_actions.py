@@ -0,0 +1,40 @@
+from collections import deque
+
+import jax.numpy as jnp
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.DQN.dqn import DQN
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+env_builder, env_info = get_env_builder("CartPole-v1")
+agent = DQN(
+    env_builder,
+    model_builder_maker=model_builder_maker,
+    policy_kwargs={"node": 32, "hidden_n": 1},
+)
+obs = [np.random.normal(size=(1000, 4)).astype(np.float32)]
+
+# without exploration the actions are the greedy ones
+greedy = np.asarray(agent._get_actions(agent.params, obs, None))
+actions = agent.actions(obs, 0.0)
+assert isinstance(actions, np.ndarray) and actions.shape == (1000, 1)
+assert np.array_equal(actions, greedy)
+
+# every observation explores on its own, and the carried key moves on at every call
+first, second = agent.actions(obs, 1.0), agent.actions(obs, 1.0)
+assert not np.array_equal(first, second)
+assert set(np.unique(first)) == {0, 1}
+assert 400 < np.sum(first) < 600
+# half of the observations explore, half of those take the other action
+assert 150 < np.sum(agent.actions(obs, 0.5) != greedy) < 350
+
+# the snapshots act with their own key
+snapshot = agent.eval_snapshot()
+assert not np.array_equal(snapshot.act_key, agent.act_key)
+
+# the losses of the progress bar are copied from the device together
+agent.lossque = deque([jnp.float32(1.0), jnp.float32(3.0)], maxlen=10)
+agent.update_eps = 0.1
+assert "loss : 2.000" in agent.discription()
+print("in graph actions : OK")
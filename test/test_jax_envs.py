@@ -0,0 +1,77 @@
+import gymnasium as gym
+import jax
+import numpy as np
+from tqdm.auto import trange
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.common.jax_envs import JaxGymEnv, JaxVectorizedEnv
+from jax_baselines.common.schedules import LinearSchedule
+from jax_baselines.DQN.dqn import DQN
+from jax_baselines.FQF.fqf import FQF
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+from model_builder.flax.qnet.fqf_builder import model_builder_maker as fqf_model_builder_maker
+
+# the JAX CartPole follows the gymnasium dynamics from the same state
+env = JaxGymEnv("CartPole-v1")
+ref = gym.make("CartPole-v1").unwrapped
+for seed in range(3):
+    obs, _ = env.reset(seed=seed)
+    ref.reset()
+    ref.state = np.asarray(obs, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    terminated = False
+    while not terminated:
+        action = rng.integers(2)
+        obs, reward, terminated, truncated, _ = env.step(np.array([action]))
+        ref_obs, ref_reward, ref_terminated, _, _ = ref.step(action)
+        assert np.allclose(obs, ref_obs, atol=1e-4)
+        assert reward == ref_reward and terminated == ref_terminated
+
+# finished envs report their final obs as next obs and restart from a reset obs
+worker_num = 16
+venv = JaxVectorizedEnv("CartPole-v1", worker_num)
+step_fn = jax.jit(venv.step_fn)
+state, obs = venv.reset_fn(jax.random.PRNGKey(0))
+key = jax.random.PRNGKey(1)
+ep_len = np.zeros(worker_num, dtype=np.int32)
+ended = 0
+for t in range(600):
+    key, step_key = jax.random.split(key)
+    state, obs, next_obs, rewards, terminateds, truncateds = jax.device_get(
+        step_fn(state, np.ones(worker_num, dtype=np.int32) * (t % 2), step_key)
+    )
+    ep_len += 1
+    dones = terminateds | truncateds
+    assert not np.any(terminateds & truncateds)
+    assert np.array_equal(obs[~dones], next_obs[~dones])
+    assert np.all(np.abs(obs[dones]) <= 0.05)
+    assert np.all(truncateds == (ep_len == 500))
+    ended += np.sum(dones)
+    ep_len[dones] = 0
+assert ended > worker_num
+
+# the python API returns the same layout as the other vectorized envs
+obs = venv.current_obs()
+venv.step(np.zeros((worker_num, 1), dtype=np.int32))
+next_obs, final_obs, done_idx, rewards, terminateds, truncateds, infos = venv.get_result()
+assert obs.shape == next_obs.shape == (worker_num, 4) and len(infos) == worker_num
+assert np.array_equal(venv.current_obs(), next_obs) and len(final_obs) == np.sum(done_idx)
+assert np.all(rewards == 1.0)
+
+# the jitted learn loop acts with the params of act_params, for FQF with its fraction proposal
+env_builder, env_info = get_env_builder("CartPole-v1", vec_env="jax")
+for agent_class, builder_maker in [(DQN, model_builder_maker), (FQF, fqf_model_builder_maker)]:
+    agent = agent_class(
+        env_builder,
+        model_builder_maker=builder_maker,
+        num_workers=8,
+        learning_starts=64,
+        policy_kwargs={"node": 32, "hidden_n": 1},
+    )
+    agent.logger_run = None
+    agent.eval = lambda steps: None
+    agent.exploration = LinearSchedule(512, 0.02, 1.0)
+    agent.eval_freq = 256
+    agent.learn_JaxEnv(trange(0, 512, 8, disable=True))
+    assert agent.train_steps_count > 0 and len(agent.replay_buffer) == 512
+print("jax envs : OK")
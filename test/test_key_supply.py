@@ -0,0 +1,23 @@
+import jax
+import numpy as np
+
+from jax_baselines.common.utils import KeySupply, key_gen
+
+# the keys are handed out chunk by chunk, all different and the same for the same seed
+key_seq = key_gen(0, chunk_size=16)
+keys = np.stack([next(key_seq) for _ in range(50)])
+assert keys.shape == (50, 2) and keys.dtype == np.uint32
+assert len(np.unique(keys, axis=0)) == 50
+again = KeySupply(0, 16)
+assert np.array_equal(np.stack([next(again) for _ in range(50)]), keys)
+assert not np.array_equal(next(KeySupply(1, 16)), keys[0])
+
+# the chunk size only changes how many keys are split at a time
+assert len(np.unique(np.stack([next(key_seq) for _ in range(100)]), axis=0)) == 100
+
+# the keys are taken by jax.random and by the jitted functions
+assert jax.random.normal(keys[0], (3,)).shape == (3,)
+assert not np.array_equal(jax.random.normal(keys[0], (3,)), jax.random.normal(keys[1], (3,)))
+sample = jax.jit(lambda key: jax.random.uniform(key, (2,)))
+assert np.array_equal(sample(keys[2]), sample(jax.numpy.asarray(keys[2])))
+print("key supply : OK")
@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+import numpy as np
+
+from jax_baselines.common.memmap_buffers import MemmapReplayBuffer, PrioritizedMemmapReplayBuffer
+
+size = 500
+worker_size = 4
+rng = np.random.default_rng(0)
+tmp_dir = tempfile.TemporaryDirectory()
+memmap_dir = tmp_dir.name
+
+rb = MemmapReplayBuffer(size, [[84, 84, 4], [3]], 1, worker_size, memmap_dir=memmap_dir)
+prb = PrioritizedMemmapReplayBuffer(
+    size, [[84, 84, 4], [3]], 0.6, 1, worker_size, memmap_dir=memmap_dir
+)
+assert isinstance(rb.buffer["obs0"], np.memmap) and not isinstance(rb.buffer["obs1"], np.memmap)
+
+# the frame encodes the step, so a sampled row can be checked against its other columns
+for t in range(200):
+    step = t * worker_size + np.arange(worker_size)
+    obs = [
+        np.broadcast_to((step % 256)[:, None, None, None], (worker_size, 84, 84, 4)),
+        rng.normal(size=(worker_size, 3)),
+    ]
+    nxtobs = [
+        np.broadcast_to(((step + 1) % 256)[:, None, None, None], (worker_size, 84, 84, 4)),
+        rng.normal(size=(worker_size, 3)),
+    ]
+    action = step[:, None] % 6
+    reward = step.astype(np.float32)
+    terminated = step % 7 == 0
+    rb.add(obs, action, reward, nxtobs, terminated)
+    prb.add(obs, action, reward, nxtobs, terminated)
+
+assert len(rb) == size and len(prb) == size
+for buffer in [rb, prb]:
+    data = buffer.sample(64)
+    step = data["rewards"][:, 0].astype(np.int64)
+    assert step.min() >= 800 - size
+    assert np.all(data["obses"][0][:, 0, 0, 0] == step % 256)
+    assert np.all(data["nxtobses"][0][:, 40, 40, 3] == (step + 1) % 256)
+    assert np.all(data["actions"][:, 0] == step % 6)
+    assert np.all(data["terminateds"][:, 0] == (step % 7 == 0))
+
+# a transition with a large priority dominates the sampled batch
+data = prb.sample(64, 0.4)
+assert np.all(np.diff(data["indexes"]) >= 0)
+prb.update_priorities(np.arange(size), np.full(size, 1e-3))
+prb.update_priorities(np.array([17]), np.array([1e4]))
+data = prb.sample(64, 0.4)
+assert np.mean(data["indexes"] == 17) > 0.9
+assert data["weights"].max() <= 1.0
+
+# the files of a buffer are removed by close, and when the buffer is collected
+files_dir = rb.memmap_dir
+rb.close()
+assert not os.path.exists(files_dir)
+files_dir = MemmapReplayBuffer(size, [[84, 84, 4]], memmap_dir=memmap_dir).memmap_dir
+assert not os.path.exists(files_dir)
+prb.close()
+tmp_dir.cleanup()
+print("memmap replay buffers : OK")
@@ -0,0 +1,71 @@
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import NstepReplayBuffer
+
+n = 4
+gamma = 0.99
+worker_size = 3
+steps = 300
+rng = np.random.default_rng(0)
+
+
+def flush(expected, episode, terminated, final=True):
+    last = len(episode) if final else len(episode) - n + 1
+    for i in range(max(last, 0)):
+        window = episode[i : i + n]
+        ret = sum(gamma**k * r for k, (_, _, r, _) in enumerate(window))
+        done = terminated and i + n >= len(episode)
+        expected.append((window[0][0], window[0][1], ret, window[-1][3], done))
+
+
+def row(obs, action, reward, next_obs, done):
+    return np.concatenate([obs, action, [reward], next_obs, [done]]).astype(np.float64)
+
+
+# every worker stepped together, and a random subset of the workers stepped at each add as
+# with asynchronous vectorized envs
+for partial in [False, True]:
+    mrb = NstepReplayBuffer(1000, [[4]], 1, worker_size, n_step=n, gamma=gamma)
+
+    # plain python reference n-step returns, one episode list per worker
+    episodes = [[] for _ in range(worker_size)]
+    expected = []
+
+    for t in range(steps):
+        workers = np.arange(worker_size)
+        if partial:
+            workers = np.sort(rng.permutation(worker_size)[: rng.integers(1, worker_size + 1)])
+        size = len(workers)
+        obs = rng.normal(size=(size, 4)).astype(np.float32)
+        action = rng.integers(0, 4, size=(size, 1))
+        reward = rng.normal(size=(size,)).astype(np.float32)
+        next_obs = rng.normal(size=(size, 4)).astype(np.float32)
+        terminated = rng.random(size) < 0.05
+        truncated = np.logical_and(rng.random(size) < 0.05, ~terminated)
+        mrb.add(
+            [obs], action, reward, [next_obs], terminated, truncated, workers if partial else None
+        )
+        for i, w in enumerate(workers):
+            episodes[w].append((obs[i], action[i], reward[i], next_obs[i]))
+            if terminated[i] or truncated[i]:
+                flush(expected, episodes[w], terminated[i])
+                episodes[w] = []
+    for w in range(worker_size):
+        flush(expected, episodes[w], False, final=False)
+
+    expected_rows = np.stack(sorted((row(*e) for e in expected), key=tuple))
+    got = mrb.get_buffer()
+    got_rows = np.stack(
+        sorted(
+            (
+                row(g_obs, g_act, g_rew[0], g_next, g_done[0])
+                for g_obs, g_act, g_rew, g_next, g_done in zip(
+                    got["obs0"], got["action"], got["reward"], got["next_obs0"], got["done"]
+                )
+            ),
+            key=tuple,
+        )
+    )
+    assert expected_rows.shape == got_rows.shape, "number of n-step transitions differs"
+    assert np.allclose(expected_rows, got_rows, atol=1e-4), "n-step transitions differ"
+    print(f"{len(got_rows)} n-step transitions match the reference : OK")
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.common.pipeline import LockedReplayBuffer, ParamsChannel, PipelineLearner
+from jax_baselines.common.schedules import LinearSchedule
+from jax_baselines.DQN.dqn import DQN
+from jax_baselines.FQF.fqf import FQF
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+from model_builder.flax.qnet.fqf_builder import model_builder_maker as fqf_model_builder_maker
+
+if __name__ == "__main__":
+    # the subprocess env workers import this script
+    # a publish replaces the version and the params together
+    channel = ParamsChannel({"w": 0})
+    channel.publish({"w": 1}, 3)
+    assert channel.latest() == (3, {"w": 1})
+
+    # the learner trains off the main thread at the replay ratio, and holds the actor back beyond
+    # max_policy_lag
+    calls = []
+    params = {"version": 0}
+
+    def train_fn(last_steps, steps, updates):
+        assert threading.current_thread() is not threading.main_thread()
+        time.sleep(0.002)
+        calls.append((last_steps, steps, updates))
+        params["version"] += updates
+
+    learner = PipelineLearner(train_fn, lambda: dict(params), 0.5, 100, 4, max_policy_lag=8)
+    for steps in range(0, 1000, 8):
+        policy_lag, published = learner.collected(steps)
+        assert policy_lag <= 8
+        assert published["version"] <= learner.target_updates(steps)
+    learner.close()
+    assert all(updates == 4 for _, _, updates in calls)
+    assert sum(updates for _, _, updates in calls) >= learner.target_updates(992) - 8
+    assert all(last_steps <= steps for last_steps, steps, _ in calls)
+    assert calls[0][1] > 100, "trains after learning_starts"
+
+    # an error of the learner is raised on the actor
+    def fail(last_steps, steps, updates):
+        raise RuntimeError("learner failed")
+
+    learner = PipelineLearner(fail, lambda: {}, 1.0, 0, 1, max_policy_lag=1)
+    try:
+        for steps in range(100):
+            learner.collected(steps)
+        raise AssertionError("the learner error is not raised")
+    except RuntimeError as e:
+        assert str(e) == "learner failed"
+
+    # the replay snapshots are taken under the lock of the actor and the learner
+    class SnapshotBuffer(object):
+        def snapshot(self):
+            assert locked.lock.locked()
+            return {}, {}
+
+        def save_replay(self, path, compress=False, background=True):
+            assert locked.lock.locked()
+            return None
+
+    locked = LockedReplayBuffer(SnapshotBuffer())
+    assert locked.snapshot() == ({}, {})
+    assert locked.save_replay("replay") is None and not locked.lock.locked()
+
+    # the pipelined DQN keeps the updates at the replay ratio of the collected env steps
+    worker_size = 4
+    env_builder, env_info = get_env_builder("CartPole-v1", vec_env="subproc")
+    agent = DQN(
+        env_builder,
+        model_builder_maker=model_builder_maker,
+        num_workers=worker_size,
+        learning_starts=200,
+        policy_kwargs={"node": 32, "hidden_n": 1},
+        replay_ratio=0.5,
+        pipeline=True,
+        max_policy_lag=4,
+    )
+    agent.logger_run = None
+    agent.eval = lambda steps: None
+    agent.exploration = LinearSchedule(1000, 0.02, 1.0)
+    agent.eval_freq = 10**6
+    agent.learn_Pipelined(range(0, 2000, worker_size))
+    assert agent.train_steps_count >= 0.5 * (1996 - 200) - 4
+    assert agent.train_steps_count <= 0.5 * (1996 - 200)
+    assert len(agent.replay_buffer) == 2000
+    assert len(agent.lossque) > 0
+    agent.env.close()
+
+    # the pipelined FQF actor acts on the fraction proposal network trained by the learner
+    agent = FQF(
+        env_builder,
+        model_builder_maker=fqf_model_builder_maker,
+        num_workers=worker_size,
+        learning_starts=200,
+        policy_kwargs={"node": 32, "hidden_n": 1},
+        replay_ratio=0.5,
+        pipeline=True,
+        max_policy_lag=4,
+    )
+    agent.logger_run = None
+    agent.eval = lambda steps: None
+    agent.exploration = LinearSchedule(1000, 0.02, 1.0)
+    agent.eval_freq = 10**6
+    initial_fqf_params = agent.fqf_params
+    acted_fqf_params = []
+    act = agent._act
+
+    def record_act(act_params, obses, key, epsilon):
+        acted_fqf_params.append(act_params[1])
+        return act(act_params, obses, key, epsilon)
+
+    agent._act = record_act
+    agent.learn_Pipelined(range(0, 2000, worker_size))
+    assert agent.fqf_params is not initial_fqf_params
+    assert acted_fqf_params[0] is initial_fqf_params
+    assert acted_fqf_params[-1] is not initial_fqf_params
+    agent.env.close()
+    print("pipeline : OK")
@@ -0,0 +1,59 @@
+import tempfile
+
+import jax
+import numpy as np
+
+from jax_baselines.common.memmap_buffers import MemmapReplayBuffer, PrioritizedMemmapReplayBuffer
+from jax_baselines.common.prefetch_buffers import PrefetchReplayBuffer
+
+size = 500
+tmp_dir = tempfile.TemporaryDirectory()
+memmap_dir = tmp_dir.name
+
+rb = PrefetchReplayBuffer(MemmapReplayBuffer(size, [[3]], 1, memmap_dir=memmap_dir), False, 32)
+prb = PrefetchReplayBuffer(
+    PrioritizedMemmapReplayBuffer(size, [[3]], 0.6, 1, memmap_dir=memmap_dir), True
+)
+
+for t in range(size):
+    obs = [np.full((1, 3), t, dtype=np.float32)]
+    nxtobs = [np.full((1, 3), t + 1, dtype=np.float32)]
+    rb.add(obs, np.array([[t % 6]]), np.array([t], dtype=np.float32), nxtobs, np.array([False]))
+    prb.add(obs, np.array([[t % 6]]), np.array([t], dtype=np.float32), nxtobs, np.array([False]))
+assert len(rb) == size and len(prb) == size
+
+# the first call samples in place, the next ones return the batch queued by the previous one
+for _ in range(5):
+    data = rb.sample(32)
+    assert isinstance(data["obses"][0], jax.Array)
+    step = np.asarray(data["rewards"])[:, 0]
+    assert np.all(np.asarray(data["obses"][0])[:, 0] == step)
+    assert np.all(np.asarray(data["nxtobses"][0])[:, 0] == step + 1)
+assert len(rb.futures) == 1
+
+# with prioritized replay the next batch is only queued after the priorities are written
+data = prb.sample(32, 0.4)
+assert prb.futures == [] and isinstance(data["indexes"], np.ndarray)
+prb.update_priorities(np.arange(size), np.full(size, 1e-3))
+prb.sample(32, 0.4)
+prb.update_priorities(np.array([17]), np.array([1e4]))
+data = prb.sample(32, 0.4)
+assert np.mean(data["indexes"] == 17) > 0.9
+
+stats = rb.stats()
+assert stats["replay/prefetch_sample_ms"] > 0 and rb.sample_count == 0
+
+# the queue holds chunks of batch_size rows, so a sample of a changing number of them, as the
+# fused updates of a replay ratio draw, only samples in place the chunks missing from the queue
+rb.sample(96)
+rb.sample(64)
+data = rb.sample(64)
+step = np.asarray(data["rewards"])[:, 0]
+assert len(step) == 64 and np.all(np.asarray(data["obses"][0])[:, 0] == step)
+assert rb.stats()["replay/prefetch_missed_chunks"] == 2 / 3
+
+# the snapshots are taken under the lock of the prefetch thread
+rb.replay_buffer.snapshot = lambda: rb.lock.locked()
+assert rb.snapshot()
+tmp_dir.cleanup()
+print("prefetch replay buffers : OK")
@@ -0,0 +1,72 @@
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.DQN.dqn import DQN
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+worker_size = 8
+
+env_builder, env_info = get_env_builder("CartPole-v1")
+
+
+def make_agent(**kwargs):
+    return DQN(
+        env_builder,
+        model_builder_maker=model_builder_maker,
+        learning_starts=100,
+        log_interval=200,
+        policy_kwargs={"node": 32, "hidden_n": 1},
+        **kwargs
+    )
+
+
+# without replay_ratio every worker runs gradient_steps updates on the train_freq steps
+agent = make_agent(gradient_steps=2, train_freq=16)
+assert agent.updates_per_step(96, worker_size) == 0, "before learning_starts"
+assert agent.updates_per_step(112, worker_size) == worker_size * 2
+assert agent.updates_per_step(120, worker_size) == 0
+
+# with replay_ratio the updates follow the env steps whatever the worker count
+for num_steps in [1, 3, worker_size]:
+    agent = make_agent(replay_ratio=0.25)
+    env_steps = 100 * num_steps
+    updates = sum(
+        agent.updates_per_step(steps, num_steps) for steps in range(101, 101 + env_steps, num_steps)
+    )
+    assert updates == env_steps * 0.25, (num_steps, updates)
+
+# the updates of a vectorized step are logged on the log_interval step inside it
+assert agent.train_log_step(192, 16) == 200
+assert agent.train_log_step(184, worker_size) == 184
+assert agent.train_log_step(200, worker_size) == 200
+assert agent.train_log_step(200, 1) == 200
+
+# a vectorized step of 32 workers runs its updates as one fused call, and every one of its
+# batches still spans the whole prioritized buffer
+agent = make_agent(prioritized_replay=True, batch_size=16, gradient_steps=1, train_freq=1)
+agent.logger_run = None
+for _ in range(10):
+    agent.replay_buffer.add(
+        [np.random.normal(size=(100, 4)).astype(np.float32)],
+        np.random.randint(2, size=(100, 1)),
+        np.random.normal(size=100),
+        [np.random.normal(size=(100, 4)).astype(np.float32)],
+        np.zeros(100),
+        np.zeros(100),
+    )
+written = []
+update_priorities = agent.replay_buffer.update_priorities
+
+
+def record_update_priorities(indexes, priorities):
+    written.append(np.copy(indexes))
+    update_priorities(indexes, priorities)
+
+
+agent.replay_buffer.update_priorities = record_update_priorities
+updates = agent.updates_per_step(1000, 32)
+agent.train_step(agent.train_log_step(1000, 32), updates)
+assert updates == 32 and len(written[-1]) == 32 * 16
+for batch_indexes in np.reshape(written[-1], (32, 16)):
+    assert np.ptp(batch_indexes) > 0.3 * len(agent.replay_buffer)
+print("replay ratio : OK")
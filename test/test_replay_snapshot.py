@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+import numpy as np
+
+from jax_baselines.common.cpprb_buffers import (
+    NstepReplayBuffer,
+    PrioritizedNstepReplayBuffer,
+    PrioritizedReplayBuffer,
+)
+from jax_baselines.common.env_builer import get_env_builder
+from jax_baselines.DQN.dqn import DQN
+from jax_baselines.SPR.efficent_buffer import PrioritizedTransitionReplayBuffer
+from model_builder.flax.qnet.dqn_builder import model_builder_maker
+
+size = 50
+worker_size = 4
+snapshot_dir = tempfile.mkdtemp()
+
+
+def fill(buffer, steps, worker_size):
+    for t in range(steps):
+        step = t * worker_size + np.arange(worker_size)
+        obs = [np.broadcast_to((step % 256)[:, None, None, None], (worker_size, 8, 8, 4))]
+        nxtobs = [np.broadcast_to(((step + 1) % 256)[:, None, None, None], (worker_size, 8, 8, 4))]
+        terminated = step % 13 == 0
+        truncated = np.zeros(worker_size, dtype=np.bool_)
+        buffer.add(obs, step[:, None] % 6, step.astype(np.float32), nxtobs, terminated, truncated)
+
+
+# the restored buffer holds the same transitions and priorities, oldest first, for every
+# buffer layout: plain, cpprb n-step, and n-step accumulated over several workers
+for name, make_buffer in [
+    ("nstep", lambda: NstepReplayBuffer(size, [[8, 8, 4]], 1, worker_size, 3, 0.9)),
+    ("per", lambda: PrioritizedReplayBuffer(size, [[8, 8, 4]], 0.6)),
+    ("per_nstep", lambda: PrioritizedNstepReplayBuffer(size, [[8, 8, 4]], 1, 1, 3, 0.9, 0.6)),
+]:
+    buffer = make_buffer()
+    if name == "nstep":
+        fill(buffer, 20, worker_size)
+    else:
+        fill(buffer, 80, 1)
+        buffer.update_priorities(np.arange(size), np.random.rand(size) + 0.1)
+        fill(buffer, 7, 1)
+    path = os.path.join(snapshot_dir, name)
+    buffer.save_replay(path, compress=True).join()
+    restored = make_buffer()
+    restored.load_replay(path)
+    arrays, _ = buffer.snapshot()
+    restored_arrays, _ = restored.snapshot()
+    assert len(restored) == len(buffer) == size
+    for k in arrays:
+        assert np.array_equal(arrays[k], restored_arrays[k]), (name, k)
+
+# an add writing a whole buffer gives all its transitions the max priority, from empty and
+# when it wraps back to the same next index
+buffer = PrioritizedReplayBuffer(size, [[3]], 0.6)
+rows = [np.zeros((size, 3), np.float32)]
+for _ in range(2):
+    buffer.add(rows, np.zeros((size, 1)), np.zeros(size, np.float32), rows, np.zeros(size, bool))
+    assert np.all(buffer.priorities == buffer.buffer.get_max_priority())
+    buffer.update_priorities(np.arange(size), np.full(size, 1e-3))
+
+# a large priority survives the snapshot
+buffer = PrioritizedReplayBuffer(size, [[3]], 0.6)
+for t in range(30):
+    obs = [np.full((1, 3), t, np.float32)]
+    buffer.add(obs, [[0]], float(t), obs, False)
+buffer.update_priorities(np.arange(30), np.full(30, 1e-3))
+buffer.update_priorities(np.array([17]), np.array([1e4]))
+buffer.save_replay(os.path.join(snapshot_dir, "large"), background=False)
+restored = PrioritizedReplayBuffer(size, [[3]], 0.6)
+restored.load_replay(os.path.join(snapshot_dir, "large"))
+assert np.mean(restored.sample(64, 0.4)["rewards"][:, 0] == 17) > 0.9
+
+# the SPR buffer keeps its rows, write pointer and sum tree, and starts a new episode
+buffer = PrioritizedTransitionReplayBuffer(64, [(4,)], 1, 5)
+for t in range(100):
+    buffer.add([np.full((1, 4), t)], t % 3, float(t), [np.full((1, 4), t + 1)], t % 17 == 16)
+buffer.update_priorities(buffer.tree.leaf_offset + np.arange(10), np.random.rand(10))
+buffer.save_replay(os.path.join(snapshot_dir, "spr")).join()
+restored = PrioritizedTransitionReplayBuffer(64, [(4,)], 1, 5)
+restored.load_replay(os.path.join(snapshot_dir, "spr"))
+assert np.array_equal(buffer.tree.tree, restored.tree.tree)
+assert restored.buffer._idx == buffer.buffer._idx + 1
+assert restored.buffer.ep_idx == buffer.buffer.ep_idx + 1
+
+# an agent checks its buffer when the snapshots are set, not at the first evaluation
+env_builder, env_info = get_env_builder("CartPole-v1")
+for kwargs, supported in [
+    ({"prefetch": True}, True),
+    ({"device_replay": True}, False),
+    ({"memmap_dir": snapshot_dir}, False),
+]:
+    agent = DQN(
+        env_builder,
+        model_builder_maker=model_builder_maker,
+        policy_kwargs={"node": 32, "hidden_n": 1},
+        **kwargs
+    )
+    try:
+        agent.set_replay_snapshot(os.path.join(snapshot_dir, "agent"))
+        assert supported, kwargs
+    except ValueError as e:
+        assert not supported and "does not support replay snapshots" in str(e), kwargs
+print("replay snapshots : OK")
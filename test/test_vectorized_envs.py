@@ -0,0 +1,85 @@
+import numpy as np
+
+from jax_baselines.common.env_builer import get_env_builder
+
+if __name__ == "__main__":
+    # the subprocess env workers import this script
+    worker_size = 5
+
+    # the shared-memory subprocess env, ray actors stepping one or several envs each, and the
+    # gymnasium vector envs
+    for vec_env, envs_per_worker in [
+        ("subproc", 1),
+        ("ray", 1),
+        ("ray", 2),
+        ("gym_sync", 1),
+        ("gym_async", 1),
+    ]:
+        env_builder, env_info = get_env_builder(
+            "CartPole-v1", vec_env=vec_env, envs_per_worker=envs_per_worker
+        )
+        env = env_builder(worker_size)
+        assert env.get_info()["observation_space"].shape == (4,)
+        assert env.current_obs().shape == (worker_size, 4)
+
+        dones = 0
+        for _ in range(300):
+            obs = env.current_obs()
+            obs_copy = np.copy(obs)
+            env.step(np.random.randint(2, size=(worker_size, 1)))
+            (
+                next_obses,
+                final_obses,
+                done_idx,
+                rewards,
+                terminateds,
+                truncateds,
+                infos,
+            ) = env.get_result()
+            # the obs passed to step is not overwritten by it
+            assert np.array_equal(obs, obs_copy)
+            assert next_obses.shape == (worker_size, 4) and rewards.shape == (worker_size,)
+            assert len(infos) == worker_size
+            done = terminateds | truncateds
+            assert np.array_equal(done_idx, done) and final_obses.shape == (np.sum(done), 4)
+            # the workers continue from the next obs, a reset for the finished ones, whose last obs
+            # are returned apart
+            assert np.array_equal(env.current_obs(), next_obses)
+            if np.any(done):
+                assert np.all(np.abs(next_obses[done]) <= 0.05)
+                assert not np.array_equal(final_obses, next_obses[done])
+            dones += np.sum(done)
+        assert dones > 0
+        env.close()
+
+    # asynchronous stepping returns the first finished workers, with the obs and actions they were
+    # stepped with
+    env_builder, env_info = get_env_builder("CartPole-v1", async_workers=2)
+    env = env_builder(worker_size)
+    given_obs = np.zeros((worker_size, 4))
+    given_actions = np.zeros((worker_size, 1), dtype=np.int64)
+    returned = np.zeros(worker_size)
+    for _ in range(300):
+        obs = env.current_obs()
+        actions = np.random.randint(2, size=(len(obs), 1))
+        given_obs[env.env_ids] = obs
+        given_actions[env.env_ids] = actions
+        env.step(actions)
+        (
+            next_obses,
+            final_obses,
+            done_idx,
+            rewards,
+            terminateds,
+            truncateds,
+            infos,
+        ) = env.get_result()
+        assert len(env.env_ids) == len(next_obses) == len(rewards) == len(infos) == 2
+        assert np.array_equal(env.result_obs, given_obs[env.env_ids])
+        assert np.array_equal(env.result_actions, given_actions[env.env_ids])
+        assert len(final_obses) == np.sum(done_idx)
+        assert np.array_equal(env.current_obs(), next_obses)
+        returned[env.env_ids] += 1
+    assert np.all(returned > 0)
+    env.close()
+    print("vectorized envs : OK")